@@ -81,8 +81,14 @@ from flask_login import LoginManager
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 
-from .caching import CacheInstance
+from .caching import CacheInstance, DataGenerations, RangeCache, RowCounts
 global_cache = CacheInstance()  # create cache instance here.
+range_cache = RangeCache()  # results of spot record range queries.
+data_generations = DataGenerations()  # etags of api responses.
+row_counts = RowCounts(groups={  # totals of paged apis.
+    'spot': ('project_id',),
+    'device': ('spot_id',),
+    'spot_record': ('device_id',)})
 
 if db is not None:
     # Scheduler depends on db.
@@ -104,12 +110,20 @@ def create_app(config_name: str, with_scheduler: bool = True) -> Flask:
     moment.init_app(app)
     db.init_app(app)
     login_manager.init_app(app)
+    start = None
     if with_scheduler:
         scheduler.init_app(app)
-        scheduler.start()
+        start = scheduler.start
 
     if app.config['SHISANWU_CACHE_ON']:
-        global_cache.init_app(app)  # cache database.
+        # cache database in background, the scheduler only writes once
+        # the cache is ready, or its writes would miss the cache.
+        global_cache.init_app(app, then=start)
+    elif start is not None:
+        start()
+    range_cache.init_app(app, db.session)
+    data_generations.init_app(app, db.session)
+    row_counts.init_app(app, db.session)
 
     # register blue_prints
     from .api import api as api_blueprint
@@ -5,3 +5,4 @@ api = Blueprint('api', __name__)
 from . import db_views, db_paged, db_changed, db_filter
 from . import logout, db_realtime
 from . import errors, login, spot_records, users
+from . import compression
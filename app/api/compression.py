@@ -0,0 +1,92 @@
+"""
+gzip responses of the api.
+
+Project lists, base64 project pictures and record ranges are large and
+compress well. Responses over MIN_BYTES are gzipped if the client
+accepts it, streamed responses are compressed chunk by chunk so rows
+still arrive as they are written.
+
+Responses with an ETag (see etag.py) are polled and mostly the same
+bytes from one hit to the next. Their compressed body is kept by a
+digest of the body and reused instead of being compressed again. It's
+not keyed by the ETag, which stays the same for a while after another
+worker changed the data while the body does not.
+"""
+import gzip
+import zlib
+from hashlib import blake2b
+from typing import Iterable, Iterator
+
+from flask import Response, request
+
+from app.caching.caching import _TinyLFUDictionary
+
+from . import api
+from .binary_series import SERIES
+from .streaming import NDJSON
+
+# smaller responses are sent as is.
+MIN_BYTES = 1024
+
+LEVEL = 6
+
+COMPRESSIBLE = ('application/json', NDJSON, SERIES)
+
+# compressed bodies by digest of the body.
+_compressed: _TinyLFUDictionary = _TinyLFUDictionary(
+    maxsize=512, max_bytes=32 * 1024 ** 2, stripes=4, sizeof=len)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = LEVEL
+                ) -> Iterator[bytes]:
+    """ gzip chunks, each one is flushed to the client right away """
+    z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = z.compress(chunk) + z.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield z.flush()
+
+
+def gzip_body(data: bytes, reuse: bool = False) -> bytes:
+    """ gzip data, kept for the next body with the same bytes if reuse """
+    if not reuse:
+        return gzip.compress(data, LEVEL)
+    key = blake2b(data, digest_size=16).digest()
+    compressed = _compressed.get(key)
+    if compressed is None:
+        compressed = _compressed[key] = gzip.compress(data, LEVEL)
+    return compressed
+
+
+def _compressible(response: Response) -> bool:
+    return (response.status_code == 200
+            and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers
+            and (response.mimetype in COMPRESSIBLE
+                 or response.mimetype.startswith('text/')))
+
+
+@api.after_request
+def compress(response: Response) -> Response:
+    if not _compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings.best_match(['gzip']) != 'gzip':
+        return response
+
+    if response.is_streamed:
+        response.response = gzip_stream(response.iter_encoded())
+        response.headers.pop('Content-Length', None)
+    else:
+        size = response.content_length
+        if size is None:
+            size = len(response.get_data())
+        if size < MIN_BYTES:
+            return response
+
+        tag, _ = response.get_etag()
+        response.set_data(gzip_body(response.get_data(), reuse=bool(tag)))
+
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,74 @@
+"""
+Keyset pagination.
+
+OFFSET pages get slower the deeper they are, the database still walks
+all skipped rows. A cursor remembers the key of the last row sent and
+the next page starts right after it, so with an index on the keys every
+page costs the same.
+
+Cursors are opaque to clients, they should only be passed back as is.
+"""
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, desc, or_
+from flask_sqlalchemy import BaseQuery
+
+from app.models import SpotRecord
+
+Key = Tuple[datetime, int]
+
+
+def encode_cursor(key: Key) -> str:
+    time, ident = key
+    raw = f"{time.isoformat()}|{ident}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Key:
+    """ raise ValueError if the cursor is not made by encode_cursor """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        time, ident = raw.decode().split('|')
+        return datetime.fromisoformat(time), int(ident)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"bad cursor {cursor!r}") from e
+
+
+def is_page_size(size) -> bool:
+    """ a positive int, bool is an int too """
+    return isinstance(size, int) and not isinstance(size, bool) and size > 0
+
+
+def spot_record_page(query: BaseQuery,
+                     size: int,
+                     cursor: Optional[str] = None
+                     ) -> Tuple[List[SpotRecord], Optional[str]]:
+    """
+    records after cursor, newest first.
+    return (records, cursor of the next page or None on the last page).
+    raise ValueError if size is not positive or the cursor is bad.
+    """
+    if not is_page_size(size):
+        raise ValueError(f"bad page size {size!r}")
+    if cursor is not None:
+        time, ident = decode_cursor(cursor)
+        query = query.filter(or_(
+            SpotRecord.spot_record_time < time,
+            and_(SpotRecord.spot_record_time == time,
+                 SpotRecord.spot_record_id < ident)))
+
+    records = (query
+               .order_by(desc(SpotRecord.spot_record_time),
+                         desc(SpotRecord.spot_record_id))
+               .limit(size + 1)
+               .all())
+
+    if len(records) <= size:
+        return records, None
+    records = records[:size]
+    last = records[-1]
+    return records, encode_cursor((last.spot_record_time,
+                                   last.spot_record_id))
+
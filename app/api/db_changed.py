@@ -21,6 +21,7 @@ from app.api_types import is_ApiRequest
 from app.modelOperations import ModelOperations
 from app.modelOperations import commit_db_operation
 from app.modelOperations import commit
+from app.caching.entries import from_entry
 from app.models import User
 from app.models import Location
 from app.models import Project
@@ -60,7 +61,8 @@ def add_update_delete_template(
             return response_object
 
         try:
-            posted = add(cast(Dict, post_data["request"]))
+            # adding an existing item returns its cache entry.
+            posted = from_entry(add(cast(Dict, post_data["request"])))
             if posted:
                 commit()
                 response_object["message"] = "post succeeded!"
@@ -4,6 +4,7 @@ from typing import NewType, Optional, TypedDict
 
 from flask import jsonify, request
 
+from app import range_cache
 from app.api_types import ApiRequest
 from app.api_types import ApiResponse
 from app.api_types import ReturnCode
@@ -27,6 +28,13 @@ from app.models import User
 from timeutils.time import str_to_datetime
 
 from . import api
+from .single_flight import coalesce
+from .binary_series import series_response, wants_series
+from .record_rows import SPOT_RECORD, spot_record_select
+from .record_rows import project, requested_columns
+from .record_rows import to_columns, wants_columns
+from .spot_records import spot_record_rows, stream_spot_records
+from .streaming import wants_stream
 
 Json = NewType('Json', str)
 
@@ -43,6 +51,7 @@ def project_filtered() -> Json:
 
 
 @api.route('/device/filter', methods=["POST"])
+@coalesce
 def device_filtered() -> Json:
     post_data = request.get_json()
 
@@ -86,6 +95,7 @@ def spot_filtered() -> Json:
 
 
 @api.route('/spotRecord/filter/<int:did>', methods=["POST"])
+@coalesce
 def sport_record_filtered(did: Optional[int]) -> Json:
     post_data = request.get_json()
 
@@ -97,21 +107,28 @@ def sport_record_filtered(did: Optional[int]) -> Json:
                        "endTime")
             (filter_request))
 
+        columns = requested_columns()
+        time = SPOT_RECORD.c.spot_record_time
+        query = (spot_record_select('device', did, columns)
+                 .where(time >= start)
+                 .where(time <= end))
+        if wants_series():
+            return series_response(query, columns)
+        if wants_stream():
+            return stream_spot_records(query, columns)
+
         response_object: ApiResponse = (
             ApiResponse(
                 status=ReturnCode.OK.value,
                 message=f"filted sport record {did}"))
 
-        filtered_res = (
-            SpotRecord
-            .query
-            .filter(SpotRecord.device_id == did)
-            .filter(SpotRecord.spot_record_time >= start)
-            .filter(SpotRecord.spot_record_time <= end))
+        filtered_res = range_cache.rows('device', did, start, end,
+                                        spot_record_rows('device', did))
 
         response_object['data'] = {
-            'data': [item.to_json() for item in filtered_res if item],
-            'totalElementCount': filtered_res.count(),
+            'data': (to_columns(filtered_res, columns) if wants_columns()
+                     else project(filtered_res, columns)),
+            'totalElementCount': len(filtered_res),
         }
 
     else:
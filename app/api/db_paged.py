@@ -13,10 +13,17 @@ from operator import itemgetter
 from flask import jsonify, request
 from sqlalchemy import desc
 from . import api
+from .single_flight import coalesce
+from .totals import device_record_total, device_total, page_items
+from .totals import project_total, spot_total
+from .cursor import is_page_size, spot_record_page
+from .projection import requested_fields
+from .serializers import planned, to_json_many
 from app.api_types import ApiResponse
 from app.api_types import ReturnCode
 from app.api_types import is_ApiRequest
 from app.api_types import PagingRequest
+from app.api_types import CursorPagingRequest
 from app.models import User
 from app.models import Location
 from app.models import Project
@@ -31,22 +38,24 @@ from app.models import SpotRecord, Device
 
 
 @api.route('/project', methods=['POST'])
+@coalesce
 def project_paged():
     """ Return a specific page of data"""
     post_data = request.get_json()
     if is_ApiRequest(post_data):
         paging_request: PagingRequest = post_data['request']
         size, pageNo = itemgetter('size', 'pageNo')(paging_request)
+        fields = requested_fields()
 
         response_object: ApiResponse = (
             ApiResponse(
                 status=ReturnCode.OK.value,
                 message=f"get project page {pageNo}"))
 
-        projects_page = Project.query.paginate(pageNo, size)
+        projects = page_items(planned(Project, fields=fields), pageNo, size)
         response_object['data'] = {
-            'data': [item.to_json() for item in projects_page.items if item],
-            'totalElementCount': projects_page.total,
+            'data': to_json_many(projects, fields),
+            'totalElementCount': project_total(),
             'currentPage': pageNo,
             'pageSize': size
         }
@@ -62,6 +71,7 @@ def project_paged():
 
 @api.route('/project/<pid>/spot', methods=['POST'])
 @api.route('/spot', methods=['POST'])
+@coalesce
 def spot_paged(pid: Optional[int] = None):
     """
     Either return paged spot data or paged spot data under
@@ -71,6 +81,7 @@ def spot_paged(pid: Optional[int] = None):
     if is_ApiRequest(post_data):
         paging_request: PagingRequest = post_data['request']
         size, pageNo = itemgetter('size', 'pageNo')(paging_request)
+        fields = requested_fields()
 
         response_object: ApiResponse = (
             ApiResponse(
@@ -78,16 +89,15 @@ def spot_paged(pid: Optional[int] = None):
                 message=f"get spot page {pageNo}"))
 
         if pid is None:
-            spots_page = Spot.query.paginate(pageNo, size)
+            spots = page_items(planned(Spot, fields=fields), pageNo, size)
         else:
-            spots_page = (
-                Spot
-                .query
-                .filter_by(project_id=pid).paginate(pageNo, size))
+            spots = page_items(
+                planned(Spot, fields=fields)
+                .filter_by(project_id=pid), pageNo, size)
 
         response_object['data'] = {
-            'data': [item.to_json() for item in spots_page.items if item],
-            'totalElementCount': spots_page.total,
+            'data': to_json_many(spots, fields),
+            'totalElementCount': spot_total(pid),
             'currentPage': pageNo,
             'pageSize': size
         }
@@ -103,6 +113,7 @@ def spot_paged(pid: Optional[int] = None):
 
 @api.route('/spot/<sid>/device', methods=['POST'])
 @api.route('/device', methods=['POST'])
+@coalesce
 def device_paged(sid: Optional[int] = None):
     """ Return a specific page of data"""
     post_data = request.get_json()
@@ -110,6 +121,7 @@ def device_paged(sid: Optional[int] = None):
     if is_ApiRequest(post_data):
         paging_request: PagingRequest = post_data['request']
         size, pageNo = itemgetter('size', 'pageNo')(paging_request)
+        fields = requested_fields()
 
         response_object: ApiResponse = (
             ApiResponse(
@@ -117,14 +129,16 @@ def device_paged(sid: Optional[int] = None):
                 message=f"get device page {pageNo}"))
 
         if sid is None:
-            devices_page = Device.query.paginate(pageNo, size)
+            devices = page_items(planned(Device, fields=fields),
+                                 pageNo, size)
         else:
-            devices_page = Device.query.filter_by(
-                spot_id=sid).paginate(pageNo, size)
+            devices = page_items(
+                planned(Device, fields=fields)
+                .filter_by(spot_id=sid), pageNo, size)
 
         response_object['data'] = {
-            'data': [item.to_json() for item in devices_page.items if item],
-            'totalElementCount': devices_page.total,
+            'data': to_json_many(devices, fields),
+            'totalElementCount': device_total(sid),
             'currentPage': pageNo,
             'pageSize': size
         }
@@ -138,46 +152,97 @@ def device_paged(sid: Optional[int] = None):
 
 
 @api.route('/device/<did>/spot_record', methods=['POST'])
+@coalesce
 def spot_record_paged(did: int):
-    """ Return a specific page of data"""
+    """
+    Return a page of records of a device, newest first.
+    With `cursor` in the request pages are fetched by keyset, pass
+    nextCursor back for the next page. pageNo alone is kept for old
+    clients.
+    """
     post_data = request.get_json()
-    if is_ApiRequest(post_data):
-        paging_request: PagingRequest = post_data['request']
-        size, pageNo = itemgetter('size', 'pageNo')(paging_request)
-
-        response_object: ApiResponse = (
+    if not is_ApiRequest(post_data):
+        return jsonify(
             ApiResponse(
-                status=ReturnCode.OK.value,
-                message=f"get spot_record page {pageNo}"))
+                status=ReturnCode.BAD_REQUEST.value,
+                message="bad request format"))
 
-        # never send all records
-        if pageNo * size > SpotRecord.query.filter_by(device_id=did).count():
-            response_object['status'] = ReturnCode.NO_DATA.value
-            response_object['message'] = f"query out of range for device {did}"
-        else:
-            spot_records_page = (
-                SpotRecord.query
-                .filter_by(
-                    device_id=did)
-                .order_by(desc(SpotRecord.spot_record_time))
-                .paginate(pageNo, size))
-            response_object['data'] = {
-                'data': [
-                    item.to_json()
-                    for item in spot_records_page.items if item],
-                'totalElementCount': spot_records_page.total,
-                'currentPage': pageNo,
-                'pageSize': size}
+    paging_request: CursorPagingRequest = post_data['request']
+    if 'cursor' in paging_request:
+        return jsonify(_spot_record_keyset_page(int(did), paging_request))
 
+    size, pageNo = itemgetter('size', 'pageNo')(paging_request)
+    response_object: ApiResponse = (
+        ApiResponse(
+            status=ReturnCode.OK.value,
+            message=f"get spot_record page {pageNo}"))
+
+    # never send all records
+    total, estimated = device_record_total(
+        int(did), paging_request.get('estimate', False))
+    # an estimate can be off either way, only an empty page tells.
+    fields = requested_fields()
+    spot_records = []
+    if estimated or pageNo * size <= total:
+        # the count is known, paginate would count again.
+        spot_records = (
+            planned(SpotRecord, fields=fields)
+            .filter_by(
+                device_id=did)
+            .order_by(desc(SpotRecord.spot_record_time))
+            .offset((pageNo - 1) * size)
+            .limit(size)
+            .all())
+
+    if not spot_records:
+        response_object['status'] = ReturnCode.NO_DATA.value
+        response_object['message'] = f"query out of range for device {did}"
     else:
-        response_object = (
-            ApiResponse(
-                status=ReturnCode.BAD_REQUEST.value,
-                message="bad request format"))
+        response_object['data'] = {
+            'data': to_json_many(spot_records, fields),
+            'totalElementCount': total,
+            'totalEstimated': estimated,
+            'currentPage': pageNo,
+            'pageSize': size}
 
     return jsonify(response_object)
 
 
+def _spot_record_keyset_page(did: int,
+                             paging_request: CursorPagingRequest
+                             ) -> ApiResponse:
+    size = paging_request.get('size')
+    if not is_page_size(size):
+        return ApiResponse(status=ReturnCode.BAD_REQUEST.value,
+                           message="size must be a positive integer")
+    cursor = paging_request.get('cursor')
+    fields = requested_fields()
+    # the next cursor is made of the last record's time.
+    query = planned(SpotRecord,
+                    fields=fields and [*fields, 'spot_record_time'])
+    try:
+        records, next_cursor = spot_record_page(
+            query.filter_by(device_id=did), size, cursor)
+    except ValueError:
+        return ApiResponse(status=ReturnCode.BAD_REQUEST.value,
+                           message="bad cursor")
+
+    response_object: ApiResponse = (
+        ApiResponse(
+            status=ReturnCode.OK.value,
+            message=f"get spot_record page after {cursor}"))
+    response_object['data'] = {
+        'data': to_json_many(records, fields),
+        'nextCursor': next_cursor,
+        'pageSize': size}
+    if paging_request.get('total'):
+        total, estimated = device_record_total(
+            did, paging_request.get('estimate', False))
+        response_object['data']['totalElementCount'] = total
+        response_object['data']['totalEstimated'] = estimated
+    return response_object
+
+
 # might be useful later.
 # append outdoor records
 # TODO 2020-01-09
@@ -7,6 +7,9 @@ from typing import Callable, Generator, List, NewType, Union
 from flask import Response, jsonify, request
 
 from app.api import api
+from app.api.serializers import planned, to_json_many
+from app.api.etag import etag
+from app.api.single_flight import coalesce
 from app.api_types import ApiResponse, ReturnCode
 from app.models import Device, SpotRecord
 from app.modelOperations import ModelOperations
@@ -15,25 +18,27 @@ Json = NewType('Json', str)
 
 
 @api.route('/realtime/devices', methods=["GET"])
+@etag(('device', 'spot', 'project'))
+@coalesce
 def realtime_device() -> Json:
     """
     return list of device that are online.
     """
     online_devices = (
-        Device
-        .query
+        planned(Device)
         .filter(Device.online))
 
     response_object = (
         ApiResponse(status=ReturnCode.OK.value,
                     message="data fetched",
-                    data=[device.to_json() for device in online_devices]))
+                    data=to_json_many(online_devices)))
 
     return jsonify(response_object)
 
 
 @api.route('/realtime/device/<int:did>/spot_records',
            methods=["GET"])
+@coalesce
 def realtime_spot_record(did: int) -> Union[Response, Json]:
     """ Fetch the newest data for the last 5 minute. """
     ...
@@ -3,17 +3,25 @@ Provide joined table search.
 Basic db query will be aggregated here and dispatched to frontend components.
 Idempotent operations.
 """
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
 from datetime import timedelta, datetime
 from flask import jsonify
 from . import api
+from .etag import device_record_categories, etag
+from .serializers import planned, to_json_many
+from .single_flight import coalesce
+from .streaming import YIELD_PER, wants_stream
+from .streaming import json_array_response, ndjson_response
+from app import db
 from app.api_types import ApiResponse, ReturnCode
 from app.models import Project, ProjectDetail
-from app.models import ClimateArea, OutdoorRecord
+from app.models import ClimateArea, OutdoorRecord, OutdoorSpot
 from app.models import Spot, SpotRecord, Device
-from sqlalchemy import and_
+from sqlalchemy import and_, func
 from sqlalchemy.exc import IntegrityError
 
+dhour = timedelta(hours=1)
+
 #############
 #  Generic  #
 #############
@@ -26,6 +34,8 @@ def test():
 
 # Query all data from the databse. Bad performance.
 @api.route('/project/all', methods=['GET'])
+@etag(('project', 'location', 'company', 'outdoor_spot', 'climate_area'))
+@coalesce
 def project_view():
     """ project, companies, and climate_area """
 
@@ -34,13 +44,15 @@ def project_view():
                     message='project added successfully'))
 
     # post successful or get. resend the updated reponse.
-    projects = [p.to_json() for p in Project.query.all() if p]
+    projects = to_json_many(planned(Project))
     response_object["data"] = projects
 
     return jsonify(response_object)
 
 
 @api.route('/project/<pid>/spots', methods=["GET"])
+@etag(('spot', 'project', 'device'))
+@coalesce
 def spot_view(pid: int):
     """Spot, Location, Project, OutdoorSpot"""
 
@@ -49,70 +61,97 @@ def spot_view(pid: int):
         'message': 'got spot successfully',
     }
 
-    spots: List[Dict] = [
-        s.to_json() for s in
-        Spot.query
-        .filter_by(project_id=pid)
-        .all() if s]
+    spots: List[Dict] = to_json_many(
+        planned(Spot)
+        .filter_by(project_id=pid))
 
     response_object["data"] = spots
     return jsonify(response_object)
 
 
-@api.route('/device/<did>/records', methods=['GET'])
-def spot_record_view(did: int):
-    """ combine spot record and outdoor records """
-    response_object: ApiResponse = (
-        ApiResponse(
-            status=ReturnCode.OK.value,
-            message="successfully get spot records",
-            data=[]))
-
-    records = []
-
-    for spot_rec in SpotRecord.query.filter_by(device_id=did):
+def _hour_of(time: datetime) -> datetime:
+    return time.replace(minute=0, second=0, microsecond=0)
 
-        # fetch relevent objects.
-        od_spot = Device.query.filter_by(
-            device_id=did).first().spot.project.outdoor_spot
 
-        spot_rec_hour: datetime = (
-            spot_rec
-            .spot_record_time
-            .replace(minute=0, second=0, microsecond=0))
+def _outdoor_spot_of(did: int) -> Optional[OutdoorSpot]:
+    """ device -> spot -> project -> outdoor spot in one query """
+    return (OutdoorSpot.query
+            .join(Project,
+                  Project.outdoor_spot_id == OutdoorSpot.outdoor_spot_id)
+            .join(Spot, Spot.project_id == Project.project_id)
+            .join(Device, Device.spot_id == Spot.spot_id)
+            .filter(Device.device_id == did)
+            .first())
 
-        dhour = timedelta(hours=1)
 
-        od_rec = (OutdoorRecord
-                  .query
-                  .filter(and_(
-                      OutdoorRecord.
-                      outdoor_record_time >= spot_rec_hour,
+def _outdoor_records_by_hour(od_spot: OutdoorSpot,
+                             did: int) -> Dict[datetime, Dict]:
+    """ outdoor records of the hours the device has records in """
+    first, last = (db.session
+                   .query(func.min(SpotRecord.spot_record_time),
+                          func.max(SpotRecord.spot_record_time))
+                   .filter(SpotRecord.device_id == did)
+                   .one())
+    if first is None:
+        return {}
 
-                      OutdoorRecord.
-                      outdoor_record_time < spot_rec_hour + dhour))
-                  .first())
+    od_recs: Dict[datetime, Dict] = {}
+    for od_rec in (OutdoorRecord.query
+                   .filter(and_(
+                       OutdoorRecord.outdoor_spot_id
+                       == od_spot.outdoor_spot_id,
 
-        spot_rec_json = spot_rec.to_json()
-        od_spot_json = od_spot.to_json() if od_spot else None
+                       OutdoorRecord.
+                       outdoor_record_time >= _hour_of(first),
 
-        try:
-            od_rec_json = od_rec.to_json()
-        except AttributeError:
-            od_rec_json = {}
+                       OutdoorRecord.
+                       outdoor_record_time < _hour_of(last) + dhour))
+                   .order_by(OutdoorRecord.outdoor_record_time)):
+        # the first record of an hour.
+        od_recs.setdefault(_hour_of(od_rec.outdoor_record_time),
+                           od_rec.to_json())
+    return od_recs
 
-        spot_rec_json.update({
-            "outdoor_spot": od_spot_json,
-            "outdoor_record": od_rec_json,
-        })
 
-        records.append(spot_rec_json)
-
-        response_object['data'] = records
-    return jsonify(response_object)
+@api.route('/device/<did>/records', methods=['GET'])
+@etag(lambda did: (*device_record_categories(did), 'outdoor_record',
+                   'device', 'spot', 'project', 'outdoor_spot'))
+@coalesce
+def spot_record_view(did: int):
+    """
+    combine spot record and outdoor records.
+    outdoor records are fetched once and matched by hour, records are
+    streamed.
+    """
+    response_object: ApiResponse = (
+        ApiResponse(
+            status=ReturnCode.OK.value,
+            message="successfully get spot records"))
+
+    od_spot = _outdoor_spot_of(did)
+    od_spot_json = od_spot.to_json() if od_spot else None
+    od_recs = _outdoor_records_by_hour(od_spot, did) if od_spot else {}
+
+    def records() -> Iterator[Dict]:
+        for spot_rec in (SpotRecord.query
+                         .filter_by(device_id=did)
+                         .order_by(SpotRecord.spot_record_time)
+                         .yield_per(YIELD_PER)):
+            spot_rec_json = spot_rec.to_json()
+            spot_rec_json.update({
+                "outdoor_spot": od_spot_json,
+                "outdoor_record": od_recs.get(
+                    _hour_of(spot_rec.spot_record_time), {}),
+            })
+            yield spot_rec_json
+
+    if wants_stream():
+        return ndjson_response(records())
+    return json_array_response(response_object, records())
 
 
 @api.route('/project_pic/<pid>', methods=['GET'])
+@coalesce
 def project_pic_view(pid):
     """send project picture for given project"""
     response_object: ApiResponse = (
@@ -0,0 +1,57 @@
+"""
+Conditional GET with ETags from data generations.
+
+Dashboards poll the same views and mostly get the same bytes back.
+A view decorated with `etag` declares the data it depends on, the tag
+is computed from their generations before the view runs, and a request
+with a matching If-None-Match gets an empty 304 without a query.
+
+Put it above `coalesce`, 304s don't need to wait for anyone.
+"""
+from functools import wraps
+from typing import Callable, Hashable, Iterable, Union
+
+from flask import Response, make_response, request
+
+from app import data_generations
+
+Categories = Union[Iterable[Hashable], Callable[..., Iterable[Hashable]]]
+
+
+def etag(categories: Categories) -> Callable:
+    """
+    @param categories:  categories the response depends on, or a function
+                        of the view arguments returning them.
+    """
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def _tagged(*args, **kwargs):
+            if not data_generations.enabled:
+                return view(*args, **kwargs)
+
+            depends = (categories(*args, **kwargs) if callable(categories)
+                       else categories)
+            # same url, different representations.
+            tag = data_generations.etag(depends,
+                                        request.headers.get('Accept'))
+
+            if request.if_none_match.contains_weak(tag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag, weak=True)
+            response.vary.add('Accept')
+            return response
+        return _tagged
+    return decorator
+
+
+def device_record_categories(did) -> Iterable[Hashable]:
+    return (('spot_record', 'device', int(did)),)
+
+
+def spot_record_categories(sid) -> Iterable[Hashable]:
+    # devices can move between spots.
+    return (('spot_record', 'spot', int(sid)), 'device')
@@ -0,0 +1,21 @@
+"""
+`?fields=` selects the keys of serialized items.
+
+    /api/v1/project?fields=project_id,project_name
+
+Listings send the whole to_json of each item by default, nested
+companies, base64 images and all. With fields only the named keys are
+sent, and where they are plain columns only those are loaded, see
+serializers.py and record_rows.py. Unknown keys are ignored, if none
+of the keys is known every key is sent.
+"""
+from typing import List, Optional
+
+from flask import request
+
+
+def requested_fields() -> Optional[List[str]]:
+    """ keys asked for in order, None if all """
+    fields = [f.strip() for f in request.args.get('fields', '').split(',')]
+    fields = list(dict.fromkeys(f for f in fields if f))
+    return fields or None
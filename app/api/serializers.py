@@ -0,0 +1,155 @@
+"""
+Serialize lists of models with a fixed number of queries.
+
+to_json follows relationships, each one is a lazy load per item, and
+Spot.to_json counts devices per spot. Listing a page of n items costs
+n * k queries that way.
+
+`planned` adds the eager loads a model's to_json needs to a query, and
+`to_json_many` serializes the result with per item aggregates fetched
+in one grouped query. A page then costs the same few queries whatever
+its size.
+
+Both take the to_json keys a client asked for, see projection.py. If
+all of them are plain columns only those columns are loaded and no
+relationship is touched.
+"""
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Type
+
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.orm.interfaces import MapperOption
+
+from app import db
+from app.models import Device, Project, Spot, SpotRecord, TIMEFORMAT
+
+# relationships are named by string, backrefs don't exist on the class
+# before the mappers are configured.
+_EAGER_LOADS: Dict[Type[db.Model], Sequence[MapperOption]] = {
+    Project: (joinedload('location').joinedload('climate_area'),
+              joinedload('tech_support_company'),
+              joinedload('project_company'),
+              joinedload('construction_company'),
+              joinedload('outdoor_spot')),
+    Spot: (joinedload('project'),),
+    Device: (joinedload('spot').joinedload('project'),),
+}
+
+
+Fields = Optional[Sequence[str]]
+
+
+def _formatter(fmt: str) -> Callable[[Optional[datetime]], Optional[str]]:
+    return lambda t: t.strftime(fmt) if t else None
+
+
+def _same(value):
+    return value
+
+
+_date = _formatter("%Y-%m-%d")
+_time = _formatter(TIMEFORMAT)
+
+# to_json keys that are a column of the model, with how to_json formats it.
+_COLUMN_FIELDS: Dict[Type[db.Model], Dict[str, Callable]] = {
+    Project: dict(dict.fromkeys(('project_id',
+                                 'project_name',
+                                 'district',
+                                 'floor',
+                                 'latitude',
+                                 'longitude',
+                                 'area',
+                                 'demo_area',
+                                 'building_type',
+                                 'building_height',
+                                 'description'), _same),
+                  started_time=_date,
+                  finished_time=_date,
+                  record_started_from=_date),
+    Spot: dict.fromkeys(('spot_id', 'project_id', 'spot_name', 'spot_type'),
+                        _same),
+    Device: dict(dict.fromkeys(('device_id',
+                                'spot_id',
+                                'online',
+                                'device_name',
+                                'device_type'), _same),
+                 create_time=_time,
+                 modify_time=_time),
+    SpotRecord: dict(dict.fromkeys(('spot_record_id',
+                                    'device_id',
+                                    'window_opened',
+                                    'temperature',
+                                    'humidity',
+                                    'ac_power',
+                                    'pm25',
+                                    'co2'), _same),
+                     spot_record_time=_time),
+}
+
+
+def _columns_only(model: Type[db.Model], fields: Fields) -> bool:
+    return (fields is not None
+            and all(f in _COLUMN_FIELDS.get(model, ()) for f in fields))
+
+
+def planned(model: Type[db.Model],
+            query: Optional[BaseQuery] = None,
+            fields: Fields = None) -> BaseQuery:
+    """
+    query of model with everything its to_json touches loaded,
+    or only the columns of fields.
+    """
+    if query is None:
+        query = model.query
+    if _columns_only(model, fields):
+        return query.options(load_only(*fields))
+    return query.options(*_EAGER_LOADS.get(model, ()))
+
+
+def device_counts(spot_ids: Iterable[int]) -> Dict[int, int]:
+    """ number of devices of each spot """
+    spot_ids = list(spot_ids)
+    if not spot_ids:
+        return {}
+    return dict(db.session
+                .query(Device.spot_id, func.count(Device.device_id))
+                .filter(Device.spot_id.in_(spot_ids))
+                .group_by(Device.spot_id))
+
+
+def _spots_to_json(spots: List[Spot]) -> List[Dict]:
+    counts = device_counts({s.spot_id for s in spots})
+    return [s.to_json(number_of_device=counts.get(s.spot_id, 0))
+            for s in spots]
+
+
+_MANY: Dict[Type[db.Model], Callable[[List], List[Dict]]] = {
+    Spot: _spots_to_json,
+}
+
+
+def to_json_many(items: Iterable[db.Model],
+                 fields: Fields = None) -> List[Dict]:
+    """
+    to_json of each item, falsy items are skipped.
+    only keys in fields are kept if given and any of them is known.
+    """
+    items = [item for item in items if item]
+    if not items:
+        return []
+
+    model = type(items[0])
+    if _columns_only(model, fields):
+        formats = [(f, _COLUMN_FIELDS[model][f]) for f in fields]
+        return [{f: fmt(getattr(item, f)) for f, fmt in formats}
+                for item in items]
+
+    many = _MANY.get(model)
+    result = ([item.to_json() for item in items] if many is None
+              else many(items))
+    known = [f for f in fields or () if f in result[0]]
+    if not known:
+        return result
+    return [{f: d[f] for f in known if f in d} for d in result]
@@ -0,0 +1,108 @@
+"""
+Coalesce identical concurrent reads.
+
+When a dashboard loads, many clients ask for the same thing at the same
+moment. With `coalesce` the first request of a kind runs the view, the
+identical ones arriving while it runs wait for it and get a copy of its
+response instead of running the same query again.
+
+Requests are identical if method, path with query string, body and
+Accept header are the same. Only use it on views without side effects.
+"""
+from functools import wraps
+from threading import Event, Lock
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional
+from typing import Tuple, TypeVar, Union
+
+from flask import Response, make_response, request
+
+T = TypeVar('T')
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """ at most one call of each key is running at a time """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        run fn, or wait for the running call of the same key.
+        return (result, if the result is shared from another call).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class _Snapshot(NamedTuple):
+    data: bytes
+    status: int
+    headers: List[Tuple[str, str]]
+
+
+_flight = SingleFlight()
+
+
+def coalesce(view: Callable) -> Callable:
+    """
+    Each request gets its own Response built from a snapshot, so
+    after_request handlers can't see each other's changes.
+    Streamed responses can't be shared, waiters run the view themselves.
+    """
+    @wraps(view)
+    def _coalesced(*args, **kwargs):
+        def run() -> Union[Response, _Snapshot]:
+            response = make_response(view(*args, **kwargs))
+            if response.is_streamed:
+                return response
+            return _Snapshot(response.get_data(),
+                             response.status_code,
+                             response.headers.to_wsgi_list())
+
+        key = (request.method,
+               request.full_path,
+               request.get_data(),
+               request.headers.get('Accept'))
+        result, shared = _flight.do(key, run)
+
+        if isinstance(result, _Snapshot):
+            return Response(result.data,
+                            status=result.status,
+                            headers=result.headers)
+        if shared:
+            return make_response(view(*args, **kwargs))
+        return result
+    return _coalesced
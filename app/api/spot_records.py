@@ -1,40 +1,106 @@
 from flask import jsonify
 from . import api
-from app.models import SpotRecord
+from .binary_series import series_response, wants_series
+from .etag import etag, spot_record_categories
+from .record_rows import COLUMNS, SPOT_RECORD, Columns, spot_record_select
+from .record_rows import fetch, iter_dicts, to_columns, to_dicts
+from .record_rows import project, requested_columns, wants_columns
+from .single_flight import coalesce
+from .streaming import ndjson_response, wants_stream
+from app import range_cache
 from datetime import datetime
 from datetime import timedelta
+from sqlalchemy.sql import Select
+from typing import Callable, Dict, List, Tuple
 import calendar
 
 
+def spot_record_rows(scope: str, ident: int
+                     ) -> Callable[[datetime, datetime],
+                                   List[Tuple[datetime, Dict]]]:
+    """
+    loader for range_cache. serialized records of a device or a spot
+    in [start, end).
+    """
+    def load(start: datetime, end: datetime) -> List[Tuple[datetime, Dict]]:
+        time = SPOT_RECORD.c.spot_record_time
+        rows = fetch(spot_record_select(scope, ident).
+                     where(time >= start).
+                     where(time < end).
+                     order_by(time))
+        return [(row.spot_record_time, d)
+                for row, d in zip(rows, to_dicts(rows))]
+    return load
+
+
+def stream_spot_records(query: Select, columns: Columns = COLUMNS):
+    """ ndjson response iterating the query with a cursor """
+    return ndjson_response(
+        iter_dicts(query.order_by(SPOT_RECORD.c.spot_record_time), columns))
+
+
+def records_json(records: List[Dict], columns: Columns = COLUMNS):
+    """ columns of records as rows, or as lists if asked """
+    if wants_columns():
+        return jsonify(to_columns(records, columns))
+    return jsonify(project(records, columns))
+
+
 @api.route('/spot/<spot_id>', methods=['GET'])
+@etag(lambda spot_id: spot_record_categories(spot_id))
+@coalesce
 def get_spot_records(spot_id):
-    spot_records = [r.to_json()
-                    for r in
-                    SpotRecord.query.filter_by(spot_id=spot_id)]
-    return jsonify(spot_records)
+    columns = requested_columns()
+    query = spot_record_select('spot', int(spot_id), columns)
+    if wants_series():
+        return series_response(query, columns)
+    if wants_stream():
+        return stream_spot_records(query, columns)
+    return records_json(to_dicts(fetch(query), columns), columns)
 
 
 @api.route(
     '/spot/<sid>/from/<int:year1>/<int:month1>/to/<int:year2>/<int:month2>',
     methods=['GET'])
+@etag(lambda sid, **_: spot_record_categories(sid))
+@coalesce
 def get_spot_records_in_date_range(sid, year1, month1, year2, month2):
     date1 = datetime(year1, month1, 1)
     _, day_range_of_month2 = calendar.monthrange(year2, month2)
     date2 = datetime(year2, month2, day_range_of_month2)
-    records = (SpotRecord.query.
-               filter(SpotRecord.spot_id == sid).
-               filter(SpotRecord.spot_record_time > date1).
-               filter(SpotRecord.spot_record_time < date2).
-               order_by(SpotRecord.spot_record_time))
-    return jsonify([r.to_json() for r in records])
+    columns = requested_columns()
+    time = SPOT_RECORD.c.spot_record_time
+    query = (spot_record_select('spot', int(sid), columns).
+             where(time > date1).
+             where(time < date2))
+    if wants_series():
+        return series_response(query, columns)
+    if wants_stream():
+        return stream_spot_records(query, columns)
+
+    # buckets are cached whole, shared by all projections.
+    records = range_cache.rows('spot', int(sid), date1, date2,
+                               spot_record_rows('spot', int(sid)),
+                               include_start=False, include_end=False)
+    return records_json(records, columns)
 
 
 @api.route('/spot/<spot_id>/date/<int:year>/<int:month>/<int:day>')
+@etag(lambda spot_id, **_: spot_record_categories(spot_id))
+@coalesce
 def get_spot_records_in_one_day(spot_id, year, month, day):
     date = datetime(year, month, day)
-    records = (SpotRecord.query.
-               filter(SpotRecord.spot_id == spot_id).
-               filter(SpotRecord.spot_record_time >= date).
-               filter(SpotRecord.spot_record_time < date + timedelta(days=1)).
-               order_by(SpotRecord.spot_record_time))
-    return jsonify([r.to_json() for r in records])
+    columns = requested_columns()
+    if wants_series():
+        time = SPOT_RECORD.c.spot_record_time
+        return series_response(
+            spot_record_select('spot', int(spot_id), columns).
+            where(time >= date).
+            where(time < date + timedelta(days=1)),
+            columns)
+
+    records = range_cache.rows('spot', int(spot_id),
+                               date, date + timedelta(days=1),
+                               spot_record_rows('spot', int(spot_id)),
+                               include_end=False)
+    return records_json(records, columns)
@@ -0,0 +1,79 @@
+"""
+Streaming responses for large results.
+
+A json array is built in memory before the first byte is sent. Clients
+asking for `application/x-ndjson` (or `?stream=1`) get one json object
+per line instead, written while the query is iterated with yield_per.
+Memory stays flat regardless of the range size.
+"""
+from typing import Dict, Iterable, Iterator
+
+from flask import Response, json, request, stream_with_context
+
+NDJSON = 'application/x-ndjson'
+
+# rows are sent in chunks about this large.
+CHUNK_BYTES = 64 * 1024
+
+# rows fetched from the database cursor at a time.
+YIELD_PER = 1000
+
+# placeholder of the rows in an envelope.
+_ROWS = '\0rows\0'
+
+
+def wants_stream() -> bool:
+    """ if the client asked for a ndjson stream """
+    if request.args.get('stream') == '1':
+        return True
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON]) == NDJSON
+
+
+def ndjson_lines(rows: Iterable[Dict],
+                 chunk_bytes: int = CHUNK_BYTES) -> Iterator[str]:
+    buf, size = [], 0
+    for row in rows:
+        line = json.dumps(row) + '\n'
+        buf.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield ''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf)
+
+
+def json_array_lines(envelope: Dict,
+                     rows: Iterable[Dict],
+                     key: str = 'data',
+                     chunk_bytes: int = CHUNK_BYTES) -> Iterator[str]:
+    """
+    envelope as json with rows as the array under key, e.g an ApiResponse.
+    the same document jsonify would make, written piece by piece.
+    """
+    doc = json.dumps(dict(envelope, **{key: _ROWS}))
+    head, tail = doc.split(json.dumps(_ROWS))
+    buf, size = [head, '['], len(head) + 1
+    for i, row in enumerate(rows):
+        line = (',' if i else '') + json.dumps(row)
+        buf.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield ''.join(buf)
+            buf, size = [], 0
+    buf.append(']' + tail)
+    yield ''.join(buf)
+
+
+def json_array_response(envelope: Dict,
+                        rows: Iterable[Dict],
+                        key: str = 'data') -> Response:
+    return Response(stream_with_context(json_array_lines(envelope, rows, key)),
+                    mimetype='application/json')
+
+
+def ndjson_response(rows: Iterable[Dict]) -> Response:
+    """ rows is consumed lazily, inside the request context """
+    return Response(stream_with_context(ndjson_lines(rows)),
+                    mimetype=NDJSON)
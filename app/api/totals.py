@@ -0,0 +1,78 @@
+"""
+Totals of paged apis.
+
+Totals come from app.row_counts, counted once and kept up to date on
+commit, so a page costs one query for its items. A device can have
+hundreds of thousands of records, when even the first count is too
+much `estimate` returns the number of 5 minute steps between its first
+and last record instead, found with two index lookups. It is only a
+hint for clients: Xiaomi devices store several records a step and gaps
+leave steps empty, so it can be above or below the real total and must
+not decide if a page exists.
+"""
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from flask import abort
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy import func
+
+from app import db, row_counts
+from app.models import Device, Project, Spot, SpotRecord
+
+# interval of spot records.
+RECORD_STEP = timedelta(minutes=5)
+
+
+def page_items(query: BaseQuery, pageNo: int, size: int) -> List:
+    """ items of query.paginate(pageNo, size) without counting """
+    if pageNo < 1:
+        abort(404)
+    items = query.limit(size).offset((pageNo - 1) * size).all()
+    if not items and pageNo != 1:
+        abort(404)
+    return items
+
+
+def project_total() -> int:
+    return row_counts.get(('project',), Project.query.count)
+
+
+def spot_total(pid: Optional[int] = None) -> int:
+    if pid is None:
+        return row_counts.get(('spot',), Spot.query.count)
+    return row_counts.get(
+        ('spot', 'project_id', int(pid)),
+        Spot.query.filter_by(project_id=pid).count)
+
+
+def device_total(sid: Optional[int] = None) -> int:
+    if sid is None:
+        return row_counts.get(('device',), Device.query.count)
+    return row_counts.get(
+        ('device', 'spot_id', int(sid)),
+        Device.query.filter_by(spot_id=sid).count)
+
+
+def device_record_total(did: int, estimate: bool = False
+                        ) -> Tuple[int, bool]:
+    """ (number of records of a device, if it is estimated) """
+    key = ('spot_record', 'device_id', int(did))
+    if estimate:
+        known = row_counts.peek(key)
+        if known is not None:
+            return known, False
+        return _estimate_device_records(did), True
+    return row_counts.get(
+        key, SpotRecord.query.filter_by(device_id=did).count), False
+
+
+def _estimate_device_records(did: int) -> int:
+    first, last = (db.session
+                   .query(func.min(SpotRecord.spot_record_time),
+                          func.max(SpotRecord.spot_record_time))
+                   .filter(SpotRecord.device_id == did)
+                   .one())
+    if first is None:
+        return 0
+    return (last - first) // RECORD_STEP + 1
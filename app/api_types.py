@@ -35,6 +35,20 @@ PagingRequest = TypedDict(
         'pageNo': int
     })
 
+# pageNo is ignored if cursor is given, the first page has cursor None.
+# total asks for totalElementCount, estimate allows it to be estimated
+# if the exact number is not known yet.
+CursorPagingRequest = TypedDict(
+    'CursorPagingRequest',
+    {
+        'size': int,
+        'pageNo': int,
+        'cursor': Optional[str],
+        'total': bool,
+        'estimate': bool
+    },
+    total=False)
+
 
 def is_ApiRequest(data: Optional[Dict]) -> bool:
     if not data:
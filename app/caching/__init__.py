@@ -1 +1,4 @@
 from .cache_instance import CacheInstance
+from .generations import DataGenerations
+from .range_cache import RangeCache
+from .row_counts import RowCounts
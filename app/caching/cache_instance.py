@@ -3,23 +3,38 @@ Need to run under app_context for database access.
 """
 from __future__ import annotations
 from flask import Flask
+from functools import wraps
+from threading import Event, Thread
 from .caching import empty_cache, is_cache_empty, Cache
-from typing import Optional, Type
+from .caching import cache_generation, cache_stats
+from .shared_cache import SharedCache, master_token
+from typing import Callable, Dict, Optional, Type
 import logging
 
 
 class CacheInstance:
     """
     Flask compatible cache extension.
+
+    Cache is warmed up in a background thread so the app can serve
+    right after created. Before the cache is ready, functions decorated
+    with `global_cacheall` get no cache and go to the database.
+
+    If SHISANWU_SHARED_CACHE_DIR is set the cache lives in shared memory
+    and is warmed up once for all workers on the host.
+
+    Writes done while warming up don't reach the cache, and the tables
+    already loaded would keep stale entries. Writers like the scheduler
+    should be started by `then`, after warm up finished.
     """
 
-    # expensive !
     def __init__(self):
 
         self.is_init: bool = False
+        self._ready = Event()
 
         self._global_cache: Cache = empty_cache()
-        self.global_cacheall = lambda f: f
+        self._cacheall: Callable = lambda f: f
 
     @property
     def global_cache(self):
@@ -30,19 +45,91 @@ class CacheInstance:
         # modify old object rather than assign a new one.
         self._global_cache.update(value)
 
-    def init_app(self, app: Flask):
+    @property
+    def global_cacheall(self) -> Callable:
+        """
+        Cache decorator bound lazily.
+        Decorated function can be defined before the cache is ready, the
+        real decorator is looked up each time the function is called.
+        """
+        def _lazy_deco(f):
+            @wraps(f)
+            def _lazy_cacheall(*args, **kwargs):
+                if self._ready.is_set():
+                    return self._cacheall(f)(*args, **kwargs)
+                return f(*args, **kwargs)
+            return _lazy_cacheall
+        return _lazy_deco
+
+    @global_cacheall.setter
+    def global_cacheall(self, value: Callable):
+        self._cacheall = value
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """ block until warm up finished. return False if timeout """
+        return self._ready.wait(timeout)
+
+    def init_app(self, app: Flask, background: bool = True,
+                 then: Optional[Callable[[], None]] = None):
+        """
+        warm up the cache. non blocking by default.
+        then() is called once warm up is done, even if it failed.
+        """
+        shared_dir = app.config.get('SHISANWU_SHARED_CACHE_DIR')
+        if shared_dir and not isinstance(self._global_cache, SharedCache):
+            token = (app.config.get('SHISANWU_SHARED_CACHE_TOKEN')
+                     or master_token())
+            self._global_cache = SharedCache(
+                shared_dir, token,
+                app.config.get('SHISANWU_SHARED_CACHE_SIZES'))
+
+        if background:
+            t = Thread(target=self._warm_up, args=(app, then),
+                       name='cache-warm-up', daemon=True)
+            t.start()
+        else:
+            self._warm_up(app, then)
 
+    def _warm_up(self, app: Flask,
+                 then: Optional[Callable[[], None]] = None):
+        try:
+            self._load(app)
+        finally:
+            if then is not None:
+                then()
+
+    def _load(self, app: Flask):
         with app.app_context():
             # load global cache.
             from .global_cache import init_global_cache
-            result = init_global_cache(self)
+            try:
+                result = init_global_cache(self)
+            except Exception as e:
+                logging.error('cache warm up failed: %s', e)
+                result = None
 
             if result is None:
                 logging.warning('cache is empty')
             else:
                 self.is_init = True
+                self._ready.set()
                 logging.warning('cache instance is ready.')
 
+    def generation(self, category) -> int:
+        """
+        generation of a cache category, it changes whenever the category
+        is written. Cheap way to check if a cached value is still fresh.
+        """
+        return cache_generation(self._global_cache, category)
+
+    def stats(self) -> Dict:
+        """ hit rate, size, evictions ... of LRU categories """
+        return cache_stats(self._global_cache)
+
     def load(self) -> Optional[CacheInstance]:
         """ guarantee self is loaded """
         if self.is_init:
@@ -52,7 +139,8 @@ class CacheInstance:
             return None
 
     def __str__(self) -> str:
-        s = '<CacheInstance cache {} {}>'.format(
+        s = '<CacheInstance cache {} {} ready: {}>'.format(
             self.global_cache.keys() if self.global_cache else None,
-            self.global_cacheall)
+            self._cacheall,
+            self.is_ready)
         return s
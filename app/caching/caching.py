@@ -1,7 +1,8 @@
 """
 LRU cache system
 The core of the cache system is a orded dictionary which keep
-track of the least used entry in a session.
+track of the least used entry in a session. It is lock striped so
+fetch threads and request threads can share it.
 
 Cache can be turned on in the app creation stage.
 if turned on, all the database lookup will be redirect to cache lookup
@@ -9,11 +10,21 @@ first, and goes to the actually datbase only if it missed.
 
 Whenever there is a new instance be broungt into ORM the object at the
 end of the cache will be removed.
+
+Each category of the cache has a generation counter. Any write to a
+category (put or invalidate) bump its generation, so a reader can
+remember the generation when it read and later check if what it
+got is still fresh without touching the database.
 """
 
-from typing import Dict, Union, Optional, TypeVar, Generic
-from collections import OrderedDict
+from typing import Dict, Union, Optional, Tuple, TypeVar, Generic
+from typing import Iterable, Iterator, List, Callable, Any
+from collections import OrderedDict, defaultdict
+from collections.abc import MutableMapping
 from functools import wraps
+from threading import Lock
+from time import monotonic
+import sys
 
 ##################
 #  Cache system  #
@@ -28,27 +39,383 @@ V = TypeVar('V')
 N = TypeVar('N')
 
 
-class _LRUDictionary(OrderedDict, Generic[U, V]):
+class _LRUDictionary(MutableMapping, Generic[U, V]):
     """
-    LRU cache to hold for large amount of records.
+    Thread safe LRU cache to hold for large amount of records.
+
+    Keys are spread over `stripes` OrderedDicts by hash, each stripe has
+    its own lock and 1/stripes of maxsize. Threads working on different
+    keys rarely wait for each other. Eviction is done per stripe, which
+    approximates the global LRU order.
     """
 
-    def __init__(self, maxsize=3000, *args, **kwargs):
+    def __init__(self, maxsize=3000, stripes=16, *args, **kwargs):
         self.maxsize = maxsize
-        super().__init__(*args, **kwargs)
+        n = max(1, min(stripes, maxsize))
+        self._stripe_size = -(-maxsize // n)  # ceil
+        self._stripes: List[OrderedDict] = [OrderedDict() for _ in range(n)]
+        self._locks: List[Lock] = [Lock() for _ in range(n)]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.update(*args, **kwargs)
 
-    def __getitem__(self, key: U) -> V:
-        value: V = super().__getitem__(key)
+    def _index(self, key: U) -> int:
+        return hash(key) % len(self._stripes)
+
+    # hooks for subclasses, caller holds the lock of stripe i.
+    def _touch(self, i: int, key: U):
+        """ called on every look up, hit or miss """
+
+    def _removed(self, i: int, key: U, value: V):
+        """ called after key left stripe i """
 
+    def _is_full(self, i: int) -> bool:
+        return len(self._stripes[i]) > self._stripe_size
+
+    def _put(self, i: int, key: U, value: V):
+        stripe = self._stripes[i]
+        if key in stripe:
+            self._removed(i, key, stripe[key])
+        stripe[key] = value
+        stripe.move_to_end(key)
+        self._evict(i)
+
+    def _evict(self, i: int):
+        stripe = self._stripes[i]
+        while stripe and self._is_full(i):
+            self._removed(i, *stripe.popitem(last=False))
+            self.evictions += 1
+
+    def _lookup(self, i: int, key: U, default):
+        stripe = self._stripes[i]
+        self._touch(i, key)
+        if key not in stripe:
+            self.misses += 1
+            return default
+        self.hits += 1
         # reschedule.
-        self.move_to_end(key)
+        stripe.move_to_end(key)
+        return stripe[key]
+
+    def __getitem__(self, key: U) -> V:
+        missing = object()
+        i = self._index(key)
+        with self._locks[i]:
+            value = self._lookup(i, key, missing)
+        if value is missing:
+            raise KeyError(key)
         return value
 
+    def get(self, key: U, default=None):
+        i = self._index(key)
+        with self._locks[i]:
+            return self._lookup(i, key, default)
+
+    def __setitem__(self, key: U, value: V):
+        i = self._index(key)
+        with self._locks[i]:
+            self._put(i, key, value)
+
+    def __delitem__(self, key: U):
+        i = self._index(key)
+        with self._locks[i]:
+            self._removed(i, key, self._stripes[i].pop(key))
+
+    def pop(self, key: U, *default):
+        i = self._index(key)
+        with self._locks[i]:
+            if key not in self._stripes[i]:
+                if default:
+                    return default[0]
+                raise KeyError(key)
+            value = self._stripes[i].pop(key)
+            self._removed(i, key, value)
+            return value
+
+    def setdefault(self, key: U, default=None):
+        i = self._index(key)
+        with self._locks[i]:
+            if key in self._stripes[i]:
+                return self._stripes[i][key]
+            self._put(i, key, default)
+            return default
+
+    def __contains__(self, key) -> bool:
+        i = self._index(key)
+        with self._locks[i]:
+            return key in self._stripes[i]
+
+    def __len__(self) -> int:
+        return sum(len(stripe) for stripe in self._stripes)
+
+    def __iter__(self) -> Iterator[U]:
+        return iter([k for k, _ in self.items()])
+
+    def items(self) -> List[Tuple[U, V]]:  # type: ignore
+        """ snapshot, doesn't change the lru order """
+        result: List[Tuple[U, V]] = []
+        for lock, stripe in zip(self._locks, self._stripes):
+            with lock:
+                result.extend(stripe.items())
+        return result
+
+    def clear(self):
+        for i, (lock, stripe) in enumerate(zip(self._locks, self._stripes)):
+            with lock:
+                while stripe:
+                    self._removed(i, *stripe.popitem())
+
+    def _group(self, keys: Iterable[U]) -> Dict[int, List[U]]:
+        groups: Dict[int, List[U]] = defaultdict(list)
+        for key in keys:
+            groups[self._index(key)].append(key)
+        return groups
+
+    def get_many(self, keys: Iterable[U]) -> Dict[U, V]:
+        """ look up keys, each stripe is locked once. misses are left out """
+        missing = object()
+        result: Dict[U, V] = {}
+        for i, group in self._group(keys).items():
+            with self._locks[i]:
+                for key in group:
+                    value = self._lookup(i, key, missing)
+                    if value is not missing:
+                        result[key] = value
+        return result
+
+    def put_many(self, items: Iterable[Tuple[U, V]]):
+        """ insert items, each stripe is locked once """
+        groups: Dict[int, List[Tuple[U, V]]] = defaultdict(list)
+        for key, value in items:
+            groups[self._index(key)].append((key, value))
+        for i, group in groups.items():
+            with self._locks[i]:
+                for key, value in group:
+                    self._put(i, key, value)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.misses
+        return {'size': len(self),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions}
+
+
+class _FrequencySketch:
+    """
+    Count-min sketch of 4 bit counters, estimate how often a key was seen
+    recently. Counters are halved every `sample_size` additions so old
+    popularity fades out.
+    """
+    _DEPTH = 4
+    _MAX = 15
+
+    def __init__(self, width: int, sample_size: int):
+        self._width = max(64, width)
+        self._sample_size = max(1, sample_size)
+        self._table = [[0] * self._width for _ in range(self._DEPTH)]
+        self._additions = 0
+
+    def _slots(self, key) -> Iterator[Tuple[List[int], int]]:
+        h = hash(key)
+        for d, row in enumerate(self._table):
+            yield row, hash((h, d)) % self._width
+
+    def add(self, key):
+        for row, j in self._slots(key):
+            if row[j] < self._MAX:
+                row[j] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._age()
+
+    def estimate(self, key) -> int:
+        return min(row[j] for row, j in self._slots(key))
+
+    def _age(self):
+        self._additions //= 2
+        for row in self._table:
+            for j in range(self._width):
+                row[j] >>= 1
+
+
+def approx_size(value) -> int:
+    """
+    shallow size of an object and its attributes in bytes. Tuples (cache
+    entries are named tuples) count their items, they have no __dict__.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        return size + sum(sys.getsizeof(v) for v in value)
+    attrs = getattr(value, '__dict__', None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs) + sum(
+            sys.getsizeof(v) for k, v in attrs.items()
+            if not k.startswith('_'))
+    return size
+
+
+class _TinyLFUDictionary(_LRUDictionary[U, V]):
+    """
+    LRU with a byte budget and TinyLFU admission.
+
+    A plain LRU admits everything, one long scan (e.g an overall update)
+    flushes the hot entries out. Here a new key is only admitted if it
+    has been seen more often recently than the LRU entry it would evict,
+    so keys looked up again and again stay while one-off keys pass by.
+
+    @param max_bytes: budget of all entries, measured by `sizeof`.
+    """
+
+    def __init__(self,
+                 maxsize=3000,
+                 max_bytes: Optional[int] = None,
+                 stripes=16,
+                 sizeof: Callable[[Any], int] = approx_size,
+                 *args, **kwargs):
+        n = max(1, min(stripes, maxsize))
+        self._stripe_bytes = (-(-max_bytes // n)
+                              if max_bytes is not None else None)
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._bytes = [0] * n
+        self._sizes: List[Dict] = [{} for _ in range(n)]
+        per_stripe = -(-maxsize // n)
+        self._sketches = [_FrequencySketch(per_stripe * 4, per_stripe * 10)
+                          for _ in range(n)]
+        self.admitted = 0
+        self.rejected = 0
+        super().__init__(maxsize, stripes, *args, **kwargs)
+
+    def _touch(self, i: int, key: U):
+        self._sketches[i].add(key)
+
+    def _removed(self, i: int, key: U, value: V):
+        self._bytes[i] -= self._sizes[i].pop(key, 0)
+
+    def _is_full(self, i: int) -> bool:
+        return (super()._is_full(i)
+                or (self._stripe_bytes is not None
+                    and self._bytes[i] > self._stripe_bytes))
+
+    def _put(self, i: int, key: U, value: V):
+        stripe = self._stripes[i]
+        sketch = self._sketches[i]
+        sketch.add(key)
+        size = self._sizeof(value)
+
+        if self._stripe_bytes is not None and size > self._stripe_bytes:
+            if key in stripe:
+                self._removed(i, key, stripe.pop(key))
+            self.rejected += 1
+            return
+
+        if key not in stripe:
+            # the entry to be evicted if the candidate gets in.
+            victim = next(iter(stripe)) if stripe else None
+            will_be_full = (len(stripe) + 1 > self._stripe_size
+                            or (self._stripe_bytes is not None
+                                and self._bytes[i] + size
+                                > self._stripe_bytes))
+            if (will_be_full and victim is not None
+                    and sketch.estimate(key) <= sketch.estimate(victim)):
+                self.rejected += 1
+                return
+            self.admitted += 1
+
+        else:
+            self._removed(i, key, stripe[key])
+
+        stripe[key] = value
+        stripe.move_to_end(key)
+        self._sizes[i][key] = size
+        self._bytes[i] += size
+        self._evict(i)
+
+    @property
+    def bytes(self) -> int:
+        return sum(self._bytes)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        stats = super().stats()
+        stats.update({'bytes': self.bytes,
+                      'admitted': self.admitted,
+                      'rejected': self.rejected})
+        return stats
+
+
+class _TTLDictionary(Generic[U, V]):
+    """
+    Entries expire `ttl` seconds after put. Used for negative caching,
+    remember something doesn't exist for a while.
+    Kept by each process, see SharedCache.
+    """
+    process_local = True
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict[U, Tuple[V, float]] = {}
+        self._lock = Lock()
+
+    def get(self, key: U, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expire = entry
+            if expire <= monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def __contains__(self, key) -> bool:
+        missing = object()
+        return self.get(key, missing) is not missing
+
     def __setitem__(self, key: U, value: V):
-        super().__setitem__(key, value)
-        if len(self) > self.maxsize:
-            oldest: U = next(iter(self))
-            del self[oldest]
+        now = monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, now + self.ttl)
+            if len(self._entries) > self.maxsize:
+                self._entries = {k: e for k, e in self._entries.items()
+                                 if e[1] > now}
+            while len(self._entries) > self.maxsize:
+                # oldest first.
+                del self._entries[next(iter(self._entries))]
+
+    def pop(self, key: U, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class VersionedCache(dict):
+    """
+    Cache dictionary keep a generation counter for each category.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._generations: Dict = defaultdict(int)
+        self._generation_lock = Lock()
+
+    def generation(self, category) -> int:
+        return self._generations[category]
+
+    def bump(self, category) -> int:
+        with self._generation_lock:
+            self._generations[category] += 1
+            return self._generations[category]
+
+    def is_fresh(self, category, generation: int) -> bool:
+        return self._generations[category] == generation
 
 
 Cache = (Dict[T, Union[Dict[U, V], _LRUDictionary[U, V]]])
@@ -60,7 +427,84 @@ def empty_cache() -> Cache:
     an empty dict.
     works as a sentinel.
     """
-    return dict()
+    return VersionedCache()
+
+
+def cache_generation(cache: Optional[Cache], category_key) -> int:
+    """ 0 if the cache doesn't track generation """
+    if isinstance(cache, VersionedCache):
+        return cache.generation(category_key)
+    return 0
+
+
+def bump_generation(cache: Cache, category_key):
+    if isinstance(cache, VersionedCache):
+        cache.bump(category_key)
+
+
+def put_cache(cache: Cache[T, U, V],
+              category_key: T,
+              keys: Tuple[Optional[U], ...],
+              value: V) -> None:
+    """
+    write through. put value under all keys and bump the generation.
+    None keys are skipped, e.g id of an instance not flushed yet.
+    """
+    category = cache.setdefault(category_key, {})
+    for key in keys:
+        if key is not None:
+            category[key] = value
+    bump_generation(cache, category_key)
+
+
+def invalidate_cache(cache: Cache[T, U, V],
+                     category_key: T,
+                     keys: Tuple[Optional[U], ...]) -> None:
+    """ remove keys from the category and bump the generation """
+    category = cache.get(category_key)
+    if category is not None:
+        for key in keys:
+            if key is not None:
+                category.pop(key, None)
+    bump_generation(cache, category_key)
+
+
+def get_cache_many(cache: Cache[T, U, V],
+                   category_key: T,
+                   keys: Iterable[U]) -> Dict[U, V]:
+    """ batch get_cache, only hits are returned """
+    category = cache.get(category_key)
+    if category is None:
+        return {}
+    if isinstance(category, _LRUDictionary):
+        return category.get_many(keys)
+    result = {}
+    for key in keys:
+        value = category.get(key)
+        if value is not None:
+            result[key] = value
+    return result
+
+
+def put_cache_many(cache: Cache[T, U, V],
+                   category_key: T,
+                   items: Iterable[Tuple[U, V]]) -> None:
+    """ batch put_cache with one key for each value """
+    category = cache.setdefault(category_key, {})
+    if isinstance(category, _LRUDictionary):
+        category.put_many(items)
+    else:
+        for key, value in items:
+            category[key] = value
+    bump_generation(cache, category_key)
+
+
+def cache_stats(cache: Optional[Cache]) -> Dict:
+    """ statistics of categories that keep them """
+    if cache is None:
+        return {}
+    return {k: v.stats() for k, v in cache.items()
+            if isinstance(v, _LRUDictionary)}
 
 
 def is_cache_empty(cache: Optional[Cache]):
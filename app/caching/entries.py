@@ -0,0 +1,93 @@
+"""
+Compact cache entries.
+
+Caching ORM instances is heavy, each carries its instance state, a
+session reference and whatever relationship got lazy loaded (spot
+images...). The cache is mostly used to answer "does it exist and what
+is its id", so only the identifying columns are kept in immutable
+named tuples.
+
+Entries have the same attribute names as the models, code only reading
+ids can use them directly. A SpotRecordKey has no id, only the key the
+record is known by. Use `from_entry` when a real ORM instance is
+needed, e.g to update it or to serialize it for the api.
+"""
+from datetime import datetime as dt
+from typing import Dict, NamedTuple, Optional, Type, Union
+
+from .. import db
+from ..models import Device, Project, Spot, SpotRecord
+
+
+class ProjectEntry(NamedTuple):
+    project_id: int
+    project_name: str
+
+
+class SpotEntry(NamedTuple):
+    spot_id: int
+    spot_name: str
+    project_id: Optional[int]
+
+
+class DeviceEntry(NamedTuple):
+    device_id: int
+    device_name: str
+    spot_id: Optional[int]
+    online: Optional[bool]
+
+
+class SpotRecordEntry(NamedTuple):
+    spot_record_id: int
+    spot_record_time: dt
+    device_id: Optional[int]
+
+
+class SpotRecordKey(NamedTuple):
+    """ a record known to exist by its key, e.g from the timestamp index """
+    spot_record_time: dt
+    device_id: int
+
+
+Entry = Union[ProjectEntry, SpotEntry, DeviceEntry, SpotRecordEntry]
+
+# entry type -> model type, fields of an entry are columns of the model
+# and the first one is the primary key.
+_MODELS: Dict[Type, Type[db.Model]] = {
+    ProjectEntry: Project,
+    SpotEntry: Spot,
+    DeviceEntry: Device,
+    SpotRecordEntry: SpotRecord,
+}
+_ENTRIES: Dict[Type, Type] = {v: k for k, v in _MODELS.items()}
+
+
+def entry_columns(entry_type: Type):
+    """ columns to query an entry without loading the whole row """
+    model = _MODELS[entry_type]
+    return [getattr(model, f) for f in entry_type._fields]
+
+
+def to_entry(instance) -> Optional[Entry]:
+    """ entry of an ORM instance. Entries are returned as they are """
+    if instance is None or type(instance) in _MODELS:
+        return instance
+    entry_type = _ENTRIES.get(type(instance))
+    if entry_type is None:
+        raise TypeError(f'no cache entry for {type(instance).__name__}')
+    return entry_type(*(getattr(instance, f) for f in entry_type._fields))
+
+
+def from_entry(entry):
+    """
+    ORM instance of an entry. Look up the session identity map first,
+    query by primary key if it's not there.
+    ORM instances are returned as they are, a SpotRecordKey is looked up
+    by its key.
+    """
+    if isinstance(entry, SpotRecordKey):
+        return SpotRecord.query.filter_by(**entry._asdict()).first()
+    model = _MODELS.get(type(entry))
+    if model is None:
+        return entry
+    return model.query.get(entry[0])
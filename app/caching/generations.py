@@ -0,0 +1,80 @@
+"""
+Data generations for conditional GETs.
+
+Each table, and the spot records of each device and spot, has a
+generation counter. Tables written by a flush are marked automatically,
+ModelOperations marks the devices and spots of records and bulk writes
+with `touch`. Marked counters are bumped once the session commits,
+whether the global cache is on or not.
+
+A response depending on some categories is the same as long as their
+generations are, so an ETag made of them lets the api answer
+If-None-Match with 304 before querying anything.
+
+Counters are kept by each process. A tag also carries the process and
+a time window of `ttl` seconds, so a write done by another worker is
+seen once the window moves on.
+"""
+import hashlib
+import os
+from itertools import chain
+from time import time
+from typing import Hashable, Iterable
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .caching import VersionedCache
+
+_PENDING = 'pending_generations'
+
+
+class DataGenerations(VersionedCache):
+    """
+    Flask compatible extension, configured by init_app.
+
+    @param ttl:  seconds a tag stays valid without any write.
+    """
+
+    def __init__(self, ttl: float = 60):
+        super().__init__()
+        self.ttl = ttl
+        self.enabled = True
+        self._process = f'{os.getpid()}-{time()}'
+
+    def init_app(self, app: Flask, session):
+        self.enabled = app.config.get('SHISANWU_ETAG_ON', True)
+        self.ttl = app.config.get('SHISANWU_ETAG_TTL', self.ttl)
+        if not event.contains(session, 'after_commit', self._after_commit):
+            event.listen(session, 'after_flush', self._after_flush)
+            event.listen(session, 'after_commit', self._after_commit)
+            event.listen(session, 'after_rollback', self._after_rollback)
+
+    @staticmethod
+    def touch(session: Session, *categories: Hashable):
+        """ bump categories when session commits """
+        session.info.setdefault(_PENDING, set()).update(categories)
+
+    def _after_flush(self, session: Session, flush_context):
+        written = chain(session.new,
+                        session.deleted,
+                        (o for o in session.dirty if session.is_modified(o)))
+        self.touch(session, *{type(o).__table__.name for o in written})
+
+    def _after_commit(self, session: Session):
+        for category in session.info.pop(_PENDING, ()):
+            self.bump(category)
+
+    @staticmethod
+    def _after_rollback(session: Session):
+        session.info.pop(_PENDING, None)
+
+    def etag(self, categories: Iterable[Hashable], *extra) -> str:
+        """ tag of a response depending on categories """
+        window = int(time() // self.ttl) if self.ttl else 0
+        state = repr((self._process,
+                      window,
+                      [(c, self.generation(c)) for c in categories],
+                      extra))
+        return hashlib.sha1(state.encode()).hexdigest()[:20]
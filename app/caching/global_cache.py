@@ -6,13 +6,22 @@ from typing import Union
 from typing import cast
 from typing import Any
 from typing import overload
+from typing import Iterator
+from typing import Type
+from typing import TypeVar
 from .caching import is_cache_empty, pass_cache, empty_cache
-from .caching import Cache, _LRUDictionary
+from .caching import bump_generation, put_cache_many
+from .caching import Cache, _LRUDictionary, _TinyLFUDictionary
+from .caching import _TTLDictionary
 from .cache_instance import CacheInstance
+from .shared_cache import SharedCache
+from .timestamp_index import LazyTimestampIndex, TimestampIndex
+from .entries import Entry, entry_columns
+from .entries import ProjectEntry, SpotEntry, DeviceEntry, SpotRecordEntry
+from flask import current_app
 from functools import wraps
 from enum import Enum
 import logging
-from copy import copy
 from datetime import datetime as dt
 from ..models import User
 from ..models import Location
@@ -27,6 +36,7 @@ from ..models import Spot
 from ..models import SpotRecord
 from ..models import Device
 from ..models import Data
+from .. import db
 
 
 logging.basicConfig(level=logging.INFO)
@@ -42,10 +52,13 @@ class ModelDataEnum(Enum):
     _OutdoorRecord = 7
     _OutdoorSpot = 8
     _SpotRecord = 9
+    _SpotRecordTime = 10
+    _MissingDevice = 11
 
 
-GlobalCacheKey = Union[str, int, Tuple[dt, Device]]
-GlobalCache = Cache[ModelDataEnum, GlobalCacheKey, Data]
+GlobalCacheKey = Union[str, int, Tuple[dt, int]]
+GlobalCache = Cache[ModelDataEnum, GlobalCacheKey, Entry]
+T = TypeVar('T')
 CacheAllDecorator = Callable[..., Callable]
 
 # expensive !
@@ -76,6 +89,9 @@ def init_global_cache(cache_instance: Optional[CacheInstance]
     if cache_instance is None:
         return None
 
+    if isinstance(cache_instance.global_cache, SharedCache):
+        return init_shared_cache(cache_instance)
+
     if is_cache_empty(cache_instance.global_cache):
 
         logging.info('cache instance is empty, make a new one.')
@@ -92,17 +108,49 @@ def init_global_cache(cache_instance: Optional[CacheInstance]
     return None
 
 
+def init_shared_cache(cache_instance: CacheInstance) -> CacheInstance:
+    """
+    the first worker warms up the shared cache, the others wait for
+    it, then only make their process local indexes, which are loaded
+    lazily.
+    """
+    shared = cast(SharedCache, cache_instance.global_cache)
+    with shared.warm_up_lock():
+        is_warm = shared.is_warm()
+        if not is_warm:
+            logging.info('warming up shared cache.')
+            cache_instance.global_cacheall = make_cacheall(shared)
+            shared.mark_warm()
+
+    if is_warm:
+        logging.info('shared cache is warmed up, attach to it.')
+        cache_instance.global_cacheall = cache_missing_device(
+            cache_spot_record_time(cacheall_decorator))(shared)
+    return cache_instance
+
+
+def _load_entries(entry_type: Type[T],
+                  limit: Optional[int] = None) -> Iterator[T]:
+    """ query only the columns of entries """
+    query = db.session.query(*entry_columns(entry_type))
+    if limit is not None:
+        query = query.limit(limit)
+    for row in query:
+        yield entry_type(*row)
+
+
 def cache_project(f):
     @wraps(f)
     def cache_it(cache: Cache, *args, **kwargs):
 
         cache[ModelDataEnum._Project] = {}
 
-        for v in Project.query.all():
+        for v in _load_entries(ProjectEntry):
             cache[ModelDataEnum._Project][v.project_name] = v
 
-            cache[ModelDataEnum._Project][v.project_id] = copy(v)
+            cache[ModelDataEnum._Project][v.project_id] = v
 
+        bump_generation(cache, ModelDataEnum._Project)
         return f(cache, *args, **kwargs)
     return cache_it
 
@@ -113,10 +161,11 @@ def cache_device(f):
 
         cache[ModelDataEnum._Device] = {}
 
-        for v in Device.query.all():
+        for v in _load_entries(DeviceEntry):
             cache[ModelDataEnum._Device][v.device_name] = v
 
-            cache[ModelDataEnum._Device][v.device_id] = copy(v)
+            cache[ModelDataEnum._Device][v.device_id] = v
+        bump_generation(cache, ModelDataEnum._Device)
         return f(cache, *args, **kwargs)
     return cache_it
 
@@ -127,10 +176,12 @@ def cache_spot(f):
 
         cache[ModelDataEnum._Spot] = {}
 
-        for v in Spot.query.all():
+        # spot images are never loaded.
+        for v in _load_entries(SpotEntry):
             cache[ModelDataEnum._Spot][v.spot_name] = v
 
-            cache[ModelDataEnum._Spot][v.spot_id] = copy(v)
+            cache[ModelDataEnum._Spot][v.spot_id] = v
+        bump_generation(cache, ModelDataEnum._Spot)
         return f(cache, *args, **kwargs)
     return cache_it
 
@@ -141,21 +192,64 @@ def cache_spot_record(f):
     @wraps(f)
     def cache_it(cache: Cache, *args, **kwargs):
         maxsize: int = 50000
+        max_bytes: Optional[int] = current_app.config.get(
+            'SHISANWU_SPOT_RECORD_CACHE_BYTES')
 
+        # scan resistant, an overall update doesn't flush hot records.
         cache[ModelDataEnum._SpotRecord] = cast(
-            _LRUDictionary[dt, Device],
-            _LRUDictionary(maxsize=maxsize))
+            _LRUDictionary[int, SpotRecordEntry],
+            _TinyLFUDictionary(maxsize=maxsize, max_bytes=max_bytes))
 
-        for v in SpotRecord.query.limit(maxsize).all():
-            (
-                cache[ModelDataEnum._SpotRecord]
-                [(v.spot_record_id)]  # cache by id as integer
-            ) = v
+        # cache by id as integer, and by the dedup key.
+        put_cache_many(cache, ModelDataEnum._SpotRecord,
+                       ((k, v)
+                        for v in _load_entries(SpotRecordEntry, maxsize)
+                        for k in (v.spot_record_id,
+                                  (v.spot_record_time, v.device_id))))
 
         return f(cache, *args, **kwargs)
     return cache_it
 
 
+def _record_times(device_id: int) -> Iterator[dt]:
+    """ record times of a device, read from ix_spot_record_device_time """
+    return (t for t, in (db.session
+                         .query(SpotRecord.spot_record_time)
+                         .filter(SpotRecord.device_id == device_id)))
+
+
+def cache_spot_record_time(f):
+    @wraps(f)
+    def cache_it(cache: Cache, *args, **kwargs):
+        index: TimestampIndex
+        if isinstance(cache, SharedCache):
+            # each worker has its own index, don't make all of them
+            # scan the whole table.
+            index = LazyTimestampIndex(_record_times)
+        else:
+            # two columns of the whole table, streamed.
+            keys = (db.session.query(SpotRecord.spot_record_time,
+                                     SpotRecord.device_id)
+                    .filter(SpotRecord.device_id.isnot(None))
+                    .yield_per(10000))
+            index = TimestampIndex(keys)
+        cache[ModelDataEnum._SpotRecordTime] = index
+        bump_generation(cache, ModelDataEnum._SpotRecordTime)
+        return f(cache, *args, **kwargs)
+    return cache_it
+
+
+def cache_missing_device(f):
+    @wraps(f)
+    def cache_it(cache: Cache, *args, **kwargs):
+        # names and ids of devices not in the table, cleared when the
+        # device is added.
+        cache[ModelDataEnum._MissingDevice] = _TTLDictionary(
+            ttl=current_app.config.get('SHISANWU_MISSING_DEVICE_TTL', 120))
+        return f(cache, *args, **kwargs)
+    return cache_it
+
+
 def make_cacheall(cache: Cache) -> Callable:
     """
     return a specialize cache decorator for database types.
@@ -173,24 +267,34 @@ def make_cacheall(cache: Cache) -> Callable:
     """
     logging.info('init caching......')
 
+    # the large spot record table goes first, small tables are loaded
+    # right before the cache is ready so they miss less writes
+    # happened during warm up.
     @pass_cache(cache)
+    @cache_missing_device
+    @cache_spot_record_time
+    @cache_spot_record
     @cache_project
     @cache_device
     @cache_spot
-    @cache_spot_record
     def init_cache(cache: Cache):
-        def _cachall_deco(f):
-            logging.debug(
-                'cache in cachhe decorator: {}'.format(
-                    cache.keys()
-                    if cache is not None
-                    else 'empty')
-            )
-
-            @wraps(f)
-            def _cacheall(cache=cache, *args, **kwargs):
-                return f(cache, *args, **kwargs)
-            return _cacheall
-        return _cachall_deco
+        return cacheall_decorator(cache)
 
     return init_cache(cache)
+
+
+def cacheall_decorator(cache: Cache) -> Callable:
+    """ cache decorator of an already loaded cache """
+    def _cachall_deco(f):
+        logging.debug(
+            'cache in cachhe decorator: {}'.format(
+                cache.keys()
+                if cache is not None
+                else 'empty')
+        )
+
+        @wraps(f)
+        def _cacheall(cache=cache, *args, **kwargs):
+            return f(cache, *args, **kwargs)
+        return _cacheall
+    return _cachall_deco
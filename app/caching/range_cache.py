@@ -0,0 +1,169 @@
+"""
+Result cache of spot record range queries.
+
+Dashboards ask for the same ranges again and again. A range is split
+into time buckets aligned to `bucket` (one day by default), each bucket
+of a device or a spot is queried and serialized once and the response
+is assembled from bucket pieces, so overlapping ranges share them.
+
+Buckets ended before now - min_age are considered immutable and are
+only dropped by LRU eviction or invalidation. Other buckets (the current
+day) expire after `ttl` seconds.
+
+Writes done by ModelOperations mark the buckets of their records with
+`touch`, which are dropped once the session commits. Dropping them
+earlier lets a reader cache the bucket again without the rows still to
+be committed. A bucket loaded while it was dropped is not kept either.
+Moving or deleting a device drops every bucket of its spots at once.
+Workers don't share the cache, in another process a late record of an
+old bucket shows up once the bucket is evicted.
+"""
+from datetime import datetime as dt
+from datetime import timedelta
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .caching import _LRUDictionary
+
+Row = Tuple[dt, Dict]
+Loader = Callable[[dt, dt], List[Row]]
+
+_EPOCH = dt(1970, 1, 1)
+
+_PENDING = 'pending_range_buckets'
+
+
+class RangeCache:
+    """
+    Flask compatible extension, configured by init_app.
+
+    @param bucket:   width of buckets.
+    @param min_age:  buckets ended earlier than this are immutable.
+    @param ttl:      seconds to keep a bucket that may still change.
+    @param maxsize:  max number of buckets.
+    """
+
+    def __init__(self,
+                 bucket: timedelta = timedelta(days=1),
+                 min_age: timedelta = timedelta(hours=1),
+                 ttl: float = 30,
+                 maxsize: int = 5000):
+        self.bucket = bucket
+        self.min_age = min_age
+        self.ttl = ttl
+        self.enabled = True
+        self._buckets: _LRUDictionary = _LRUDictionary(maxsize=maxsize)
+        # bucket key -> token of the latest load in flight.
+        self._loading: Dict[Hashable, object] = {}
+        self._lock = Lock()
+
+    def init_app(self, app: Flask, session):
+        self.enabled = app.config.get('SHISANWU_RANGE_CACHE_ON', True)
+        self.ttl = app.config.get('SHISANWU_RANGE_CACHE_TTL', self.ttl)
+        self._buckets = _LRUDictionary(
+            maxsize=app.config.get('SHISANWU_RANGE_CACHE_BUCKETS', 5000))
+        if not event.contains(session, 'after_commit', self._after_commit):
+            event.listen(session, 'after_commit', self._after_commit)
+            event.listen(session, 'after_rollback', self._after_rollback)
+
+    def bucket_of(self, time: dt) -> dt:
+        return _EPOCH + ((time - _EPOCH) // self.bucket) * self.bucket
+
+    def buckets(self, start: dt, end: dt,
+                include_end: bool = True) -> Iterator[dt]:
+        b = self.bucket_of(start)
+        while b < end or include_end and b == end:
+            yield b
+            b += self.bucket
+
+    def _load(self,
+              key: Hashable,
+              b: dt,
+              loader: Loader,
+              now: dt) -> List[Row]:
+        cached = self._buckets.get(key)
+        if cached is not None:
+            expire, rows = cached
+            if expire is None or expire > monotonic():
+                return rows
+
+        token = object()
+        with self._lock:
+            self._loading[key] = token
+        rows = loader(b, b + self.bucket)
+        immutable = b + self.bucket < now - self.min_age
+        with self._lock:
+            # not kept if invalidated, or loaded again, in the meantime.
+            if self._loading.get(key) is token:
+                del self._loading[key]
+                self._buckets[key] = (
+                    None if immutable else monotonic() + self.ttl, rows)
+        return rows
+
+    def rows(self,
+             scope: str,
+             ident: Hashable,
+             start: dt,
+             end: dt,
+             loader: Loader,
+             include_start: bool = True,
+             include_end: bool = True,
+             now: Optional[dt] = None) -> List[Dict]:
+        """
+        serialized records in [start, end] of a device or a spot.
+
+        @param scope:   what ident is, e.g 'device' or 'spot'.
+        @param loader:  query and serialize records in [b, b + bucket) as
+                        a list of (time, json) ordered by time.
+        """
+        def pieces() -> Iterator[List[Row]]:
+            if not self.enabled:
+                yield loader(start, end + timedelta.resolution)
+                return
+            for b in self.buckets(start, end, include_end):
+                yield self._load((scope, ident, b), b, loader,
+                                 now or dt.now())
+
+        return [row
+                for piece in pieces()
+                for time, row in piece
+                if ((time > start or include_start and time == start)
+                    and (time < end or include_end and time == end))]
+
+    def invalidate(self, scope: str, ident: Hashable,
+                   time: Optional[dt] = None):
+        """
+        drop the bucket a record of time is in, or all buckets of ident
+        without time, e.g when a device moves to another spot.
+        """
+        with self._lock:
+            if time is not None:
+                keys = [(scope, ident, self.bucket_of(time))]
+            else:
+                keys = [key for key in [*self._loading, *self._buckets]
+                        if key[:2] == (scope, ident)]
+            for key in keys:
+                self._loading.pop(key, None)
+                self._buckets.pop(key, None)
+
+    @staticmethod
+    def touch(session: Session, scope: str, ident: Hashable,
+              time: Optional[dt] = None):
+        """ invalidate the bucket, or all of ident, when session commits """
+        session.info.setdefault(_PENDING, set()).add((scope, ident, time))
+
+    def _after_commit(self, session: Session):
+        for scope, ident, time in session.info.pop(_PENDING, ()):
+            self.invalidate(scope, ident, time)
+
+    @staticmethod
+    def _after_rollback(session: Session):
+        session.info.pop(_PENDING, None)
+
+    def stats(self) -> Dict:
+        return self._buckets.stats()
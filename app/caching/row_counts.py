@@ -0,0 +1,149 @@
+"""
+Row counts kept up to date by the session.
+
+Paged apis need the number of rows of a table, or of the rows of a
+table under one parent, e.g spots of a project or records of a device.
+COUNT(*) walks them all on every request. Here a count is queried once,
+then rows flushed as new or deleted are added to or subtracted from it
+when the session commits, so reading it is a dict lookup.
+
+A count whose group changed in other ways (an update moving a device to
+another spot, a bulk write) is dropped and counted again on next read.
+Each key has a version bumped by commits writing it, a count is only
+kept if no commit wrote its key while counting, since the count may or
+may not have seen that commit's rows.
+Counts are kept by each process and expire after `ttl` seconds, so
+writes by other workers and database cascades are picked up.
+"""
+from itertools import chain
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from flask import Flask
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+CountKey = Tuple[Hashable, ...]
+
+_PENDING = 'pending_row_counts'
+
+
+class RowCounts:
+    """
+    Flask compatible extension, configured by init_app.
+
+    @param groups:  columns of a table its rows are counted by, besides
+                    the whole table. e.g {'device': ('spot_id',)} keeps
+                    ('device',) and ('device', 'spot_id', sid) counts.
+    @param ttl:     seconds a count is trusted.
+    """
+
+    def __init__(self,
+                 groups: Optional[Dict[str, Tuple[str, ...]]] = None,
+                 ttl: float = 300):
+        self.groups = groups or {}
+        self.ttl = ttl
+        self._counts: Dict[CountKey, Tuple[int, float]] = {}
+        # commits writing each key, and dropping each whole table.
+        self._versions: Dict[CountKey, int] = {}
+        self._table_versions: Dict[Hashable, int] = {}
+        self._lock = Lock()
+
+    def init_app(self, app: Flask, session):
+        self.ttl = app.config.get('SHISANWU_ROW_COUNT_TTL', self.ttl)
+        if not event.contains(session, 'after_commit', self._after_commit):
+            event.listen(session, 'after_flush', self._after_flush)
+            event.listen(session, 'after_commit', self._after_commit)
+            event.listen(session, 'after_rollback', self._after_rollback)
+
+    def get(self, key: CountKey, count: Callable[[], int]) -> int:
+        """ the count of key, count() is called if it is not known """
+        known = self.peek(key)
+        if known is not None:
+            return known
+        with self._lock:
+            version = self._version(key)
+        n = count()
+        with self._lock:
+            if self._version(key) == version:
+                self._counts[key] = (n, monotonic() + self.ttl)
+        return n
+
+    def _version(self, key: CountKey) -> Tuple[int, int]:
+        return (self._versions.get(key, 0),
+                self._table_versions.get(key[0], 0))
+
+    def peek(self, key: CountKey) -> Optional[int]:
+        """ the count of key if it is known """
+        entry = self._counts.get(key)
+        if entry is None or entry[1] <= monotonic():
+            return None
+        return entry[0]
+
+    def drop(self, session: Session, table: str):
+        """ recount every count of table after session commits """
+        self._pending(session)[(table,)] = None
+
+    #############
+    #  session  #
+    #############
+
+    @staticmethod
+    def _pending(session: Session) -> Dict[CountKey, Optional[int]]:
+        """ delta of each key, None to drop it """
+        return session.info.setdefault(_PENDING, {})
+
+    def _keys(self, table: str, row) -> Iterable[CountKey]:
+        yield (table,)
+        for column in self.groups.get(table, ()):
+            yield (table, column, getattr(row, column))
+
+    def _after_flush(self, session: Session, flush_context):
+        pending = self._pending(session)
+
+        def add(key: CountKey, n: int):
+            if key in pending and pending[key] is None:
+                return
+            pending[key] = pending.get(key, 0) + n
+
+        for row, n in chain(((row, 1) for row in session.new),
+                            ((row, -1) for row in session.deleted)):
+            for key in self._keys(type(row).__table__.name, row):
+                add(key, n)
+
+        for row in session.dirty:
+            table = type(row).__table__.name
+            state = inspect(row)
+            for column in self.groups.get(table, ()):
+                history = state.attrs[column].history
+                if history.has_changes():
+                    for value in chain(history.added, history.deleted):
+                        pending[(table, column, value)] = None
+
+    def _after_commit(self, session: Session):
+        pending = session.info.pop(_PENDING, {})
+        if not pending:
+            return
+        with self._lock:
+            for key, n in pending.items():
+                self._versions[key] = self._versions.get(key, 0) + 1
+                if n is None:
+                    self._drop(key)
+                elif key in self._counts:
+                    count, expire = self._counts[key]
+                    self._counts[key] = (count + n, expire)
+
+    def _drop(self, key: CountKey):
+        """ key and, for a whole table, all of its groups """
+        if len(key) > 1:
+            self._counts.pop(key, None)
+            return
+        table = key[0]
+        self._table_versions[table] = self._table_versions.get(table, 0) + 1
+        for k in [k for k in self._counts if k[0] == key[0]]:
+            del self._counts[k]
+
+    @staticmethod
+    def _after_rollback(session: Session):
+        session.info.pop(_PENDING, None)
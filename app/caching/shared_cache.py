@@ -0,0 +1,455 @@
+"""
+Cache shared by processes on the same host.
+
+Each WSGI worker used to build its own cache from the database, so
+cache memory and warm up time multiply with the number of workers.
+SharedCache keep each category in a mmap backed file (under /dev/shm
+by default) which all workers map into their address space:
+
+    header | slots (open addressing hash table) | data heap
+
+Entries are serialized compactly, ORM instances are stored as their
+column values and come back as detached instances. The heap is append
+only, a category is cleared when its heap or table is full, which works
+as a crude eviction and is logged as a warning. There is no admission
+policy and no byte budget like the TinyLFU categories of a process
+local cache, so a category must be big enough for what it holds: warm
+up sizes each category for twice its rows, or the size configured by
+SHISANWU_SHARED_CACHE_SIZES if larger.
+
+Access is guarded by flock on the category file for other processes,
+plus a thread lock since flock doesn't exclude threads sharing a fd.
+
+SharedCache is a VersionedCache, so get_cache/put_cache/invalidate_cache
+and the warm up decorators work with it unchanged. Generations are kept
+in the file header, a write in one worker is seen by all of them.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import os.path
+import pickle
+import struct
+import time
+from contextlib import contextmanager
+from enum import Enum
+from hashlib import blake2b
+from threading import RLock
+from typing import Dict, Iterator, Optional, Tuple
+
+from .caching import VersionedCache
+
+_MAGIC = b'135CACHE'
+# magic, generation, capacity, used slots, live entries, data end.
+_HEADER = struct.Struct('<8sQIIIQ')
+# key hash, entry offset, entry length.
+_SLOT = struct.Struct('<QII')
+_ENTRY = struct.Struct('<I')   # key length.
+_TOMBSTONE = 1                 # offset of deleted slot.
+_MAX_LOAD = 0.7
+
+# minimum (slots, heap bytes) of each category.
+DEFAULT_SIZE: Tuple[int, int] = (1 << 14, 8 << 20)
+CATEGORY_SIZES: Dict[str, Tuple[int, int]] = {
+    '_SpotRecord': (1 << 18, 128 << 20),
+}
+
+
+##################
+#  Serialization #
+##################
+
+
+def _is_model(value) -> bool:
+    return hasattr(value, '__mapper__') and hasattr(value, '__table__')
+
+
+def _model_row(value) -> Tuple[str, Dict]:
+    from sqlalchemy import inspect
+    return (type(value).__name__,
+            {c.key: getattr(value, c.key)
+             for c in inspect(value).mapper.column_attrs})
+
+
+def _model_from_row(name: str, row: Dict):
+    """ rebuild a detached instance without calling __init__ """
+    from .. import models
+    cls = getattr(models, name)
+    instance = cls.__mapper__.class_manager.new_instance()
+    for k, v in row.items():
+        setattr(instance, k, v)
+    return instance
+
+
+def _normalize_key(key):
+    """ ORM instances in key are replaced by (class name, primary key) """
+    if isinstance(key, tuple):
+        return tuple(_normalize_key(k) for k in key)
+    if _is_model(key):
+        from sqlalchemy import inspect
+        return (type(key).__name__,) + tuple(inspect(key).identity or ())
+    return key
+
+
+def encode_key(key) -> bytes:
+    return pickle.dumps(_normalize_key(key), protocol=4)
+
+
+def encode_value(value) -> bytes:
+    if _is_model(value):
+        return pickle.dumps(('m',) + _model_row(value), protocol=4)
+    return pickle.dumps(('v', value), protocol=4)
+
+
+def decode_value(data: bytes):
+    tag, *payload = pickle.loads(data)
+    if tag == 'm':
+        return _model_from_row(*payload)
+    return payload[0]
+
+
+def _hash(key: bytes) -> int:
+    h = int.from_bytes(blake2b(key, digest_size=8).digest(), 'little')
+    return h or 1  # 0 marks empty slot.
+
+
+def master_token() -> str:
+    """
+    parent (master) pid and its start time. A pid alone can be reused by
+    a later run and match its stale warm marker.
+    """
+    ppid = os.getppid()
+    try:
+        with open(f'/proc/{ppid}/stat') as f:
+            # the command in parentheses may contain spaces, the start
+            # time is the 20th field after it.
+            started = f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        # no procfs, the marker is only reused by this boot.
+        started = str(int(time.time() - time.monotonic()))
+    return f'{ppid}-{started}'
+
+
+###############
+#  Category   #
+###############
+
+
+class SharedCategory:
+    """
+    One cache category in a mmap file. Behaves like a small dict.
+    An existing file keeps the size it was created with, capacity and
+    heap only apply to a new one.
+    """
+
+    def __init__(self, path: str, capacity: int, heap: int):
+        self._path = path
+        self._tlock = RLock()
+        self._slots_start = _HEADER.size
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked(exclusive=True):
+            header = os.pread(self._fd, _HEADER.size, 0)
+            created = (len(header) < _HEADER.size
+                       or _HEADER.unpack(header)[0] != _MAGIC)
+            if created:
+                size = self._slots_start + capacity * _SLOT.size + heap
+                os.ftruncate(self._fd, size)
+            else:
+                capacity = _HEADER.unpack(header)[2]
+                size = os.fstat(self._fd).st_size
+            self._capacity = capacity
+            self._heap_start = self._slots_start + capacity * _SLOT.size
+            self._mm = mmap.mmap(self._fd, size)
+            if created:
+                self._reset(generation=0)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """ (slots, heap bytes) """
+        return self._capacity, len(self._mm) - self._heap_start
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._tlock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive
+                        else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        with self._tlock:
+            self._mm.close()
+            os.close(self._fd)
+
+    # header helpers, caller holds the lock.
+    def _header(self):
+        return _HEADER.unpack_from(self._mm, 0)
+
+    def _set_header(self, generation, used, live, data_end):
+        _HEADER.pack_into(self._mm, 0, _MAGIC, generation,
+                          self._capacity, used, live, data_end)
+
+    def _reset(self, generation: int):
+        self._mm[self._slots_start:self._heap_start] = \
+            bytes(self._heap_start - self._slots_start)
+        self._set_header(generation, 0, 0, self._heap_start)
+
+    def _slot(self, i: int) -> Tuple[int, int, int]:
+        return _SLOT.unpack_from(self._mm, self._slots_start + i * _SLOT.size)
+
+    def _set_slot(self, i: int, h: int, offset: int, length: int):
+        _SLOT.pack_into(self._mm, self._slots_start + i * _SLOT.size,
+                        h, offset, length)
+
+    def _entry(self, offset: int, length: int) -> Tuple[bytes, bytes]:
+        (klen,) = _ENTRY.unpack_from(self._mm, offset)
+        start = offset + _ENTRY.size
+        return (self._mm[start:start + klen],
+                self._mm[start + klen:offset + length])
+
+    def _find(self, key: bytes, h: int) -> Tuple[Optional[int], int]:
+        """ return (slot of the key, first free slot) """
+        free = -1
+        i = h % self._capacity
+        for _ in range(self._capacity):
+            sh, offset, length = self._slot(i)
+            if offset == 0:
+                return None, (free if free >= 0 else i)
+            if offset == _TOMBSTONE:
+                if free < 0:
+                    free = i
+            elif sh == h and self._entry(offset, length)[0] == key:
+                return i, free
+            i = (i + 1) % self._capacity
+        return None, free
+
+    # dict like interface.
+    def get(self, key, default=None):
+        k = encode_key(key)
+        with self._locked(exclusive=False):
+            i, _ = self._find(k, _hash(k))
+            if i is None:
+                return default
+            _, offset, length = self._slot(i)
+            data = self._entry(offset, length)[1]
+        return decode_value(data)
+
+    def __getitem__(self, key):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        k = encode_key(key)
+        with self._locked(exclusive=False):
+            return self._find(k, _hash(k))[0] is not None
+
+    def __setitem__(self, key, value):
+        k, v = encode_key(key), encode_value(value)
+        entry = _ENTRY.pack(len(k)) + k + v
+        h = _hash(k)
+        size = len(self._mm)
+        if self._heap_start + len(entry) > size:
+            return  # never fits, don't cache it.
+
+        with self._locked(exclusive=True):
+            generation, _, used, live, data_end = self._header()[1:]
+            if (data_end + len(entry) > size
+                    or used + 1 > self._capacity * _MAX_LOAD):
+                logging.warning('shared cache %s is full (%d entries), '
+                                'cleared', self._path, live)
+                self._reset(generation)
+                generation, _, used, live, data_end = self._header()[1:]
+
+            i, free = self._find(k, h)
+            if i is None:
+                i = free
+                if self._slot(i)[1] != _TOMBSTONE:
+                    used += 1
+                live += 1
+            self._mm[data_end:data_end + len(entry)] = entry
+            self._set_slot(i, h, data_end, len(entry))
+            self._set_header(generation, used, live, data_end + len(entry))
+
+    def pop(self, key, default=None):
+        k = encode_key(key)
+        with self._locked(exclusive=True):
+            i, _ = self._find(k, _hash(k))
+            if i is None:
+                return default
+            _, offset, length = self._slot(i)
+            data = self._entry(offset, length)[1]
+            generation, _, used, live, data_end = self._header()[1:]
+            self._set_slot(i, 0, _TOMBSTONE, 0)
+            self._set_header(generation, used, live - 1, data_end)
+        return decode_value(data)
+
+    def __delitem__(self, key):
+        missing = object()
+        if self.pop(key, missing) is missing:
+            raise KeyError(key)
+
+    def clear(self):
+        with self._locked(exclusive=True):
+            self._reset(self._header()[1])
+
+    def __len__(self) -> int:
+        with self._locked(exclusive=False):
+            return self._header()[4]
+
+    @property
+    def generation(self) -> int:
+        with self._locked(exclusive=False):
+            return self._header()[1]
+
+    def bump(self) -> int:
+        with self._locked(exclusive=True):
+            generation, _, used, live, data_end = self._header()[1:]
+            self._set_header(generation + 1, used, live, data_end)
+            return generation + 1
+
+
+###########
+#  Cache  #
+###########
+
+
+class SharedCache(VersionedCache):
+    """
+    Categories are opened lazily, a category written by another worker
+    is picked up the first time it is accessed.
+
+    @param path:   directory of category files, /dev/shm is preferred.
+    @param token:  identify the deployment. Workers with the same token
+                   share the warm up result, a new token (e.g a restarted
+                   master process) triggers a new warm up.
+    @param sizes:  minimum (slots, heap bytes) by category name.
+    """
+
+    def __init__(self, path: str, token: str,
+                 sizes: Optional[Dict[str, Tuple[int, int]]] = None):
+        super().__init__()
+        self._path = path
+        self._token = token
+        self._sizes = {**CATEGORY_SIZES, **(sizes or {})}
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def _name(category) -> str:
+        return category.name if isinstance(category, Enum) else str(category)
+
+    def _category(self, category, create: bool) -> Optional[SharedCategory]:
+        handle = dict.get(self, category)
+        if handle is None:
+            name = self._name(category)
+            fname = os.path.join(self._path, name)
+            if not create and not os.path.exists(fname):
+                return None
+            handle = SharedCategory(
+                fname, *self._sizes.get(name, DEFAULT_SIZE))
+            dict.__setitem__(self, category, handle)
+        return handle
+
+    def get(self, category, default=None):
+        handle = self._category(category, create=False)
+        return handle if handle is not None else default
+
+    def __getitem__(self, category):
+        handle = self._category(category, create=False)
+        if handle is None:
+            raise KeyError(category)
+        return handle
+
+    def __setitem__(self, category, value):
+        """ replace the whole category, used by warm up """
+        if getattr(value, 'process_local', False):
+            # e.g indexes, kept by the process that built it.
+            dict.__setitem__(self, category, value)
+            return
+        items = dict(value)
+        size = self._fit(self._name(category), items)
+        handle = self._category(category, create=True)
+        if handle.size != size:
+            # warm up runs before other workers attach, the file can be
+            # made again. Processes of an old deployment keep the old one.
+            fname = os.path.join(self._path, self._name(category))
+            handle.close()
+            os.unlink(fname)
+            handle = SharedCategory(fname, *size)
+            dict.__setitem__(self, category, handle)
+        handle.clear()
+        for k, v in items.items():
+            handle[k] = v
+
+    def _fit(self, name: str, items: Dict) -> Tuple[int, int]:
+        """
+        size of a category for twice the rows loaded at warm up, so it
+        isn't cleared by the first writes. Never below the configured size.
+        """
+        slots, heap = self._sizes.get(name, DEFAULT_SIZE)
+        data = sum(_ENTRY.size + len(encode_key(k)) + len(encode_value(v))
+                   for k, v in items.items())
+        return (max(slots, int(2 * len(items) / _MAX_LOAD) + 1),
+                max(heap, 2 * data))
+
+    def setdefault(self, category, default=None):
+        return self._category(category, create=True)
+
+    def generation(self, category) -> int:
+        handle = self._category(category, create=False)
+        if handle is None:
+            return 0
+        if not isinstance(handle, SharedCategory):
+            return super().generation(category)
+        return handle.generation
+
+    def bump(self, category) -> int:
+        handle = self._category(category, create=True)
+        if not isinstance(handle, SharedCategory):
+            return super().bump(category)
+        return handle.bump()
+
+    def is_fresh(self, category, generation: int) -> bool:
+        return self.generation(category) == generation
+
+    ############
+    #  warm up #
+    ############
+
+    @contextmanager
+    def warm_up_lock(self) -> Iterator[None]:
+        """ only one worker warms the cache up, others wait for it """
+        fd = os.open(os.path.join(self._path, 'warm_up.lock'),
+                     os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def is_warm(self) -> bool:
+        try:
+            with open(os.path.join(self._path, 'warm'), 'r') as f:
+                return f.read() == self._token
+        except OSError:
+            return False
+
+    def mark_warm(self) -> None:
+        with open(os.path.join(self._path, 'warm'), 'w') as f:
+            f.write(self._token)
+
+    def close(self):
+        for handle in dict.values(self):
+            if isinstance(handle, SharedCategory):
+                handle.close()
+        dict.clear(self)
+
+    def __repr__(self) -> str:
+        return '<SharedCache {} {}>'.format(self._path, list(self.keys()))
@@ -0,0 +1,158 @@
+"""
+Per device index of spot record timestamps for ingest dedup.
+
+A record is identified by (spot_record_time, device_id). For each device
+the index keeps a sorted int64 array of record times in seconds, "is
+this reading new" is a bisect on a few kilobytes of memory instead of a
+database query. Readings mostly come in time order so insertion is
+usually an append.
+
+A key in the index is in the database. A key not in it is most likely
+new, but other workers, or writes done while the index was scanned, add
+records this index never sees. The unique index on (device_id,
+spot_record_time) catches those when a miss is inserted. The index is
+kept in the process doing the ingest, it's not shared among workers.
+Workers sharing a cache use LazyTimestampIndex, which loads a device
+when it is first asked for instead of scanning the table.
+
+It follows the part of the dict interface the cache functions use,
+keys are (datetime, device_id) and values are always True, so it can be
+a cache category and be updated by put_cache/invalidate_cache.
+"""
+from array import array
+from bisect import bisect_left
+from calendar import timegm
+from collections import OrderedDict, defaultdict
+from datetime import datetime as dt
+from threading import Lock
+from typing import Callable, DefaultDict, Iterable, Optional, Tuple
+
+IndexKey = Tuple[dt, int]
+
+
+def _seconds(time: dt) -> int:
+    return timegm(time.timetuple())
+
+
+class TimestampIndex:
+    # keep it out of shared memory, see SharedCache.
+    process_local = True
+
+    def __init__(self, keys: Iterable[IndexKey] = ()):
+        self._times: DefaultDict[int, array] = defaultdict(
+            lambda: array('q'))
+        self._lock = Lock()
+        self._size = 0
+        self.build(keys)
+
+    def build(self, keys: Iterable[IndexKey]):
+        """ bulk load, sort once for each device at the end """
+        loaded: DefaultDict[int, array] = defaultdict(lambda: array('q'))
+        for time, device_id in keys:
+            loaded[device_id].append(_seconds(time))
+
+        with self._lock:
+            for device_id, times in loaded.items():
+                old = self._times.get(device_id, array('q'))
+                merged = array('q', sorted(set(old).union(times)))
+                self._size += len(merged) - len(old)
+                self._times[device_id] = merged
+
+    @staticmethod
+    def _find(times: array, t: int) -> Tuple[int, bool]:
+        i = bisect_left(times, t)
+        return i, i < len(times) and times[i] == t
+
+    def __contains__(self, key) -> bool:
+        time, device_id = key
+        with self._lock:
+            times = self._times.get(device_id)
+            return times is not None and self._find(times, _seconds(time))[1]
+
+    def get(self, key: IndexKey, default=None) -> Optional[bool]:
+        return True if key in self else default
+
+    def _writable(self, device_id: int) -> Optional[array]:
+        """ times of a device to add to, caller holds the lock """
+        return self._times[device_id]
+
+    def add(self, key: IndexKey):
+        time, device_id = key
+        t = _seconds(time)
+        with self._lock:
+            times = self._writable(device_id)
+            if times is None:
+                return
+            if not times or times[-1] < t:
+                times.append(t)  # in order, the common case.
+            else:
+                i, found = self._find(times, t)
+                if found:
+                    return
+                times.insert(i, t)
+            self._size += 1
+
+    def __setitem__(self, key: IndexKey, value):
+        self.add(key)
+
+    def pop(self, key: IndexKey, default=None) -> Optional[bool]:
+        time, device_id = key
+        with self._lock:
+            times = self._times.get(device_id)
+            if times is None:
+                return default
+            i, found = self._find(times, _seconds(time))
+            if not found:
+                return default
+            del times[i]
+            self._size -= 1
+            return True
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class LazyTimestampIndex(TimestampIndex):
+    """
+    Times of a device are loaded by `load(device_id)` the first time the
+    device is asked for. At most `max_size` times are kept, devices used
+    least recently are dropped first and loaded again when needed.
+
+    Adding to a device not loaded is a no op, the record is in the
+    database by the time the device is loaded.
+    """
+
+    def __init__(self,
+                 load: Callable[[int], Iterable[dt]],
+                 max_size: int = 1 << 22):
+        super().__init__()
+        self._load = load
+        self.max_size = max_size
+        self._times: 'OrderedDict[int, array]' = OrderedDict()
+
+    def _device(self, device_id: int) -> array:
+        with self._lock:
+            times = self._times.get(device_id)
+            if times is not None:
+                self._times.move_to_end(device_id)
+                return times
+
+        loaded = array('q', sorted({_seconds(t)
+                                    for t in self._load(device_id)}))
+        with self._lock:
+            times = self._times.setdefault(device_id, loaded)
+            if times is loaded:
+                self._size += len(loaded)
+                while self._size > self.max_size and len(self._times) > 1:
+                    _, dropped = self._times.popitem(last=False)
+                    self._size -= len(dropped)
+            return times
+
+    def __contains__(self, key) -> bool:
+        time, device_id = key
+        times = self._device(device_id)
+        with self._lock:
+            return self._find(times, _seconds(time))[1]
+
+    def _writable(self, device_id: int) -> Optional[array]:
+        return self._times.get(device_id)
@@ -94,6 +94,29 @@ attrs: Dict = {
     'ac_power2': '32'
 }
 
+# aid query string when the attributes of a device are unknown.
+default_aids: str = '1,2,3,4,32,155'
+
+
+def known_attr_ids(attr_results: Optional[List[AttrResult]]) -> List[str]:
+    """
+    pick attribute ids we know how to parse from a `get_device_attrs`
+    response. result is sorted so the same device always produce the
+    same query string.
+    """
+    if not attr_results:
+        return []
+    known = set(attrs.values())
+    ids = set()
+    for attr in attr_results:
+        if not isinstance(attr, dict):
+            continue
+        aid = next((attr.get(k) for k in ('id', 'attrId', 'aid')
+                    if attr.get(k) is not None), None)
+        if aid is not None and str(aid) in known:
+            ids.add(str(aid))
+    return sorted(ids, key=int)
+
 
 @connection_exception
 def get_token(auth: AuthData, timestamp: Optional[int] = None) \
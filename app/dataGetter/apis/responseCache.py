@@ -0,0 +1,177 @@
+"""
+Content addressed disk cache for vendor responses.
+
+A query window that ended long ago never changes on the server side,
+so there is no point to download it again for each overall update or
+db_init run. Responses of such windows are stored gzip compressed under
+the sha256 of (endpoint, normalized params).
+
+The store has a size cap. Least recently used entries are evicted when
+the cap is exceeded, the use order survives restart via file mtime.
+"""
+import gzip
+import json
+import os
+import os.path
+from collections import OrderedDict
+from datetime import datetime as dt
+from datetime import timedelta
+from hashlib import sha256
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from logger import make_logger
+
+logger = make_logger('responseCache', 'dataGetter_log')
+logger.propagate = False
+
+T = TypeVar('T')
+_SUFFIX = '.json.gz'
+
+
+def normalize_params(params: Dict) -> Dict:
+    """
+    drop empty values and sort lists of attributes so the same
+    query always hash to the same key.
+    """
+    def norm(v):
+        if isinstance(v, list) and all(isinstance(i, str) for i in v):
+            return sorted(v)
+        return v
+    return {k: norm(v) for k, v in params.items() if v is not None}
+
+
+def make_key(endpoint: str, params: Dict) -> str:
+    payload = json.dumps({'endpoint': endpoint,
+                          'params': normalize_params(params)},
+                         sort_keys=True, default=str)
+    return sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    @param path:       directory of the store.
+    @param max_bytes:  size cap of compressed entries.
+    @param min_age:    only windows ended earlier than now - min_age
+                       are considered immutable and get cached.
+    """
+
+    def __init__(self, path: str, max_bytes: int, min_age: timedelta):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._min_age = min_age
+        self._lock = Lock()
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self._path, key[:2], key + _SUFFIX)
+
+    def _load_index(self):
+        """ rebuild lru order from mtime of entries on disk """
+        os.makedirs(self._path, exist_ok=True)
+        found = []
+        for root, _, files in os.walk(self._path):
+            for name in files:
+                if not name.endswith(_SUFFIX):
+                    continue
+                st = os.stat(os.path.join(root, name))
+                found.append((st.st_mtime, name[:-len(_SUFFIX)], st.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    def is_immutable(self, window_end: Optional[dt], now: dt) -> bool:
+        return window_end is not None and window_end < now - self._min_age
+
+    def get(self, endpoint: str, params: Dict) -> Optional[Any]:
+        key = make_key(endpoint, params)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with gzip.open(self._file(key), 'rt') as f:
+                value = json.load(f)
+            os.utime(self._file(key))
+        except (OSError, ValueError) as e:
+            logger.warning('broken cache entry %s: %s', key, e)
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, endpoint: str, params: Dict, value: Any) -> None:
+        key = make_key(endpoint, params)
+        path = self._file(key)
+        tmp = path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(tmp, 'wt') as f:
+                json.dump(value, f)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning('failed to cache response %s: %s', key, e)
+            return
+
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def fetch(self,
+              endpoint: str,
+              params: Dict,
+              window_end: Optional[dt],
+              now: dt,
+              getter: Callable[[], Optional[T]],
+              ok: Callable[[T], bool] = lambda _: True) -> Optional[T]:
+        """
+        serve the response from disk if the window is immutable,
+        otherwise call getter. Failed request (None), or a response
+        ok() rejects e.g an error body, is never cached.
+        """
+        if not self.is_immutable(window_end, now):
+            return getter()
+
+        cached = self.get(endpoint, params)
+        if cached is not None:
+            return cached
+
+        value = getter()
+        if value is not None and ok(value):
+            self.put(endpoint, params, value)
+        return value
+
+    def _remove(self, key: str):
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """ caller should hold the lock """
+        while self._size > self._max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._file(key))
+            except OSError:
+                pass
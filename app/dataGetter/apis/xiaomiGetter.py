@@ -240,9 +240,9 @@ def get_token(auth: AuthData,
               refresh: Optional[TokenResult] = None) -> Optional[TokenResult]:
     """
     return token with given auth code
-    if refresh token is passed, it is then used to retreive new token.
+    if refresh token is passed, it is then used to retreive new token,
+    which skips the login page round trip of _get_auth_code.
     """
-    # TODO refresh
     def _auth_refresh_token_params(params: Dict, token: TokenResult) -> Dict:
         """ return auth data for refreshing token """
         newparams = dict(**params)
@@ -260,25 +260,26 @@ def get_token(auth: AuthData,
         'appId', 'appKey', 'redirect_uri', 'auth_base_url',
         'token_url', 'grant_type', 'state')(auth)
 
-    authcode: Optional[str] = _get_auth_code(auth)
-    if not authcode:
-        logger.error('authcode is None')
-        return None
-
     # construct request
     url: str = urllib.parse.urljoin(auth_base_url, token_url)
     params: Dict = {'client_id': client_id,
                     'client_secret': client_secret,
                     'redirect_uri': redirect_uri,
                     'grant_type': grant_type,
-                    'code': authcode,
                     'state': state}
-    if refresh is not None:
+
+    if refresh is not None and refresh.get('refresh_token'):
         params = _auth_refresh_token_params(params, refresh)
+    else:
+        authcode: Optional[str] = _get_auth_code(auth)
+        if not authcode:
+            logger.error('authcode is None')
+            return None
+        params['code'] = authcode
 
     response: requests.Response = requests.post(url, data=params)
     if response.status_code != 200:
-        logger.error('error response %s', response.content,
+        logger.error('error response %s %s', response.content,
                      response.request.body)
         return None
     return response.json()
@@ -410,14 +411,25 @@ def get_hist_resource(auth: AuthData,
     if response.status_code != 200:
         logger.error('error response %s', response)
         return None
-    return response.json()['result']
+
+    rj = response.json()
+    # code 0 is success, error bodies come with 200 too.
+    if rj.get('code', 0) != 0:
+        logger.error('error return code: %s %s', rj, params)
+        return None
+    return rj.get('result')
 
 
 @connection_exception
 def get_resource(auth: AuthData,
                  token: Optional[TokenResult],
-                 params: List[ResourceParam_light]) -> Optional[ResourceData]:
-    """ Notice this function use /open/resource/history/query """
+                 params: List[ResourceParam_light]
+                 ) -> Optional[ResourceDataList]:
+    """
+    Notice this function use /open/resource/query
+    It returns the latest value of each attr, multiple devices can be
+    queried in one request.
+    """
 
     api_query_base_url, api_query_resource_url = \
         itemgetter('api_query_base_url',
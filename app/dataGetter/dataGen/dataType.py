@@ -183,6 +183,15 @@ class SpotData(ABC):
         value returned are used to fill `spot_record` table in database schema.
         """
 
+    def spot_record_latest(self, device_names: List[str],
+                           batch_size: int) -> RecordThunkIter:
+        """
+        Get the latest spot records of given devices, batch_size devices
+        per request. Only implemented by sources support batched query.
+        """
+        logger.warning('%s latest value query is not supported', self)
+        return iter([])
+
     @abstractmethod
     def device(self) -> Optional[Generator]:
         """
@@ -4,6 +4,7 @@ These are intermidiate data structrues Datatype returned by midware.
 These data will be further piped into DBRecorder module to finally into db.
 """
 
+import os.path
 from flask import Flask
 from datetime import datetime as dt
 from datetime import timedelta
@@ -30,6 +31,7 @@ from app.dataGetter.apis.jianyanyuanGetter import DataPointParam
 from app.dataGetter.apis.jianyanyuanGetter import DataPointResult
 from app.dataGetter.apis.jianyanyuanGetter import DeviceParam as JdevParam
 from app.dataGetter.apis.jianyanyuanGetter import DeviceResult as JdevResult
+from app.dataGetter.apis.responseCache import ResponseCache
 from app.dataGetter.dataGen.dataType import Device
 from app.dataGetter.dataGen.dataType import Location
 from app.dataGetter.dataGen.dataType import Spot
@@ -72,6 +74,11 @@ class JianYanYuanData(SpotData):
             lambda: jGetter.get_token(self.auth, currentTimestamp(13)),
             JianYanYuanData.expires_in)
         self.tokenManager.start()
+        self.responseCache = ResponseCache(
+            os.path.join(app.config['SHISANWU_RESPONSE_CACHE_DIR'],
+                         'jianyanyuan'),
+            app.config['SHISANWU_RESPONSE_CACHE_MAX_BYTES'],
+            timedelta(seconds=app.config['SHISANWU_RESPONSE_CACHE_MIN_AGE']))
 
         # data within this date will be collected.
         if datetime_range is not None:
@@ -82,11 +89,42 @@ class JianYanYuanData(SpotData):
                          SpotData.token_fetch_error_msg)
             raise ConnectionError(self.source, SpotData.token_fetch_error_msg)
 
-        self.device_list = self.make_device_list()
+        # gid -> aid query string. refreshed with device list.
+        self.attr_catalog: Dict[str, str] = {}
+        self.device_list: List[JdevResult] = []
+        self.make_device_list()
 
     def make_device_list(self):
-        return jGetter.get_device_list(
+        """ keep the previous list if fetching failed """
+        device_list = jGetter.get_device_list(
             self.auth, self.token, cast(Dict, JianYanYuanData.device_params))
+        if device_list is None:
+            logger.error('%s failed to fetch device list', self.source)
+            return self.device_list
+        self.device_list = device_list
+        self.make_attr_catalog()
+        return device_list
+
+    def make_attr_catalog(self):
+        """
+        Fetch attribute table once for each device group (gid), so
+        datapoint queries only ask for attributes a device really has.
+        Keep the old entry if fetching failed.
+        """
+        if not self.device_list:
+            return
+        gids = {d.get('gid') for d in self.device_list if d.get('gid')}
+        for gid in gids:
+            ids = jGetter.known_attr_ids(
+                jGetter.get_device_attrs(self.auth, self.token, gid))
+            if ids:
+                self.attr_catalog[gid] = ','.join(ids)
+        logger.info('%s attr catalog %s', self.source, self.attr_catalog)
+
+    def aid_of(self, device_result: JdevResult) -> str:
+        """ aid query string for the device, fall back to all attrs """
+        return self.attr_catalog.get(
+            device_result.get('gid'), jGetter.default_aids)
 
     def __del__(self):
         self.tokenManager.close()
@@ -197,7 +235,8 @@ class JianYanYuanData(SpotData):
             device_res = [d for d in self.device_list
                           if d.get("deviceId") == dn].pop()
 
-            param = self._make_datapoint_param(device_res, daterange)
+            param = self._make_datapoint_param(
+                device_res, daterange, self.data.aid_of(device_res))
             if param is None:
                 return iter([])
 
@@ -258,11 +297,20 @@ class JianYanYuanData(SpotData):
             @return: list of query result.
             """
             logger.debug('getting datapoint {}'.format(datapoint_param))
-            # block until token refreshed. Make sure it is a valid token
-            with self.data.tokenManager.valid_token_ctx() as token:
-                res = jGetter.get_data_points(self.auth, token,
-                                              datapoint_param)
-            return res
+
+            def fetch() -> Optional[List[DataPointResult]]:
+                # block until token refreshed. Make sure it is a valid token
+                with self.data.tokenManager.valid_token_ctx() as token:
+                    return jGetter.get_data_points(self.auth, token,
+                                                   datapoint_param)
+
+            # time in datapoint param is generated from utc time.
+            return self.data.responseCache.fetch(
+                'datapoint',
+                cast(Dict, datapoint_param),
+                str_to_datetime(datapoint_param.get('endTime')),
+                dt.utcnow(),
+                fetch)
 
         def _make_datapooint_param_iter(self) \
                 -> Optional[Iterator[DataPointParam]]:
@@ -290,10 +338,11 @@ class JianYanYuanData(SpotData):
                     back7days = date_range_iter(
                         str_to_datetime(create_time),
                         timedelta(days=7))
+                    aid = self.data.aid_of(d)
                     for date_tuple in back7days:
                         param = (JianYanYuanData
                                  ._SpotRecord
-                                 ._make_datapoint_param(d, date_tuple))
+                                 ._make_datapoint_param(d, date_tuple, aid))
                         if param is not None:
                             yield param
 
@@ -307,16 +356,18 @@ class JianYanYuanData(SpotData):
         @ staticmethod
         def _make_datapoint_param(
             device_result: JdevResult,
-            time_range: Optional[Tuple[dt, dt]] = None) \
+            time_range: Optional[Tuple[dt, dt]] = None,
+            aid: Optional[str] = None) \
                 -> Optional[DataPointParam]:
             """
             make query parameter datapoint query.
             DataPoint query parameter format:
                 gid: str
                 did: str
-                aid: int
+                aid: str, "<aid>,<aid>"
                 startTime: str, yyyy-MM-ddTHH:mm:ss
                 endTime: str, yyyy-MM-ddTHH:mm:ss
+            aid defaults to all attributes we know.
             """
             if not device_result:
                 logger.error('no device result')
@@ -328,7 +379,7 @@ class JianYanYuanData(SpotData):
             modifyTime = str_to_datetime(device_result.get('modifyTime'))
 
             def get_aid() -> str:
-                return '1,2,3,4,32,155'
+                return aid if aid else jGetter.default_aids
 
             if not time_range:
                 startTime: Optional[dt] = createTime
@@ -0,0 +1,91 @@
+"""
+Encrypted on-disk token cache.
+
+Token is persisted after each renewal so a restarted server can reuse
+a token that is still valid instead of going through the whole login
+flow again. File content is encrypted with a key derived from the app
+secret, since refresh token is as good as the account password.
+"""
+import base64
+import json
+import os
+import os.path
+import time
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from logger import make_logger
+
+logger = make_logger('tokenStore', 'dataGetter_log')
+logger.propagate = False
+
+
+class TokenStore:
+    """
+    Persist one token per file.
+    Token is stored with the time it was obtained, so the remaining
+    life time can be computed from `expires_in` after a restart.
+    """
+
+    def __init__(self, path: str, secret: str):
+        self._path = path
+        self._fernet = Fernet(
+            base64.urlsafe_b64encode(sha256(secret.encode()).digest()))
+        self._lock = Lock()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def load(self) -> Optional[Dict]:
+        """ return the stored token, None if it is missing or corrupted """
+        if not os.path.exists(self._path):
+            return None
+        try:
+            with self._lock, open(self._path, 'rb') as f:
+                entry = json.loads(self._fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError, OSError) as e:
+            logger.warning('failed to load token cache %s: %s', self._path, e)
+            return None
+
+        token = entry.get('token')
+        if not token:
+            return None
+        # keep obtained time together with the token for remaining().
+        return dict(**token, obtained_at=entry.get('obtained_at', 0))
+
+    def save(self, token: Optional[Dict]) -> None:
+        """ persist token, write into a temp file then replace the old one """
+        if not token:
+            return
+        token = {k: v for k, v in token.items() if k != 'obtained_at'}
+        entry = {'token': token, 'obtained_at': time.time()}
+        tmp = self._path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with self._lock:
+                with open(tmp, 'wb') as f:
+                    f.write(self._fernet.encrypt(json.dumps(entry).encode()))
+                os.chmod(tmp, 0o600)
+                os.replace(tmp, self._path)
+        except OSError as e:
+            logger.warning('failed to save token cache %s: %s', self._path, e)
+
+    def clear(self) -> None:
+        with self._lock:
+            if os.path.exists(self._path):
+                os.remove(self._path)
+
+    @staticmethod
+    def remaining(token: Optional[Dict]) -> float:
+        """ seconds before the token expires. 0 if unknown. """
+        if not token:
+            return 0
+        expires_in = token.get('expires_in')
+        obtained_at = token.get('obtained_at')
+        if expires_in is None or obtained_at is None:
+            return 0
+        return max(0.0, obtained_at + float(expires_in) - time.time())
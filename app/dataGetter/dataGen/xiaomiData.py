@@ -1,3 +1,4 @@
+import os.path
 from flask import Flask
 from datetime import datetime as dt
 from datetime import timedelta
@@ -14,12 +15,15 @@ from logger import make_logger
 from .. import authConfig
 from ..apis import xiaomiGetter as xGetter
 from ..apis.xiaomiGetter import ResourceParam
+from ..apis.xiaomiGetter import ResourceParam_light
 from ..apis.xiaomiGetter import ResourceData
 from ..apis.xiaomiGetter import ResourceResponse
+from ..apis.responseCache import ResponseCache
 from timeutils.time import date_range_iter
 from timeutils.time import str_to_datetime
 from timeutils.time import timestamp_setdigits
 from .tokenManager import TokenManager
+from .tokenStore import TokenStore
 from .dataType import Device
 from .dataType import Location
 from .dataType import Spot
@@ -62,11 +66,20 @@ class XiaoMiData(SpotData):
         self._app = app
         self.device_list: List = []
         self.auth: xGetter.AuthData = authConfig.xauth
+        self.tokenStore = TokenStore(
+            os.path.join(app.config['SHISANWU_TOKEN_CACHE_DIR'],
+                         'xiaomi.token'),
+            app.config['SECRET_KEY'])
         self.tokenManager = TokenManager(
-            lambda: xGetter.get_token(self.auth),
+            self._get_token,
             XiaoMiData.expires_in)
 
         self.tokenManager.start()
+        self.responseCache = ResponseCache(
+            os.path.join(app.config['SHISANWU_RESPONSE_CACHE_DIR'],
+                         'xiaomi'),
+            app.config['SHISANWU_RESPONSE_CACHE_MAX_BYTES'],
+            timedelta(seconds=app.config['SHISANWU_RESPONSE_CACHE_MIN_AGE']))
 
         self.refresh: Optional[str] = None
         self.make_device_list()
@@ -92,6 +105,31 @@ class XiaoMiData(SpotData):
         device_list = response_result
         self.device_amount, self.device_list = device_amount, device_list
 
+    def _get_token(self) -> Optional[xGetter.TokenResult]:
+        """
+        token getter for TokenManager.
+        1. reuse the token on disk if it outlives the next refresh tick.
+           so a restart doesn't need to login again.
+        2. otherwise renew it with refresh token.
+        3. fall back to the full login flow if refresh failed.
+        """
+        cached = self.tokenStore.load()
+        if TokenStore.remaining(cached) > XiaoMiData.expires_in:
+            logger.info('%s reuse cached token', XiaoMiData.source)
+            return cached
+
+        token: Optional[xGetter.TokenResult] = None
+        if cached is not None:
+            token = xGetter.get_token(self.auth, refresh=cached)
+
+        if not token or 'access_token' not in token:
+            logger.info('%s refresh failed, login again', XiaoMiData.source)
+            token = xGetter.get_token(self.auth)
+
+        if token and 'access_token' in token:
+            self.tokenStore.save(token)
+        return token
+
     def __del__(self):
         self.tokenManager.close()
 
@@ -135,6 +173,16 @@ class XiaoMiData(SpotData):
 
         return generator
 
+    def spot_record_latest(self, device_names: List[str],
+                           batch_size: int = 50) -> RecordThunkIter:
+        """
+        latest records of given devices. one request per batch_size
+        devices rather than a history query per device.
+        """
+        if not self.device_list:
+            return iter([])
+        return self._SpotRecord(self).latest(device_names, batch_size)
+
     def device(self) -> Optional[Generator]:
         if not self.device_list:
             return None
@@ -194,6 +242,47 @@ class XiaoMiData(SpotData):
             param_list = list(resource_params)
             return self._gen(param_list)
 
+        def latest(self, device_names: List[str],
+                   batch_size: int) -> RecordThunkIter:
+            """ one thunk per batch of devices """
+            devices = {d.get('did'): d for d in self.device_list}
+            params: List[ResourceParam_light] = [
+                p for p in
+                (self._make_latest_parameter(devices.get(n))
+                 for n in device_names)
+                if p is not None]
+
+            def thunk(batch: List[ResourceParam_light]):
+                def g():
+                    """ SIDE EFFECTFUL """
+                    data = self._latest_resource(batch)
+                    return ((MakeDict.make_spot_record(record, None)
+                             for record in merge_latest_resource(data))
+                            if data is not None
+                            else iter([]))
+                return g
+
+            return (thunk(params[i:i + batch_size])
+                    for i in range(0, len(params), batch_size))
+
+        def _latest_resource(self, params: List[ResourceParam_light]
+                             ) -> Optional[List[ResourceData]]:
+            logger.debug('getting latest resource {}'.format(params))
+            with self.data.tokenManager.valid_token_ctx() as token:
+                return xGetter.get_resource(self.auth, token, params)
+
+        @staticmethod
+        def _make_latest_parameter(
+                device_result: Optional[xGetter.DeviceData]
+        ) -> Optional[ResourceParam_light]:
+            if not device_result:
+                return None
+            did = device_result.get('did')
+            attrs = deviceModels.get(device_result.get('model'))
+            if did is None or not attrs:
+                return None
+            return {'did': did, 'attrs': attrs}
+
         def _gen(self, res_params: List[ResourceParam]) -> RecordThunkIter:
             """
             use map_thunk_iter() in dataType to access the return value.
@@ -222,9 +311,19 @@ class XiaoMiData(SpotData):
         def _resource(self, resource_params) -> Optional[List[ResourceData]]:
             logger.debug('getting resource {}'.format(resource_params))
 
-            with self.data.tokenManager.valid_token_ctx() as token:
-                res: Optional[ResourceResponse] = xGetter.get_hist_resource(
-                    self.auth, token, resource_params)
+            def fetch() -> Optional[ResourceResponse]:
+                with self.data.tokenManager.valid_token_ctx() as token:
+                    return xGetter.get_hist_resource(
+                        self.auth, token, resource_params)
+
+            end_time = resource_params.get('endTime')
+            window_end = (dt.fromtimestamp(int(end_time) / 1000.0)
+                          if end_time else None)
+            # error bodies have no data, replaying them would lose the
+            # window for good.
+            res: Optional[ResourceResponse] = self.data.responseCache.fetch(
+                'history/resource', resource_params, window_end, dt.now(),
+                fetch, ok=lambda r: r.get('data') is not None)
             return res['data'] if res is not None and 'data' in res else None
 
         def _make_resource_parameter_iter(self):
@@ -438,3 +537,20 @@ def trim_resource_data(data: List[ResourceData], param: ResourceParam):
 
     return [{**v, 'time_stamp': int(k), 'did': did}
             for k, v in time_dict.items()]
+
+
+def merge_latest_resource(data: List[ResourceData]):
+    """
+    latest value query return the newest value of each attr, which can
+    be recorded at different time. Merge them into one record per
+    device, stamped with the newest time.
+    """
+    merged: Dict[str, Dict] = {}
+    for d in data:
+        did, t = d.get('did'), d.get('timeStamp')
+        if did is None or t is None:
+            continue
+        record = merged.setdefault(did, {'did': did, 'time_stamp': 0})
+        record[d.get('attr')] = d.get('value')
+        record['time_stamp'] = max(record['time_stamp'], int(t))
+    return list(merged.values())
@@ -29,6 +29,7 @@ from typing import Dict
 from typing import cast
 from typing import NamedTuple
 from typing import Iterator
+from typing import Union
 from datetime import datetime as dt
 from datetime import timedelta
 from copy import deepcopy
@@ -68,6 +69,15 @@ FetchMsg = Tuple[Optional[int],     # did
 ALLMSG = (None, None, None, None)
 
 
+class RealtimeMsg(NamedTuple):
+    """
+    latest value polling for a batch of online devices.
+    device_names are names in our database, which are dids of the source.
+    """
+    device_names: List[str]
+    batch_size: int
+
+
 class ActorExit(Exception):
     pass
 
@@ -154,17 +164,23 @@ class FetchActor(Actor):
         """ periodically fetch new data """
 
         while True:
-            msg: FetchMsg = self.recv()
+            msg = self.recv()
             print("--> Fetech Actro: msg", msg)
-            # if it is a overall update, did and time_range will be
-            # none.
-            # if all parameters of spot_record() are none it will
-            # start a all fetch, which has its own fetching rule
-            # embeded in it's corresponding SpotData implementation.
-            did, chsz, max_threads, time_range = msg
-
             jobs: RecordThunkIter
-            jobs = self.datagen.spot_record(did, time_range)
+
+            if isinstance(msg, RealtimeMsg):
+                # batched latest value query.
+                chsz, max_threads = None, None
+                jobs = self.datagen.spot_record_latest(msg.device_names,
+                                                       msg.batch_size)
+            else:
+                # if it is a overall update, did and time_range will be
+                # none.
+                # if all parameters of spot_record() are none it will
+                # start a all fetch, which has its own fetching rule
+                # embeded in it's corresponding SpotData implementation.
+                did, chsz, max_threads, time_range = cast(FetchMsg, msg)
+                jobs = self.datagen.spot_record(did, time_range)
 
             with self.datagen.app.app_context():
                 """
@@ -201,7 +217,8 @@ class UpdateMsg:
     use DataSource.ALL to update all sources.
     """
 
-    def __init__(self, tag: DataSource, payload: FetchMsg):
+    def __init__(self, tag: DataSource,
+                 payload: Union[FetchMsg, RealtimeMsg]):
         self._tag: DataSource = tag
         self._payload = payload
 
@@ -210,7 +227,7 @@ class UpdateMsg:
         return self._tag
 
     @property
-    def payload(self) -> FetchMsg:
+    def payload(self) -> Union[FetchMsg, RealtimeMsg]:
         return self._payload
 
 
@@ -287,6 +304,8 @@ class UpdateScheduler:
 
     device timer update device each day.
     """
+    # online xiaomi devices polled by one latest value request.
+    xiaomi_realtime_batch: int = 50
 
     def __init__(self, config: Optional[ScheduleTable] = None):
         """ plan schedules based on the config tuple passed in. """
@@ -347,44 +366,62 @@ class UpdateScheduler:
 
     def update_device(self):
         """
-        generate new list, store it into database.
+        generate new list, sync it into database in one transaction.
+        Only devices of sources that returned a device list are set
+        offline when they disappear from the list.
         """
         self.update_actor.xiaomi_actor.datagen.make_device_list()
         self.update_actor.jianyanyuan_actor.datagen.make_device_list()
-        devices = chain(
+        devices = list(chain(
             self.update_actor.xiaomi_actor.datagen.normed_device_list,
-            self.update_actor.jianyanyuan_actor.datagen.normed_device_list)
+            self.update_actor.jianyanyuan_actor.datagen.normed_device_list))
+        sources = {device_source(d.get("device_name") or "")
+                   for d in devices if d is not None} - {DataSource.NONE}
+
         with self.app.app_context():
-            from app.models import Device as MD
-            from app.modelOperations import ModelOperations, commit
-            for device in devices:  # dataType.Device
-                dname = device.get("device_name")
-                if (dname is not None
-                    and
-                    MD.query
-                      .filter(MD.device_name == dname)
-                      .count() == 0):
-                    ModelOperations.Add.add_device(cast(Dict, device))
-                    commit()
+            from app.modelOperations import ModelOperations
+            result = ModelOperations.BatchAdd.sync_device_batch(
+                [cast(Dict, d) for d in devices if d is not None],
+                lambda name: device_source(name) in sources)
+
+        logger.info("device synced, inserted: %d, updated: %d, "
+                    "deactivated: %d",
+                    len(result['inserted']),
+                    len(result['updated']),
+                    len(result['deactivated']))
+        return result
 
     def update_realtime(self):
         """
         Update the newest records from online devices.
 
-        A list of UpdateMsg will be constructed for every update.
-        There're not many online device so the performance is pretty ok.
-        It might be a problem when there're arount thounds of online devices
-        Which is pretty impossible in the near feature.
+        Xiaomi devices are polled with batched latest value queries,
+        one request per `xiaomi_realtime_batch` devices.
+        For other sources a UpdateMsg will be constructed for each device.
         """
         with self.app.app_context():
             from app.models import Device as MD
-            devices = MD.query.filter(MD.online).all()
+            devices = [(d.device_id, d.device_name)
+                       for d in MD.query.filter(MD.online).all()]
+
+        xiaomi_names = [name for _, name in devices
+                        if device_source(name) is DataSource.XIAOMI]
+        if xiaomi_names:
+            self.update_actor.send(
+                UpdateMsg(DataSource.XIAOMI,
+                          RealtimeMsg(xiaomi_names,
+                                      UpdateScheduler.xiaomi_realtime_batch)))
 
         onlines = [
-            UpdateMsg(device_source(d.device_name),
-                      (d.device_id, 20,
+            UpdateMsg(device_source(name),
+                      (did, 20, None,
                        (dt.now() - timedelta(minutes=5), dt.now())))
-            for d in devices]
+            for did, name in devices
+            if device_source(name) is not DataSource.XIAOMI]
 
         for online in onlines:
             self.update_actor.send(online)
+
+        from app import global_cache
+        for category, stats in global_cache.stats().items():
+            logger.info("cache %s: %s", category, stats)
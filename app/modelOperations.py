@@ -16,13 +16,16 @@ from typing import ByteString
 from typing import Callable
 from typing import Dict
 from typing import List
+from typing import Tuple
 from typing import TypeVar
 from typing import Union
 from typing import Optional
+from typing import TypedDict
 from typing import cast
 
-from sqlalchemy import and_, exists
+from sqlalchemy import and_, event, exists
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 
 from app.api_types import ApiResponse
 from app.api_types import ReturnCode
@@ -33,6 +36,11 @@ from utils import spread
 
 from . import db
 from .caching.caching import get_cache
+from .caching.caching import invalidate_cache
+from .caching.caching import put_cache
+from .caching.caching import put_cache_many
+from .caching.entries import SpotRecordEntry, SpotRecordKey
+from .caching.entries import from_entry, to_entry
 from .caching.global_cache import GlobalCache
 from .caching.global_cache import ModelDataEnum
 from .models import ClimateArea
@@ -55,9 +63,16 @@ T = TypeVar('T')
 app = importlib.import_module('app')
 global_cache = app.global_cache
 
-
-# TODO lazy load global_cache.global_cacheall so it is fully initialized.
+# global_cacheall is bound lazily, functions get the cache only after
+# it is warmed up.
 PostData = Dict
+DeviceSyncResult = TypedDict(
+    'DeviceSyncResult',
+    {
+        'inserted': List[str],
+        'updated': List[str],
+        'deactivated': List[str]
+    })
 
 
 @global_cache.global_cacheall
@@ -171,6 +186,16 @@ class ModelInterfaces(ABC):
             return True if stuff get inserted.
             """
 
+        @ staticmethod
+        @ abstractmethod
+        def sync_device_batch(device_data_list: List[PostData],
+                              managed: Callable[[str], bool]
+                              ) -> 'DeviceSyncResult':
+            """
+            sync device table with device lists from data sources.
+            return names of devices changed.
+            """
+
     class Add(ABC):
         """ add data """
         @ staticmethod
@@ -273,6 +298,88 @@ class ModelOperations(ModelInterfaces):
                 return True
             return _add_spot_record_batch(spot_record_data_list)
 
+        @ staticmethod
+        def sync_device_batch(
+                device_data_list: List[PostData],
+                managed: Callable[[str], bool] = lambda _: True
+        ) -> 'DeviceSyncResult':
+            """
+            Diff device lists against the device table by device name
+            and apply the change in a single transaction:
+                new devices are inserted.
+                `online` and `modify_time` of existing devices are updated.
+                devices missing from the lists are set offline if
+                managed(device_name) is True. Devices created by hand
+                should not be managed.
+            """
+            result = DeviceSyncResult(inserted=[], updated=[], deactivated=[])
+
+            incoming: Dict[str, Dict] = {}
+            for device_data in device_data_list:
+                row = ModelOperations._make_device_row(device_data)
+                if row is not None:
+                    incoming[row['device_name']] = row
+
+            existing = {
+                name: (did, online, modify_time)
+                for did, name, online, modify_time in
+                db.session.query(Device.device_id,
+                                 Device.device_name,
+                                 Device.online,
+                                 Device.modify_time)}
+
+            inserts = [row for name, row in incoming.items()
+                       if name not in existing]
+
+            updates = []
+            for name, (did, online, modify_time) in existing.items():
+                row = incoming.get(name)
+                if row is None:
+                    if online and managed(name):
+                        updates.append({'device_id': did, 'online': False})
+                        result['deactivated'].append(name)
+                    continue
+
+                new_online = row['online'] if row['online'] is not None \
+                    else online
+                new_modify_time = row['modify_time'] or modify_time
+                if (new_online, new_modify_time) != (online, modify_time):
+                    updates.append({'device_id': did,
+                                    'online': new_online,
+                                    'modify_time': new_modify_time})
+                    result['updated'].append(name)
+
+            try:
+                if inserts:
+                    db.session.execute(Device.__table__.insert(), inserts)
+                if updates:
+                    db.session.bulk_update_mappings(Device, updates)
+                if inserts or updates:
+                    # bulk writes are not seen by flush.
+                    app.data_generations.touch(db.session, 'device')
+                    app.row_counts.drop(db.session, 'device')
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error! sync_device_batch failed {e}")
+                raise
+
+            result['inserted'] = [row['device_name'] for row in inserts]
+
+            @ global_cache.global_cacheall
+            def _evict(cache: Optional[GlobalCache] = None):
+                if cache is None:
+                    return
+                changed = result['updated'] + result['deactivated']
+                invalidate_cache(cache, ModelDataEnum._Device,
+                                 tuple(changed)
+                                 + tuple(existing[n][0] for n in changed))
+                invalidate_cache(cache, ModelDataEnum._MissingDevice,
+                                 tuple(result['inserted']))
+
+            _evict()
+            return result
+
     class Add(ModelInterfaces.Add):
 
         @ staticmethod
@@ -315,9 +422,11 @@ class ModelOperations(ModelInterfaces):
                     db.session.add(new_project)
 
                     if cache is not None and new_project is not None:
-                        _enum = ModelDataEnum._Project
-                        cache[_enum][new_project.project_name] = new_project
-                        cache[_enum][new_project.project_id] = new_project
+                        db.session.flush()  # entry needs the id.
+                        put_cache(cache, ModelDataEnum._Project,
+                                  (new_project.project_name,
+                                   new_project.project_id),
+                                  to_entry(new_project))
                     return new_project
 
                 return new()
@@ -353,8 +462,10 @@ class ModelOperations(ModelInterfaces):
                     db.session.add(new_spot)
 
                     if cache is not None and new_spot is not None:
-                        _enum = ModelDataEnum._Spot
-                        cache[_enum][new_spot.spot_name] = new_spot
+                        db.session.flush()  # entry needs the id.
+                        put_cache(cache, ModelDataEnum._Spot,
+                                  (new_spot.spot_name, new_spot.spot_id),
+                                  to_entry(new_spot))
                     return new_spot
                 return new()
 
@@ -396,9 +507,14 @@ class ModelOperations(ModelInterfaces):
 
                     # add device into cache if it is not there.
                     if cache is not None and new_device is not None:
-                        _enum = ModelDataEnum._Device
-                        cache[_enum][new_device.device_name] = new_device
-                        cache[_enum][new_device.device_id] = new_device
+                        db.session.flush()  # entry needs the id.
+                        put_cache(cache, ModelDataEnum._Device,
+                                  (new_device.device_name,
+                                   new_device.device_id),
+                                  to_entry(new_device))
+                        invalidate_cache(cache, ModelDataEnum._MissingDevice,
+                                         (new_device.device_name,
+                                          new_device.device_id))
                     return new_device
                 return new()
 
@@ -438,67 +554,69 @@ class ModelOperations(ModelInterfaces):
                 # when have multiple record that refers to device
                 # `device_name_` is prefered since it compatible with
                 # the scheduler.
-                if device_name_ is None:
-                    # query with device id or device name
-                    if isinstance(device_, Device):
-                        device = device_
-
-                    # device id as str for query cache.
-                    elif can_be_int(device_):
-                        if cache is not None:
-                            device = get_cache(
-                                cache,
-                                ModelDataEnum._Device,
-                                int(cast(Union[int, str], device_)))
-                        else:
-                            logger.debug('using database')
-                            device = (
-                                Device.query
-                                .filter_by(device_id=int(cast(Union[int, str],
-                                                              device_)))
-                                      .first())
-                    else:
-                        # there must be a device for spot record.
-                        logger.error(
-                            'spot_record must have a device')
-                        return None
-
-                else:
-                    device = (Device.query
-                              .filter_by(device_name=device_name_)
-                              .first())
+                device = ModelOperations._find_device(
+                    device_, device_name_, cache)
 
                 # change in 2020-01-08
                 # same device and same spot record time means the same record.
                 # skip the record if device is None.
+                if device is None:
+                    return None
 
                 # change in 2020-01-21
                 # generate cache key for records in _LRUDictionary.
 
-                cache_key = ((spot_record_time, device)
+                cache_key = ((spot_record_time, device.device_id)
                              if (spot_record_time is not None
                                  and device is not None)
                              else None)
 
-                if cache is not None and cache_key is not None:
-                    spot_record = (get_cache(
-                        cache,
-                        ModelDataEnum._SpotRecord,
-                        cache_key))
-
-                else:  # find same spot_record expensive.
-                    spot_record = (
+                def query() -> Optional[SpotRecord]:
+                    # find same spot_record expensive.
+                    return (
                         SpotRecord
                         .query
-                        .filter_by(
-                            spot_record_time=spot_record_time)
                         .filter(
                             and_(
                                 SpotRecord.spot_record_time
                                 == spot_record_time,
-                                SpotRecord.device == device))
+                                SpotRecord.device_id
+                                == (device.device_id
+                                    if device is not None else None)))
                         .first())
 
+                # added by this transaction, cached once committed.
+                added = _added_spot_records(db.session)
+
+                # index of known record times. A key in it exists, a key
+                # not in it is inserted right away, the unique index on
+                # (device_id, spot_record_time) rejects the rare record
+                # another worker added meanwhile.
+                index = (cache.get(ModelDataEnum._SpotRecordTime)
+                         if cache is not None else None)
+
+                spot_record: Union[SpotRecord, SpotRecordEntry,
+                                   SpotRecordKey, None] = None
+                insert_now = False
+                if cache_key is not None and cache_key in added:
+                    spot_record = added[cache_key]
+
+                elif index is not None and cache_key is not None:
+                    if cache_key in index:
+                        # the id is only needed by the api, from_entry
+                        # queries it then.
+                        spot_record = (
+                            get_cache(cache, ModelDataEnum._SpotRecord,
+                                      cache_key)
+                            or SpotRecordKey(*cache_key))
+                    else:
+                        insert_now = True
+
+                else:
+                    spot_record = query()
+
+                # callers only check the record exists, the entry is
+                # returned as is rather than loading the row again.
                 if spot_record:
                     logger.debug('record already exists.')
                     return spot_record
@@ -507,14 +625,24 @@ class ModelOperations(ModelInterfaces):
                 def new() -> Optional[SpotRecord]:
                     new_spot_record = ModelOperations._make_spot_reocrd(
                         spot_record_data)
-                    db.session.add(new_spot_record)
-
-                    # add new record into cache.
-                    if (cache_key is not None
-                            and new_spot_record is not None
-                            and cache is not None):
-                        _enum = ModelDataEnum._SpotRecord
-                        cache[_enum][cache_key] = new_spot_record
+                    if new_spot_record is None:
+                        return None
+
+                    if insert_now:
+                        try:
+                            with db.session.begin_nested():
+                                db.session.add(new_spot_record)
+                        except IntegrityError:
+                            logger.debug('record added by another worker.')
+                            return query()
+                    else:
+                        db.session.add(new_spot_record)
+
+                    # cached after commit, see _cache_added_spot_records.
+                    if cache_key is not None and cache is not None:
+                        added[cache_key] = new_spot_record
+                    ModelOperations._invalidate_ranges(
+                        device, spot_record_time)
                     return new_spot_record
                 return new()
 
@@ -646,6 +774,11 @@ class ModelOperations(ModelInterfaces):
                 if project is not None and new_project is not None:
                     project.update(new_project)
                 db.session.merge(project)
+
+                if cache is not None and project is not None:
+                    put_cache(cache, ModelDataEnum._Project,
+                              (project.project_name, project.project_id),
+                              to_entry(project))
                 del new_project
                 return project
 
@@ -667,9 +800,21 @@ class ModelOperations(ModelInterfaces):
                           .first())
 
                 if device is not None and new_device is not None:
+                    old_spot_id = device.spot_id
                     device.update(new_device)
+                    # records of the device now belong to another spot.
+                    if device.spot_id != old_spot_id:
+                        ModelOperations._invalidate_all_ranges(
+                            'spot', old_spot_id)
+                        ModelOperations._invalidate_all_ranges(
+                            'spot', device.spot_id)
 
                 db.session.merge(device)
+
+                if cache is not None and device is not None:
+                    put_cache(cache, ModelDataEnum._Device,
+                              (device.device_name, device.device_id),
+                              to_entry(device))
                 del new_device
                 return device
 
@@ -701,64 +846,60 @@ class ModelOperations(ModelInterfaces):
                 # `device_name_` is prefered since it compatible with
                 # the scheduler.
                 device: Optional[Device]
-                if device_name_ is None:
-                    # query with device id or device name
-                    if isinstance(device_, Device):
-                        device = device_
-
-                    # device id as str for query cache.
-                    elif can_be_int(device_):
-                        if cache is not None:
-                            device = get_cache(
-                                cache,
-                                ModelDataEnum._Device,
-                                int(cast(Union[int, str], device_)))
-                        else:
-                            logger.debug('using database')
-                            device = (
-                                Device.query
-                                .filter_by(device_id=int(cast(Union[int, str],
-                                                              device_)))
-                                      .first())
-                    else:
-                        # there must be a device for spot record.
-                        logger.error(
-                            'spot_record must have a device')
-                        return None
-
-                else:
-                    device = (Device.query
-                              .filter_by(device_name=device_name_)
-                              .first())
+                device = ModelOperations._find_device(
+                    device_, device_name_, cache)
+                if device is None:
+                    return None
 
-                cache_key = ((spot_record_time, device)
+                cache_key = ((spot_record_time, device.device_id)
                              if (spot_record_time is not None
                                  and device is not None)
                              else None)
 
                 # search in cache.
+                spot_record = None
                 if cache is not None and cache_key is not None:
                     spot_record = (get_cache(
                         cache,
                         ModelDataEnum._SpotRecord,
                         cache_key))
-                else:
+
+                # not cached, or evicted.
+                if spot_record is None:
                     spot_record = (
                         SpotRecord
                         .query
-                        .filter_by(spot_record_time=spot_record_time)
                         .filter(
                             and_(
                                 SpotRecord.spot_record_time
                                 == spot_record_time,
-                                SpotRecord.device == device))
+                                SpotRecord.device_id
+                                == (device.device_id
+                                    if device is not None else None)))
                         .first())
 
                 new_spot_record = ModelOperations._make_spot_reocrd(
                     spot_record_data)
 
+                if cache is not None and spot_record is not None:
+                    # record time can change, drop the old dedup key.
+                    invalidate_cache(cache, ModelDataEnum._SpotRecord,
+                                     (cache_key, spot_record.spot_record_id))
+                    invalidate_cache(cache, ModelDataEnum._SpotRecordTime,
+                                     (cache_key,))
+                    spot_record = from_entry(spot_record)
+
                 if spot_record is not None and new_spot_record is not None:
+                    ModelOperations._invalidate_ranges(
+                        device, spot_record.spot_record_time)
                     spot_record.update(new_spot_record)
+                    ModelOperations._invalidate_ranges(
+                        device, spot_record.spot_record_time)
+
+                if cache is not None and spot_record is not None:
+                    put_cache(cache, ModelDataEnum._SpotRecordTime,
+                              ((spot_record.spot_record_time,
+                                spot_record.device_id),), True)
 
                 db.session.merge(spot_record)
                 del new_spot_record
@@ -779,6 +920,11 @@ class ModelOperations(ModelInterfaces):
 
                 new_spot = ModelOperations._make_spot(spot_data)
 
+                if cache is not None and spot is not None:
+                    # spot name can change, drop the old key.
+                    invalidate_cache(cache, ModelDataEnum._Spot,
+                                     (spot.spot_name,))
+
                 if spot is not None and new_spot is not None:
                     spot.update(new_spot)
 
@@ -793,6 +939,10 @@ class ModelOperations(ModelInterfaces):
 
                 db.session.merge(spot)
                 del new_spot
+
+                if cache is not None and spot is not None:
+                    put_cache(cache, ModelDataEnum._Spot,
+                              (spot.spot_name, spot.spot_id), to_entry(spot))
                 # db.session.delete(new_spot)
                 return spot
 
@@ -826,89 +976,141 @@ class ModelOperations(ModelInterfaces):
             return _update_outdoor_spot()
 
     class Delete(ModelInterfaces.Delete):
+        """
+        Deleted instances are also evicted from the cache.
+        """
+
         @ staticmethod
         def delete_project(pid: int) -> None:
-            project = Project.query.filter_by(project_id=pid).first()
-            project_details = (ProjectDetail
-                               .query
-                               .filter_by(project_id=pid)
-                               .all())
-
-            companies = [
-                p for p in
-                [project.tech_support_company,
-                 project.construction_company,
-                 project.project_company]
-                if p is not None
-            ]
-
-            try:
-                if (project_details):
-                    for pd in project_details:
-                        db.session.delete(pd)
-
-                for c in companies:
-                    db.session.delete(c)
-
-                if project:
-                    db.session.delete(project)
 
-            except IntegrityError as e:
-                msg = f"Error happened when deleting project: {e}"
-                logger.error(msg)
-                raise
-            except Exception as e:
-                msg = f'Error when deleting by delete_project: {e}'
-                logger.error(msg)
-                raise
+            @ global_cache.global_cacheall
+            def _delete_project(cache: Optional[GlobalCache] = None):
+                project = Project.query.filter_by(project_id=pid).first()
+                project_details = (ProjectDetail
+                                   .query
+                                   .filter_by(project_id=pid)
+                                   .all())
+
+                companies = [
+                    p for p in
+                    [project.tech_support_company,
+                     project.construction_company,
+                     project.project_company]
+                    if p is not None
+                ]
+
+                try:
+                    if (project_details):
+                        for pd in project_details:
+                            db.session.delete(pd)
+
+                    for c in companies:
+                        db.session.delete(c)
+
+                    if project:
+                        db.session.delete(project)
+
+                except IntegrityError as e:
+                    msg = f"Error happened when deleting project: {e}"
+                    logger.error(msg)
+                    raise
+                except Exception as e:
+                    msg = f'Error when deleting by delete_project: {e}'
+                    logger.error(msg)
+                    raise
+
+                if cache is not None and project:
+                    invalidate_cache(cache, ModelDataEnum._Project,
+                                     (project.project_name,
+                                      project.project_id))
+
+            return _delete_project()
 
         @ staticmethod
         def delete_spot(sid: int) -> None:
-            spot = Spot.query.filter_by(spot_id=sid).first()
 
-            try:
-                if spot:
-                    db.session.delete(spot)
-            except IntegrityError as e:
-                msg = f"Error! delete_spot: : {e}"
-                logger.error(msg)
-                raise
-            except Exception as e:
-                msg = f'Error delete by delete_spot: {e}'
-                logger.error(msg)
-                raise
+            @ global_cache.global_cacheall
+            def _delete_spot(cache: Optional[GlobalCache] = None):
+                spot = Spot.query.filter_by(spot_id=sid).first()
+
+                try:
+                    if spot:
+                        db.session.delete(spot)
+                except IntegrityError as e:
+                    msg = f"Error! delete_spot: : {e}"
+                    logger.error(msg)
+                    raise
+                except Exception as e:
+                    msg = f'Error delete by delete_spot: {e}'
+                    logger.error(msg)
+                    raise
+
+                if cache is not None and spot:
+                    invalidate_cache(cache, ModelDataEnum._Spot,
+                                     (spot.spot_name, spot.spot_id))
+
+            return _delete_spot()
         # END Delete
 
         @ staticmethod
         def delete_spot_record(rid: int) -> None:
-            spot_record = (SpotRecord
-                           .query
-                           .filter_by(spot_record_id=rid)
-                           .first())
-            try:
-                if spot_record:
-                    db.session.delete(spot_record)
-            except IntegrityError as e:
-                logger.error("Error! delete_spot_record: : {}".format(e))
-                raise
-            except Exception as e:
-                logger.error(
-                    'Error delete by delete_spot_record: {}'.format(e))
-                raise
+
+            @ global_cache.global_cacheall
+            def _delete_spot_record(cache: Optional[GlobalCache] = None):
+                spot_record = (SpotRecord
+                               .query
+                               .filter_by(spot_record_id=rid)
+                               .first())
+                try:
+                    if spot_record:
+                        ModelOperations._invalidate_ranges(
+                            spot_record.device, spot_record.spot_record_time)
+                        db.session.delete(spot_record)
+                except IntegrityError as e:
+                    logger.error("Error! delete_spot_record: : {}".format(e))
+                    raise
+                except Exception as e:
+                    logger.error(
+                        'Error delete by delete_spot_record: {}'.format(e))
+                    raise
+
+                if cache is not None and spot_record:
+                    key = (spot_record.spot_record_time,
+                           spot_record.device_id)
+                    invalidate_cache(cache, ModelDataEnum._SpotRecord,
+                                     (spot_record.spot_record_id, key))
+                    invalidate_cache(cache, ModelDataEnum._SpotRecordTime,
+                                     (key,))
+
+            return _delete_spot_record()
 
         @ staticmethod
         def delete_device(did: int) -> None:
-            device = Device.query.filter_by(device_id=did).first()
 
-            try:
-                if device:
-                    db.session.delete(device)
-            except IntegrityError as e:
-                logger.error("Error! delete_device: : {}".format(e))
-                raise
-            except Exception as e:
-                logger.error('Error delete by delete_device: {}'.format(e))
-                raise
+            @ global_cache.global_cacheall
+            def _delete_device(cache: Optional[GlobalCache] = None):
+                device = Device.query.filter_by(device_id=did).first()
+
+                try:
+                    if device:
+                        ModelOperations._invalidate_all_ranges(
+                            'device', device.device_id)
+                        ModelOperations._invalidate_all_ranges(
+                            'spot', device.spot_id)
+                        db.session.delete(device)
+                except IntegrityError as e:
+                    logger.error("Error! delete_device: : {}".format(e))
+                    raise
+                except Exception as e:
+                    logger.error(
+                        'Error delete by delete_device: {}'.format(e))
+                    raise
+
+                if cache is not None and device:
+                    invalidate_cache(cache, ModelDataEnum._Device,
+                                     (device.device_name, device.device_id))
+
+            return _delete_device()
 
         @ staticmethod
         def delete_outdoor_spot(oid: int) -> None:
@@ -1151,6 +1353,30 @@ class ModelOperations(ModelInterfaces):
             return device
         return _make()
 
+    @ staticmethod
+    def _make_device_row(device_data: PostData) -> Optional[Dict]:
+        """
+        column values of a device from data sources, for core sql insert.
+        Devices from data sources have no spot yet.
+        """
+        if not isinstance(device_data, PostData):
+            return None
+        device_name = device_data.get('device_name')
+        if device_name is None:
+            return None
+
+        def to_dt(val: Union[dt, str, None]) -> Optional[dt]:
+            return val if isinstance(val, dt) else str_to_datetime(val)
+
+        online = device_data.get('online')
+        return dict(
+            device_name=device_name,
+            device_type=device_data.get('device_type'),
+            online=(online if isinstance(online, bool)
+                    else json_to_bool(online)),
+            create_time=to_dt(device_data.get('create_time')),
+            modify_time=to_dt(device_data.get('modify_time')))
+
     @ staticmethod
     def _make_spot_reocrd(spot_record_data: PostData) -> Optional[SpotRecord]:
 
@@ -1181,35 +1407,7 @@ class ModelOperations(ModelInterfaces):
             # `device_name_` is prefered since it compatible with
             # the scheduler.
             device: Optional[Device]
-            if device_name_ is None:
-                # query with device id or device name
-                if isinstance(device_, Device):
-                    device = device_
-
-                # device id as str for query cache.
-                elif can_be_int(device_):
-                    if cache is not None:
-                        device = get_cache(
-                            cache,
-                            ModelDataEnum._Device,
-                            int(cast(Union[int, str], device_)))
-                    else:
-                        logger.debug('using database')
-                        device = (
-                            Device.query
-                            .filter_by(device_id=int(cast(Union[int, str],
-                                                          device_)))
-                                  .first())
-
-                else:
-                    # there must be a device for spot record.
-                    logger.error(
-                        'spot_record must have a device')
-                    return None
-            else:
-                device = (Device.query
-                          .filter_by(device_name=device_name_)
-                          .first())
+            device = ModelOperations._find_device(device_, device_name_, cache)
 
             device_id: Optional[int]
             device_id = device.device_id if device is not None else None
@@ -1238,6 +1436,73 @@ class ModelOperations(ModelInterfaces):
             return spot_record
         return _make()
 
+    @ staticmethod
+    def _invalidate_ranges(device: Optional[Device],
+                           time: Optional[dt]) -> None:
+        """
+        drop cached range query results a record of device is in, and
+        mark records of the device and its spot changed, once the
+        session commits.
+        """
+        if device is None or time is None:
+            return
+        app.range_cache.touch(db.session, 'device', device.device_id, time)
+        app.data_generations.touch(
+            db.session, ('spot_record', 'device', device.device_id))
+        if device.spot_id is not None:
+            app.range_cache.touch(db.session, 'spot', device.spot_id, time)
+            app.data_generations.touch(
+                db.session, ('spot_record', 'spot', device.spot_id))
+
+    @ staticmethod
+    def _invalidate_all_ranges(scope: str, ident: Optional[int]) -> None:
+        """
+        drop every cached range of a device or a spot once the session
+        commits, for changes that move records between spots.
+        """
+        if ident is None:
+            return
+        app.range_cache.touch(db.session, scope, ident)
+        app.data_generations.touch(db.session, ('spot_record', scope, ident))
+
+    @ staticmethod
+    def _find_device(device_: Union[Device, str, int, None],
+                     device_name_: Optional[str],
+                     cache: Optional[GlobalCache]) -> Optional[Device]:
+        """
+        device of a spot record by name, or by id if there is no name.
+
+        with cache, a device not in the table is remembered for a while
+        so records of a device not synced yet don't query it one by one.
+        Return a cache entry if the device is cached.
+        """
+        key: Union[str, int]
+        if device_name_ is not None:
+            key, column = device_name_, Device.device_name
+        elif isinstance(device_, Device):
+            return device_
+        elif can_be_int(device_):
+            key, column = int(cast(Union[int, str], device_)), Device.device_id
+        else:
+            # there must be a device for spot record.
+            logger.error('spot_record must have a device')
+            return None
+
+        if cache is not None:
+            device = get_cache(cache, ModelDataEnum._Device, key)
+            if device is not None:
+                return device
+            if get_cache(cache, ModelDataEnum._MissingDevice, key):
+                return None
+
+        logger.debug('using database')
+        device = Device.query.filter(column == key).first()
+        if device is None:
+            logger.warning('no device %s', key)
+            if cache is not None:
+                put_cache(cache, ModelDataEnum._MissingDevice, (key,), True)
+        return device
+
     @ staticmethod
     def _make_location(location_data: PostData) -> Optional[Location]:
         # location must have a climate area.
@@ -1281,6 +1546,65 @@ commit and handle error
 """
 
 
+##################################
+#  spot records added by ingest  #
+##################################
+
+# cache key -> record added by add_spot_record in the transaction.
+_ADDED_SPOT_RECORDS = 'added_spot_records'
+# (cache key, entry) of added records already flushed.
+_FLUSHED_SPOT_RECORDS = 'flushed_spot_records'
+
+
+def _added_spot_records(session: Session
+                        ) -> Dict[Tuple[dt, int], SpotRecord]:
+    return session.info.setdefault(_ADDED_SPOT_RECORDS, {})
+
+
+def _entries_of_added_spot_records(session: Session, flush_context):
+    """ ids are known once flushed, instances are expired by commit """
+    added = session.info.get(_ADDED_SPOT_RECORDS)
+    if added:
+        session.info[_FLUSHED_SPOT_RECORDS] = [
+            (key, to_entry(record)) for key, record in added.items()
+            if record.spot_record_id is not None]
+
+
+def _cache_added_spot_records(session: Session):
+    """
+    put records added by the transaction into the cache. Done on commit
+    rather than one flush for each record, and a rolled back record
+    never gets into the cache.
+    """
+    session.info.pop(_ADDED_SPOT_RECORDS, None)
+    flushed = session.info.pop(_FLUSHED_SPOT_RECORDS, None)
+    if not flushed:
+        return
+
+    @global_cache.global_cacheall
+    def _put(cache: Optional[GlobalCache] = None):
+        if cache is None:
+            return
+        put_cache_many(cache, ModelDataEnum._SpotRecord,
+                       ((k, entry)
+                        for key, entry in flushed
+                        for k in (entry.spot_record_id, key)))
+        put_cache_many(cache, ModelDataEnum._SpotRecordTime,
+                       ((key, True) for key, _ in flushed))
+    _put()
+
+
+def _forget_added_spot_records(session: Session):
+    session.info.pop(_ADDED_SPOT_RECORDS, None)
+    session.info.pop(_FLUSHED_SPOT_RECORDS, None)
+
+
+if not event.contains(db.session, 'after_commit', _cache_added_spot_records):
+    event.listen(db.session, 'after_flush', _entries_of_added_spot_records)
+    event.listen(db.session, 'after_commit', _cache_added_spot_records)
+    event.listen(db.session, 'after_rollback', _forget_added_spot_records)
+
+
 def commit():
     try:  # commit after all transaction are successed.
         db.session.commit()
@@ -1300,7 +1624,7 @@ def commit_db_operation(
     if commit failed, handle exceptions.
     """
     try:
-        res = op(post_data)
+        res = from_entry(op(post_data))
         commit()
         if isinstance(res, db.Model) and hasattr(res, 'to_json'):
             response_object['data'] = res.to_json()
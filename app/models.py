@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, Dict, Union
+from typing import List, Dict, Optional, Union
 from datetime import datetime
 import hashlib
 from enum import Enum
@@ -612,14 +612,21 @@ class Spot(db.Model):
     def __repr__(self):
         return "<Spot {}>".format(self.spot_name)
 
-    def to_json(self):
+    def to_json(self, number_of_device: Optional[int] = None):
+        """
+        number_of_device is counted if not given, pass it when
+        serializing many spots, see api.serializers.
+        """
         image_base64 = None
         if self.image:
             base64.encodebytes(self.image).decode()
 
+        if number_of_device is None:
+            number_of_device = db.session.query(
+                Device).filter_by(spot_id=self.spot_id).count()
+
         return dict(
-            number_of_device=db.session.query(
-                Device).filter_by(spot_id=self.spot_id).count(),
+            number_of_device=number_of_device,
             spot_id=self.spot_id,
             project_id=self.project_id,
             project_name=self.project.project_name,
@@ -685,6 +692,14 @@ class SpotRecord(db.Model):
     The time interval is 5 mins per record.
     """
     __tablename__ = "spot_record"
+    # keyset paging of a device walks this index, see api.cursor.
+    # a device has one record at a time, ingest inserts a record missing
+    # from its timestamp index and relies on the unique index.
+    __table_args__ = (
+        db.Index('ix_spot_record_device_time',
+                 'device_id', 'spot_record_time', 'spot_record_id'),
+        db.Index('uq_spot_record_device_time',
+                 'device_id', 'spot_record_time', unique=True))
     spot_record_id = db.Column(db.Integer, primary_key=True, nullable=False)
     spot_record_time = db.Column(db.DateTime, nullable=False)
     device_id = db.Column(db.Integer, db.ForeignKey("device.device_id"))
@@ -13,6 +13,54 @@ class Config:
     SQLALCHEMY_RECORD_QUERIES = True
     SHISANWU_RECORDS_PER_PAGE = 20
     SHISANWU_CACHE_ON = os.environ.get("SHISANWU_CACHE_ON") == "1"
+    SHISANWU_TOKEN_CACHE_DIR = os.environ.get("SHISANWU_TOKEN_CACHE_DIR") or \
+        os.path.join(basedir, ".token_cache")
+
+    # vendor responses of windows ended before MIN_AGE (seconds) are
+    # cached on disk, each data source has its own store.
+    SHISANWU_RESPONSE_CACHE_DIR = \
+        os.environ.get("SHISANWU_RESPONSE_CACHE_DIR") or \
+        os.path.join(basedir, ".response_cache")
+    SHISANWU_RESPONSE_CACHE_MAX_BYTES = int(
+        os.environ.get("SHISANWU_RESPONSE_CACHE_MAX_BYTES") or 2 * 1024 ** 3)
+    SHISANWU_RESPONSE_CACHE_MIN_AGE = int(
+        os.environ.get("SHISANWU_RESPONSE_CACHE_MIN_AGE") or 60 * 60 * 24 * 2)
+
+    # share the cache among workers on one host, e.g /dev/shm/135server.
+    # unset means each process keeps its own cache. Workers with the same
+    # token reuse the warm up, defaults to the parent (master) pid and
+    # its start time.
+    SHISANWU_SHARED_CACHE_DIR = os.environ.get("SHISANWU_SHARED_CACHE_DIR")
+    SHISANWU_SHARED_CACHE_TOKEN = os.environ.get("SHISANWU_SHARED_CACHE_TOKEN")
+    # category name -> minimum (slots, heap bytes) of the shared cache.
+    # warm up grows a category to hold twice its rows. A full category is
+    # cleared, there is no eviction by use like the process local cache.
+    SHISANWU_SHARED_CACHE_SIZES = {}
+    # byte budget of the spot record cache.
+    SHISANWU_SPOT_RECORD_CACHE_BYTES = int(
+        os.environ.get("SHISANWU_SPOT_RECORD_CACHE_BYTES") or 64 * 1024 ** 2)
+    # seconds to remember a device is not in the table.
+    SHISANWU_MISSING_DEVICE_TTL = int(
+        os.environ.get("SHISANWU_MISSING_DEVICE_TTL") or 120)
+
+    # spot record range queries are cached by day, past days are kept
+    # until evicted and the current day for TTL seconds.
+    SHISANWU_RANGE_CACHE_ON = \
+        os.environ.get("SHISANWU_RANGE_CACHE_ON", "1") == "1"
+    SHISANWU_RANGE_CACHE_TTL = int(
+        os.environ.get("SHISANWU_RANGE_CACHE_TTL") or 30)
+    SHISANWU_RANGE_CACHE_BUCKETS = int(
+        os.environ.get("SHISANWU_RANGE_CACHE_BUCKETS") or 5000)
+
+    # api responses carry etags made of data generations, other workers'
+    # writes are seen within TTL seconds.
+    SHISANWU_ETAG_ON = os.environ.get("SHISANWU_ETAG_ON", "1") == "1"
+    SHISANWU_ETAG_TTL = int(os.environ.get("SHISANWU_ETAG_TTL") or 60)
+
+    # totals of paged apis are counted once and kept up to date on
+    # commit, recounted after TTL seconds to see other workers' writes.
+    SHISANWU_ROW_COUNT_TTL = int(
+        os.environ.get("SHISANWU_ROW_COUNT_TTL") or 300)
 
     @staticmethod
     def init_app(app):
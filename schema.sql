@@ -126,4 +126,10 @@ create table if not exists spot_record(
     on update set null on delete set null
 );
 
+create index if not exists ix_spot_record_device_time
+    on spot_record(device_id, spot_record_time, spot_record_id);
+
+create unique index if not exists uq_spot_record_device_time
+    on spot_record(device_id, spot_record_time);
+
 
@@ -0,0 +1,64 @@
+import struct
+import unittest
+from array import array
+from datetime import datetime
+from app.api.binary_series import MAGIC, TYPES, encode_series
+from app.api.record_rows import COLUMNS
+
+
+def decode(data: bytes):
+    """ what a client does, see app.api.binary_series """
+    assert data[:4] == MAGIC
+    k, _, n = struct.unpack_from('<HHI', data, 4)
+    offset, names = 12, []
+    for _ in range(k):
+        typecode, length = struct.unpack_from('<cB', data, offset)
+        offset += 2
+        names.append((data[offset:offset + length].decode(),
+                      typecode.decode()))
+        offset += length
+
+    columns = {}
+    for name, typecode in names:
+        offset += -offset % 8
+        valid = data[offset:offset + (n + 7) // 8]
+        offset += len(valid)
+        offset += -offset % 8
+        values = array(typecode)
+        values.frombytes(data[offset:offset + n * values.itemsize])
+        offset += n * values.itemsize
+        columns[name] = [v if valid[i >> 3] >> (i & 7) & 1 else None
+                         for i, v in enumerate(values)]
+    return columns
+
+
+class TestBinarySeries(unittest.TestCase):
+    def test_round_trip(self):
+        rows = [(1, 2, datetime(2020, 1, 9, 12, 35), True, 21.5,
+                 None, 2000.0, 30, 12),
+                (2, 2, datetime(2020, 1, 9, 12, 40), None, None,
+                 60.0, None, None, 13)]
+        columns = decode(encode_series(rows))
+        self.assertEqual(list(columns), list(COLUMNS))
+        self.assertEqual(columns['spot_record_time'],
+                         [1578573300, 1578573600])
+        self.assertEqual(columns['temperature'], [21.5, None])
+        self.assertEqual(columns['window_opened'], [1, None])
+        self.assertEqual(columns['co2'], [12, 13])
+
+    def test_fractional_readings(self):
+        rows = [(datetime(1970, 1, 1), 30.5, 412),
+                (datetime(1970, 1, 1, 0, 5), None, 400.25)]
+        columns = decode(encode_series(rows,
+                                       ('spot_record_time', 'pm25', 'co2')))
+        self.assertEqual(columns['pm25'], [30.5, None])
+        self.assertEqual(columns['co2'], [412, 400.25])
+
+    def test_empty(self):
+        columns = decode(encode_series([]))
+        self.assertEqual(columns, {c: [] for c in TYPES})
+
+    def test_columns(self):
+        rows = [(datetime(1970, 1, 1, 0, 1), 30)]
+        columns = decode(encode_series(rows, ('spot_record_time', 'pm25')))
+        self.assertEqual(columns, {'spot_record_time': [60], 'pm25': [30]})
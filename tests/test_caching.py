@@ -0,0 +1,318 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from threading import Thread
+from app.caching.caching import VersionedCache, empty_cache
+from app.caching.caching import get_cache, put_cache, invalidate_cache
+from app.caching.caching import cache_generation, _LRUDictionary
+from app.caching.caching import get_cache_many, put_cache_many
+from app.caching.caching import _TinyLFUDictionary, cache_stats
+from app.caching.caching import _TTLDictionary, approx_size
+from app.caching.cache_instance import CacheInstance
+from app.caching.shared_cache import SharedCache, SharedCategory
+from app.caching.entries import DeviceEntry, to_entry, from_entry
+from app.caching.entries import entry_columns, SpotRecordEntry
+from app.caching.timestamp_index import LazyTimestampIndex, TimestampIndex
+from app.models import Device
+
+
+class TestVersionedCache(unittest.TestCase):
+    def test_empty_cache(self):
+        self.assertIsInstance(empty_cache(), VersionedCache)
+        self.assertEqual(empty_cache(), {})
+
+    def test_put_invalidate(self):
+        cache = empty_cache()
+        put_cache(cache, 'device', ('name', 1, None), 'device')
+        self.assertEqual(get_cache(cache, 'device', 'name'), 'device')
+        self.assertEqual(get_cache(cache, 'device', 1), 'device')
+        self.assertNotIn(None, cache['device'])
+
+        invalidate_cache(cache, 'device', ('name', 1))
+        self.assertIsNone(get_cache(cache, 'device', 'name'))
+        self.assertIsNone(get_cache(cache, 'device', 1))
+
+    def test_generation(self):
+        cache = empty_cache()
+        gen = cache_generation(cache, 'spot')
+        put_cache(cache, 'project', ('p',), 'project')
+        self.assertTrue(cache.is_fresh('spot', gen))
+
+        put_cache(cache, 'spot', ('s',), 'spot')
+        self.assertFalse(cache.is_fresh('spot', gen))
+
+        gen = cache_generation(cache, 'spot')
+        invalidate_cache(cache, 'spot', ('s',))
+        self.assertFalse(cache.is_fresh('spot', gen))
+        self.assertEqual(cache_generation({}, 'spot'), 0)
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_shared_between_handles(self):
+        # two handles on the same directory act as two workers.
+        a = SharedCache(self.dir.name, 'token')
+        b = SharedCache(self.dir.name, 'token')
+        put_cache(a, 'device', ('name', 1), {'device_id': 1})
+        self.assertEqual(get_cache(b, 'device', 'name'), {'device_id': 1})
+        self.assertEqual(cache_generation(b, 'device'), 1)
+
+        invalidate_cache(b, 'device', ('name',))
+        self.assertIsNone(get_cache(a, 'device', 'name'))
+        self.assertEqual(get_cache(a, 'device', 1), {'device_id': 1})
+        self.assertFalse(a.is_fresh('device', 1))
+        a.close()
+        b.close()
+
+    def test_full_category_cleared(self):
+        category = SharedCategory(
+            os.path.join(self.dir.name, 'small'), 8, 1024)
+        with self.assertLogs(level='WARNING'):
+            for i in range(20):
+                category[i] = i
+        self.assertEqual(category.get(19), 19)
+        self.assertIsNone(category.get(0))
+        self.assertLess(len(category), 8)
+        category.close()
+
+    def test_sized_at_warm_up(self):
+        cache = SharedCache(self.dir.name, 'token', {'small': (8, 1024)})
+        cache['small'] = {i: i for i in range(100)}
+        self.assertEqual(len(cache['small']), 100)
+        slots, heap = cache['small'].size
+        self.assertGreaterEqual(slots * 0.7, 200)
+
+        # another worker attaches with the size made at warm up.
+        other = SharedCache(self.dir.name, 'token', {'small': (8, 1024)})
+        self.assertEqual(other['small'].size, (slots, heap))
+        self.assertEqual(other['small'].get(99), 99)
+        cache.close()
+        other.close()
+
+    def test_warm_token(self):
+        cache = SharedCache(self.dir.name, 'token')
+        self.assertFalse(cache.is_warm())
+        with cache.warm_up_lock():
+            cache.mark_warm()
+        self.assertTrue(cache.is_warm())
+        self.assertFalse(SharedCache(self.dir.name, 'restarted').is_warm())
+
+
+class TestCacheInstance(unittest.TestCase):
+    def test_lazy_cacheall(self):
+        instance = CacheInstance()
+
+        @instance.global_cacheall
+        def f(cache=None):
+            return cache
+
+        # not ready, go to database.
+        self.assertIsNone(f())
+        self.assertFalse(instance.wait_ready(0))
+
+        def cacheall(g):
+            def _cacheall(*args, **kwargs):
+                return g(instance.global_cache, *args, **kwargs)
+            return _cacheall
+
+        instance.global_cacheall = cacheall
+        self.assertIsNone(f())
+        instance._ready.set()
+        self.assertIs(f(), instance.global_cache)
+
+    def test_then_after_warm_up(self):
+        instance = CacheInstance()
+        calls = []
+        instance._load = lambda app: calls.append('load')
+        instance._warm_up(None, lambda: calls.append('then'))
+        self.assertEqual(calls, ['load', 'then'])
+
+        def fail(app):
+            raise RuntimeError('warm up')
+
+        instance._load = fail
+        with self.assertRaises(RuntimeError):
+            instance._warm_up(None, lambda: calls.append('then'))
+        self.assertEqual(calls, ['load', 'then', 'then'])
+
+
+class TestLRUDictionary(unittest.TestCase):
+    def test_eviction(self):
+        lru = _LRUDictionary(maxsize=4, stripes=1)
+        for i in range(4):
+            lru[i] = i
+        lru[0]  # 1 is the oldest now.
+        lru[4] = 4
+        self.assertNotIn(1, lru)
+        self.assertEqual(sorted(lru), [0, 2, 3, 4])
+
+    def test_batch(self):
+        lru = _LRUDictionary(maxsize=100)
+        lru.put_many((i, str(i)) for i in range(10))
+        self.assertEqual(lru.get_many([1, 2, 42]), {1: '1', 2: '2'})
+        cache = {'record': lru}
+        put_cache_many(cache, 'record', [(11, '11')])
+        self.assertEqual(get_cache_many(cache, 'record', [11, 12]),
+                         {11: '11'})
+
+    def test_concurrent(self):
+        lru = _LRUDictionary(maxsize=1000)
+
+        def work(n):
+            for i in range(2000):
+                lru[(n, i)] = i
+                lru.get((n, i - 1))
+                lru.pop((n, i - 2), None)
+
+        threads = [Thread(target=work, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLessEqual(len(lru), 1000)
+
+
+class TestTinyLFUDictionary(unittest.TestCase):
+    def test_scan_resistant(self):
+        lfu = _TinyLFUDictionary(maxsize=10, stripes=1)
+        for i in range(10):
+            lfu[i] = i
+            for _ in range(5):
+                lfu.get(i)  # hot keys.
+
+        # a scan of one-off keys, looked up once then put.
+        for i in range(100, 130):
+            if lfu.get(i) is None:
+                lfu[i] = i
+        self.assertEqual(sorted(lfu), list(range(10)))
+        self.assertEqual(lfu.stats()['rejected'], 30)
+
+    def test_byte_budget(self):
+        lfu = _TinyLFUDictionary(maxsize=100, max_bytes=100, stripes=1,
+                                 sizeof=lambda v: len(v))
+        lfu['a'] = 'x' * 60
+        lfu.get('b')
+        lfu['b'] = 'x' * 60  # seen more often than 'a'.
+        self.assertEqual(list(lfu), ['b'])
+        self.assertEqual(lfu.bytes, 60)
+        lfu['c'] = 'x' * 200  # never fits.
+        self.assertNotIn('c', lfu)
+        del lfu['b']
+        self.assertEqual(lfu.bytes, 0)
+
+    def test_entry_budget(self):
+        entry = SpotRecordEntry(100000, datetime(2020, 1, 1), 100001)
+        size = (sys.getsizeof(entry) + sys.getsizeof(100000)
+                + sys.getsizeof(datetime(2020, 1, 1))
+                + sys.getsizeof(100001))
+        self.assertEqual(approx_size(entry), size)
+
+        lfu = _TinyLFUDictionary(maxsize=100, max_bytes=3 * size,
+                                 stripes=1)
+        for i in range(4):
+            lfu[i] = SpotRecordEntry(100000 + i, datetime(2020, 1, 1),
+                                     100001)
+        self.assertEqual(len(lfu), 3)
+        self.assertEqual(lfu.bytes, 3 * size)
+
+    def test_stats(self):
+        lfu = _TinyLFUDictionary(maxsize=10)
+        lfu[1] = 1
+        lfu.get(1)
+        lfu.get(2)
+        stats = cache_stats({'record': lfu, 'device': {}})
+        self.assertEqual(list(stats), ['record'])
+        self.assertEqual(stats['record']['hits'], 1)
+        self.assertEqual(stats['record']['misses'], 1)
+
+
+class TestEntries(unittest.TestCase):
+    def test_to_entry(self):
+        device = Device(device_id=1, device_name='d', spot_id=2, online=True)
+        entry = to_entry(device)
+        self.assertEqual(entry, DeviceEntry(1, 'd', 2, True))
+        self.assertIs(to_entry(entry), entry)
+        self.assertIs(from_entry(device), device)
+        self.assertIsNone(to_entry(None))
+
+    def test_entry_columns(self):
+        self.assertEqual([c.key for c in entry_columns(DeviceEntry)],
+                         list(DeviceEntry._fields))
+
+
+class TestTimestampIndex(unittest.TestCase):
+    def test_index(self):
+        t = datetime(2020, 1, 1)
+        index = TimestampIndex([(t, 1), (t, 1), (t + timedelta(1), 1)])
+        self.assertEqual(len(index), 2)
+        self.assertIn((t, 1), index)
+        self.assertNotIn((t, 2), index)
+        self.assertNotIn((t + timedelta(minutes=5), 1), index)
+
+        index.add((t + timedelta(minutes=5), 1))  # out of order.
+        index.add((t + timedelta(2), 1))
+        self.assertIn((t + timedelta(minutes=5), 1), index)
+        self.assertEqual(len(index), 4)
+
+        self.assertTrue(index.pop((t, 1)))
+        self.assertIsNone(index.pop((t, 1)))
+        self.assertEqual(len(index), 3)
+
+    def test_cache_category(self):
+        t = datetime(2020, 1, 1)
+        cache = {'time': TimestampIndex()}
+        put_cache(cache, 'time', ((t, 1),), True)
+        self.assertTrue(get_cache(cache, 'time', (t, 1)))
+        invalidate_cache(cache, 'time', ((t, 1),))
+        self.assertIsNone(get_cache(cache, 'time', (t, 1)))
+
+
+class TestLazyTimestampIndex(unittest.TestCase):
+    def test_load_on_demand(self):
+        t = datetime(2020, 1, 1)
+        table = {1: [t, t + timedelta(minutes=5)], 2: [t]}
+        loaded = []
+
+        def load(device_id):
+            loaded.append(device_id)
+            return table.get(device_id, [])
+
+        index = LazyTimestampIndex(load, max_size=2)
+        self.assertEqual(loaded, [])
+        self.assertIn((t, 1), index)
+        self.assertNotIn((t + timedelta(1), 1), index)
+        self.assertEqual(loaded, [1])
+
+        index.add((t, 3))  # not loaded, it will be read from the table.
+        self.assertEqual(len(index), 2)
+
+        self.assertIn((t, 2), index)  # device 1 is dropped.
+        self.assertEqual(len(index), 1)
+        self.assertIn((t, 1), index)
+        self.assertEqual(loaded, [1, 2, 1])
+
+
+class TestTTLDictionary(unittest.TestCase):
+    def test_expire(self):
+        ttl = _TTLDictionary(ttl=0.05, maxsize=2)
+        ttl['a'] = True
+        self.assertTrue(ttl.get('a'))
+        time.sleep(0.06)
+        self.assertIsNone(ttl.get('a'))
+
+    def test_maxsize(self):
+        ttl = _TTLDictionary(ttl=60, maxsize=2)
+        for k in 'abc':
+            ttl[k] = True
+        self.assertEqual(len(ttl), 2)
+        self.assertNotIn('a', ttl)
+        self.assertTrue(ttl.pop('c'))
+        self.assertNotIn('c', ttl)
@@ -0,0 +1,33 @@
+import gzip
+import unittest
+import zlib
+from app.api.compression import gzip_body, gzip_stream
+
+
+class TestGzipStream(unittest.TestCase):
+    def test_round_trip(self):
+        chunks = [b'{"i": %d}\n' % i * 50 for i in range(20)]
+        self.assertEqual(gzip.decompress(b''.join(gzip_stream(chunks))),
+                         b''.join(chunks))
+
+    def test_chunks_decodable_as_they_come(self):
+        chunks = [b'first\n' * 100, b'second\n' * 100]
+        stream = gzip_stream(iter(chunks))
+        z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(z.decompress(next(stream)), chunks[0])
+
+    def test_empty(self):
+        self.assertEqual(gzip.decompress(b''.join(gzip_stream([]))), b'')
+
+
+class TestGzipBody(unittest.TestCase):
+    def test_reuse_by_content(self):
+        body = b'{"data": [1, 2, 3]}' * 100
+        first = gzip_body(body, reuse=True)
+        self.assertIs(gzip_body(body, reuse=True), first)
+        self.assertEqual(gzip.decompress(first), body)
+
+        # same etag window, different data.
+        changed = body.replace(b'3', b'4')
+        self.assertEqual(gzip.decompress(gzip_body(changed, reuse=True)),
+                         changed)
@@ -0,0 +1,20 @@
+import unittest
+from datetime import datetime
+from app.api.cursor import encode_cursor, decode_cursor, is_page_size
+
+
+class TestCursor(unittest.TestCase):
+    def test_round_trip(self):
+        key = (datetime(2020, 1, 9, 12, 35), 4321)
+        self.assertEqual(decode_cursor(encode_cursor(key)), key)
+
+    def test_bad_cursor(self):
+        truncated = encode_cursor((datetime.now(), 1))[:-3]
+        for bad in ('', 'not a cursor', truncated):
+            with self.assertRaises(ValueError):
+                decode_cursor(bad)
+
+    def test_page_size(self):
+        self.assertTrue(is_page_size(20))
+        for bad in (None, 0, -1, '20', 2.5, True):
+            self.assertFalse(is_page_size(bad))
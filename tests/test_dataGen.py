@@ -1,6 +1,7 @@
 import unittest
 import app.dataGetter.dataGen as DG
 import app.dataGetter.dataGen.jianyanyuanData as jianyanyuanData
+import app.dataGetter.dataGen.xiaomiData as xiaomiData
 from app import create_app, db
 from app.modelOperations import commit
 from app.dataGetter.apis import jianyanyuanGetter
@@ -136,3 +137,27 @@ class TestdataGenJianYanYuanDataState(unittest.TestCase):
 @unittest.skip('skip')
 class TestdataGen_XiaomiData(unittest.TestCase):
     pass
+
+
+class TestdataGen_XiaomiDataStatic(unittest.TestCase):
+    def test_merge_latest_resource(self):
+        data = [
+            {'did': 'lumi.158d0001fd5c50', 'attr': 'humidity_value',
+             'value': '8354', 'timeStamp': 1591393050203},
+            {'did': 'lumi.158d0001fd5c50', 'attr': 'temperature_value',
+             'value': '2739', 'timeStamp': 1591393090203},
+            {'did': 'lumi.158d0001fd5c51', 'attr': 'magnet_status',
+             'value': '1', 'timeStamp': 1591393050203}]
+
+        merged = {r['did']: r for r in xiaomiData.merge_latest_resource(data)}
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged['lumi.158d0001fd5c50'],
+                         {'did': 'lumi.158d0001fd5c50',
+                          'time_stamp': 1591393090203,
+                          'humidity_value': '8354',
+                          'temperature_value': '2739'})
+
+        sr = xiaomiData.MakeDict.make_spot_record(
+            merged['lumi.158d0001fd5c51'], None)
+        self.assertTrue(sr['window_opened'])
+
@@ -0,0 +1,29 @@
+import unittest
+from types import SimpleNamespace
+from app.caching.generations import DataGenerations
+
+
+class TestDataGenerations(unittest.TestCase):
+    def setUp(self):
+        self.generations = DataGenerations(ttl=0)
+        self.session = SimpleNamespace(info={})
+
+    def test_bumped_on_commit(self):
+        before = self.generations.etag(['device'])
+        self.generations.touch(self.session, 'device')
+        self.assertEqual(self.generations.etag(['device']), before)
+
+        self.generations._after_commit(self.session)
+        self.assertNotEqual(self.generations.etag(['device']), before)
+
+    def test_dropped_on_rollback(self):
+        before = self.generations.etag(['device'])
+        self.generations.touch(self.session, 'device')
+        self.generations._after_rollback(self.session)
+        self.generations._after_commit(self.session)
+        self.assertEqual(self.generations.etag(['device']), before)
+
+    def test_extra(self):
+        self.assertNotEqual(
+            self.generations.etag(['device'], 'application/json'),
+            self.generations.etag(['device'], 'application/x-ndjson'))
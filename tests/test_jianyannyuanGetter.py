@@ -88,6 +88,17 @@ class JianyanyuanGetterTest(unittest.TestCase):
         data = j.get_data_points(jauth, self.token, params)
         self.assertTrue(data[0]['as']['4'] == 46.0)
 
+
+class KnownAttrIdsTest(unittest.TestCase):
+    def test_known_attr_ids(self):
+        attrs = [{'id': 4, 'name': 'humidity'},
+                 {'id': 3, 'name': 'temperature'},
+                 {'id': 5, 'name': 'unknown'},
+                 {'id': 155, 'name': 'ac_power'}]
+        self.assertEqual(j.known_attr_ids(attrs), ['3', '4', '155'])
+        self.assertEqual(j.known_attr_ids(None), [])
+        self.assertEqual(j.known_attr_ids([{'name': 'no id'}]), [])
+
 #   d = {'gid': 'uarlid',
 #      'did': '20205754003878404097',
 #      'aid': "3,4",
@@ -4,7 +4,9 @@ import db_init
 from app import db, create_app
 from app import modelOperations as mops
 from app import models as m
+from app.caching.entries import SpotRecordKey, from_entry
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 
 
 class TestModelOperation(unittest.TestCase):
@@ -141,3 +143,75 @@ class TestModelOperation(unittest.TestCase):
             spot_record_time=datetime(2019, 9, 24, 12, 30)).first()
 
         self.assertTrue(query_res.window_opened and query_res.humidity == 89)
+
+    def test_spot_record_key(self):
+        self._location()
+        self._project()
+        self._spot()
+        self._device()
+        self._spot_record()
+        mops.commit()
+
+        key = SpotRecordKey(datetime(2019, 9, 24, 12, 30),
+                            m.Device.query.first().device_id)
+        self.assertEqual(from_entry(key).humidity, 89)
+
+        # a device has one record at a time.
+        db.session.add(m.SpotRecord(**key._asdict()))
+        with self.assertRaises(IntegrityError):
+            db.session.flush()
+
+    def test_sync_device_batch(self):
+        self._location()
+        self._project()
+        self._spot()
+        self._device()
+        mops.commit()
+
+        vendor = [
+            {"device_name": "lumi.158d0001fd5c50",
+             "device_type": "lumi.sensor_ht.v1",
+             "online": 1,
+             "create_time": datetime(2019, 4, 20),
+             "modify_time": None},
+            {"device_name": "20205754003878404097",
+             "device_type": "indoor",
+             "online": 0,
+             "create_time": "2019-07-23T09:39:39",
+             "modify_time": "2019-12-22T10:11:44"}]
+
+        res = mops.ModelOperations.BatchAdd.sync_device_batch(
+            vendor, lambda name: name != "Device")
+        self.assertEqual(sorted(res['inserted']),
+                         sorted(d["device_name"] for d in vendor))
+        self.assertEqual(res['deactivated'], [])
+        self.assertEqual(m.Device.query.count(), 3)
+
+        # second sync only touches changed devices, hand made device
+        # is never deactivated.
+        vendor[0]["online"] = 0
+        res = mops.ModelOperations.BatchAdd.sync_device_batch(
+            vendor[:1], lambda name: name != "Device")
+        self.assertEqual(res['inserted'], [])
+        self.assertEqual(res['updated'], ["lumi.158d0001fd5c50"])
+        self.assertEqual(res['deactivated'], [])
+        self.assertFalse(m.Device.query.filter_by(
+            device_name="lumi.158d0001fd5c50").first().online)
+        self.assertTrue(m.Device.query.filter_by(
+            device_name="Device").first().online)
+
+    def test_find_device_negative_cache(self):
+        from app.caching.caching import _TTLDictionary
+        from app.caching.global_cache import ModelDataEnum
+        self._location()
+        self._project()
+        self._spot()
+        self._device()
+        mops.commit()
+
+        cache = {ModelDataEnum._MissingDevice: _TTLDictionary(ttl=60)}
+        find = mops.ModelOperations._find_device
+        self.assertIsNone(find(None, "Unknown", cache))
+        self.assertIn("Unknown", cache[ModelDataEnum._MissingDevice])
+        self.assertEqual(find(None, "Device", cache).device_name, "Device")
+        self.assertIsNone(find(None, None, cache))
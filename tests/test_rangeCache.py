@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime as dt
+from datetime import timedelta
+from types import SimpleNamespace
+from app.caching.range_cache import RangeCache
+
+
+class TestRangeCache(unittest.TestCase):
+    def setUp(self):
+        self.now = dt(2020, 6, 10, 12)
+        self.loaded = []
+        # one record each 6 hours.
+        self.times = [dt(2020, 6, 1) + timedelta(hours=6 * i)
+                      for i in range(4 * 10)]
+
+    def loader(self, start, end):
+        self.loaded.append(start)
+        return [(t, {'time': t}) for t in self.times if start <= t < end]
+
+    def test_assembled_from_buckets(self):
+        cache = RangeCache(ttl=60)
+        start, end = dt(2020, 6, 2, 6), dt(2020, 6, 4)
+        rows = cache.rows('spot', 1, start, end, self.loader,
+                          include_end=False, now=self.now)
+        self.assertEqual([r['time'] for r in rows],
+                         [t for t in self.times if start <= t < end])
+        self.assertEqual(self.loaded, [dt(2020, 6, 2), dt(2020, 6, 3)])
+
+        # overlapping range only loads the new bucket.
+        cache.rows('spot', 1, dt(2020, 6, 3), dt(2020, 6, 4, 12),
+                   self.loader, now=self.now)
+        self.assertEqual(self.loaded[2:], [dt(2020, 6, 4)])
+
+    def test_current_bucket_expires(self):
+        cache = RangeCache(ttl=0)
+        for _ in range(2):
+            cache.rows('device', 1, dt(2020, 6, 10), dt(2020, 6, 10, 6),
+                       self.loader, now=self.now)
+        self.assertEqual(len(self.loaded), 2)
+
+    def test_invalidate(self):
+        cache = RangeCache()
+        day = dt(2020, 6, 2)
+        cache.rows('device', 1, day, day, self.loader, now=self.now)
+        cache.invalidate('device', 1, day + timedelta(hours=3))
+        cache.rows('device', 1, day, day, self.loader, now=self.now)
+        self.assertEqual(self.loaded, [day, day])
+
+    def test_invalidate_on_commit(self):
+        cache = RangeCache()
+        day = dt(2020, 6, 2)
+        session = SimpleNamespace(info={})
+        cache.rows('device', 1, day, day, self.loader, now=self.now)
+        cache.touch(session, 'device', 1, day)
+        cache.rows('device', 1, day, day, self.loader, now=self.now)
+        self.assertEqual(self.loaded, [day])
+
+        cache._after_commit(session)
+        cache.rows('device', 1, day, day, self.loader, now=self.now)
+        self.assertEqual(self.loaded, [day, day])
+
+        cache.touch(session, 'device', 1, day)
+        cache._after_rollback(session)
+        cache._after_commit(session)
+        cache.rows('device', 1, day, day, self.loader, now=self.now)
+        self.assertEqual(self.loaded, [day, day])
+
+    def test_device_moved(self):
+        cache = RangeCache()
+        session = SimpleNamespace(info={})
+        spot_of = {'device': 1}
+
+        def loader(spot):
+            def load(start, end):
+                return (self.loader(start, end)
+                        if spot_of['device'] == spot else [])
+            return load
+
+        start, end = dt(2020, 6, 1), dt(2020, 6, 3)
+        self.assertEqual(
+            len(cache.rows('spot', 1, start, end, loader(1), now=self.now)),
+            9)
+        cache.rows('spot', 2, start, end, loader(2), now=self.now)
+
+        # records of the past days now belong to spot 2.
+        spot_of['device'] = 2
+        cache.touch(session, 'spot', 1)
+        cache.touch(session, 'spot', 2)
+        cache._after_commit(session)
+        self.assertEqual(
+            cache.rows('spot', 1, start, end, loader(1), now=self.now), [])
+        self.assertEqual(
+            len(cache.rows('spot', 2, start, end, loader(2), now=self.now)),
+            9)
+
+    def test_invalidated_while_loading(self):
+        cache = RangeCache()
+        day = dt(2020, 6, 2)
+
+        def loader(start, end):
+            # a commit lands while the bucket is queried.
+            cache.invalidate('device', 1, start)
+            return self.loader(start, end)
+
+        cache.rows('device', 1, day, day, loader, now=self.now)
+        cache.rows('device', 1, day, day, self.loader, now=self.now)
+        self.assertEqual(self.loaded, [day, day])
+
+    def test_disabled(self):
+        cache = RangeCache()
+        cache.enabled = False
+        rows = cache.rows('device', 1, dt(2020, 6, 1), dt(2020, 6, 5),
+                          self.loader, now=self.now)
+        self.assertEqual(len(self.loaded), 1)
+        self.assertEqual(rows[-1]['time'], dt(2020, 6, 5))
@@ -0,0 +1,55 @@
+import unittest
+from datetime import datetime, timedelta
+from app.api.record_rows import COLUMNS, format_times, project
+from app.api.record_rows import to_columns, to_dicts
+from app.models import SpotRecord, TIMEFORMAT
+
+
+class TestRecordRows(unittest.TestCase):
+    def test_format_times(self):
+        start = datetime(2019, 12, 31, 22, 0)
+        times = [start + i * timedelta(minutes=5) for i in range(60)]
+        times.insert(3, None)
+        self.assertEqual(format_times(times),
+                         [t.strftime(TIMEFORMAT) if t else None
+                          for t in times])
+
+    def test_same_as_to_json(self):
+        record = SpotRecord(spot_record_id=1,
+                            device_id=2,
+                            spot_record_time=datetime(2020, 1, 9, 12, 35),
+                            window_opened=True,
+                            temperature=21.5,
+                            humidity=60.0,
+                            ac_power=None,
+                            pm25=30,
+                            co2=12)
+        row = tuple(getattr(record, c) for c in COLUMNS)
+        self.assertEqual(to_dicts([row]), [record.to_json()])
+
+    def test_to_columns(self):
+        rows = [(i, 1, datetime(2020, 1, 1, 0, i), None, float(i),
+                 None, None, None, None) for i in range(3)]
+        columns = to_columns(to_dicts(rows))
+        self.assertEqual(columns['temperature'], [0.0, 1.0, 2.0])
+        self.assertEqual(columns['spot_record_time'],
+                         ['2020-01-01T00:00', '2020-01-01T00:01',
+                          '2020-01-01T00:02'])
+
+    def test_subset(self):
+        columns = ('temperature', 'spot_record_time')
+        rows = [(21.5, datetime(2020, 1, 1, 0, 5))]
+        records = to_dicts(rows, columns)
+        self.assertEqual(records, [{'temperature': 21.5,
+                                    'spot_record_time': '2020-01-01T00:05'}])
+        self.assertEqual(to_columns(records, columns),
+                         {'temperature': [21.5],
+                          'spot_record_time': ['2020-01-01T00:05']})
+
+    def test_project(self):
+        rows = [(1, 2, datetime(2020, 1, 1), None, 20.0,
+                 None, None, None, None)]
+        records = to_dicts(rows)
+        self.assertIs(project(records, COLUMNS), records)
+        self.assertEqual(project(records, ('device_id',)),
+                         [{'device_id': 2}])
@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+from datetime import datetime as dt
+from datetime import timedelta
+from app.dataGetter.apis.responseCache import ResponseCache, make_key
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.now = dt(2020, 6, 1)
+        self.past = self.now - timedelta(days=3)
+        self.calls = []
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _getter(self, i):
+        def get():
+            self.calls.append(i)
+            return [{'value': str(i) * 100}]
+        return get
+
+    def test_key_normalized(self):
+        self.assertEqual(make_key('e', {'attrs': ['b', 'a'], 'x': None}),
+                         make_key('e', {'attrs': ['a', 'b']}))
+
+    def test_only_past_window_cached(self):
+        cache = ResponseCache(self.dir.name, 1 << 20, timedelta(days=1))
+        cache.fetch('e', {'i': 1}, self.past, self.now, self._getter(1))
+        cache.fetch('e', {'i': 1}, self.past, self.now, self._getter(1))
+        cache.fetch('e', {'i': 2}, self.now, self.now, self._getter(2))
+        cache.fetch('e', {'i': 2}, self.now, self.now, self._getter(2))
+        self.assertEqual(self.calls, [1, 2, 2])
+
+    def test_error_not_cached(self):
+        cache = ResponseCache(self.dir.name, 1 << 20, timedelta(days=1))
+
+        def error():
+            self.calls.append('error')
+            return {'message': 'busy'}
+
+        def ok(r):
+            return r.get('data') is not None
+
+        for _ in range(2):
+            cache.fetch('e', {'i': 1}, self.past, self.now, error, ok)
+        self.assertEqual(self.calls, ['error', 'error'])
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(self.dir.name, 1 << 20, timedelta(days=1))
+        cache.fetch('e', {'i': 0}, self.past, self.now, self._getter(0))
+        entry_size = cache.size
+
+        cache = ResponseCache(self.dir.name, entry_size * 2,
+                              timedelta(days=1))
+        cache.fetch('e', {'i': 1}, self.past, self.now, self._getter(1))
+        cache.get('e', {'i': 0})  # 1 is the oldest now.
+        cache.fetch('e', {'i': 2}, self.past, self.now, self._getter(2))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('e', {'i': 1}))
+        self.assertIsNotNone(cache.get('e', {'i': 0}))
+
+        # index survives restart.
+        reopened = ResponseCache(self.dir.name, entry_size * 2,
+                                 timedelta(days=1))
+        self.assertEqual(len(reopened), 2)
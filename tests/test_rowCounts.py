@@ -0,0 +1,94 @@
+import unittest
+from types import SimpleNamespace
+from app.caching.row_counts import RowCounts
+
+
+def row(table, **columns):
+    model = type(table, (), {'__table__': SimpleNamespace(name=table)})
+    r = model()
+    r.__dict__.update(columns)
+    return r
+
+
+class TestRowCounts(unittest.TestCase):
+    def setUp(self):
+        self.counts = RowCounts(groups={'device': ('spot_id',)})
+        self.queries = 0
+
+    def session(self, new=(), deleted=()):
+        return SimpleNamespace(info={}, new=list(new),
+                               deleted=list(deleted), dirty=[])
+
+    def count(self, n):
+        def _count():
+            self.queries += 1
+            return n
+        return _count
+
+    def commit(self, session):
+        self.counts._after_flush(session, None)
+        self.counts._after_commit(session)
+
+    def test_counted_once(self):
+        self.assertEqual(self.counts.get(('device',), self.count(3)), 3)
+        self.assertEqual(self.counts.get(('device',), self.count(9)), 3)
+        self.assertEqual(self.queries, 1)
+
+    def test_incremental(self):
+        self.counts.get(('device',), self.count(3))
+        self.counts.get(('device', 'spot_id', 1), self.count(2))
+        self.commit(self.session(new=[row('device', spot_id=1),
+                                      row('device', spot_id=2)],
+                                 deleted=[row('spot', project_id=1)]))
+        self.assertEqual(self.counts.peek(('device',)), 5)
+        self.assertEqual(self.counts.peek(('device', 'spot_id', 1)), 3)
+        # not known, stays unknown.
+        self.assertIsNone(self.counts.peek(('device', 'spot_id', 2)))
+
+    def test_rollback(self):
+        self.counts.get(('device',), self.count(3))
+        session = self.session(new=[row('device', spot_id=1)])
+        self.counts._after_flush(session, None)
+        self.counts._after_rollback(session)
+        self.counts._after_commit(session)
+        self.assertEqual(self.counts.peek(('device',)), 3)
+
+    def test_drop(self):
+        self.counts.get(('device',), self.count(3))
+        self.counts.get(('device', 'spot_id', 1), self.count(2))
+        session = self.session(new=[row('device', spot_id=1)])
+        self.counts.drop(session, 'device')
+        self.commit(session)
+        self.assertIsNone(self.counts.peek(('device',)))
+        self.assertIsNone(self.counts.peek(('device', 'spot_id', 1)))
+
+    def test_commit_while_counting(self):
+        self.counts.get(('device',), self.count(3))
+        key = ('device', 'spot_id', 1)
+
+        def count():
+            # the row may or may not be counted, don't keep the count.
+            self.commit(self.session(new=[row('device', spot_id=1)]))
+            return 3
+
+        self.assertEqual(self.counts.get(key, count), 3)
+        self.assertIsNone(self.counts.peek(key))
+        self.assertEqual(self.counts.get(key, self.count(3)), 3)
+        self.assertEqual(self.counts.peek(key), 3)
+
+    def test_drop_while_counting(self):
+        key = ('device', 'spot_id', 1)
+
+        def count():
+            session = self.session()
+            self.counts.drop(session, 'device')
+            self.commit(session)
+            return 2
+
+        self.counts.get(key, count)
+        self.assertIsNone(self.counts.peek(key))
+
+    def test_expire(self):
+        self.counts.ttl = 0
+        self.counts.get(('device',), self.count(3))
+        self.assertIsNone(self.counts.peek(('device',)))
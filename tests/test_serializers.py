@@ -0,0 +1,70 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app import models as m
+from app.api.serializers import planned, to_json_many
+from .fake_db import gen_fake
+
+
+class TestSerializers(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        gen_fake()
+        db.session.expire_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_queries(self, fn):
+        statements = []
+
+        def before(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before)
+        return result, len(statements)
+
+    def test_same_json(self):
+        for model in (m.Project, m.Spot, m.Device):
+            expected = [item.to_json() for item in model.query]
+            db.session.expire_all()
+            self.assertEqual(to_json_many(planned(model)), expected)
+
+    def test_constant_queries(self):
+        for model in (m.Project, m.Spot, m.Device):
+            _, small = self.count_queries(
+                lambda: to_json_many(planned(model).limit(2)))
+            db.session.expire_all()
+            _, large = self.count_queries(
+                lambda: to_json_many(planned(model).limit(20)))
+            db.session.expire_all()
+            self.assertEqual(small, large)
+
+    def test_fields(self):
+        for model, fields in ((m.Project, ['project_id', 'started_time']),
+                              (m.Spot, ['spot_name', 'number_of_device']),
+                              (m.Device, ['device_id', 'create_time'])):
+            expected = [{f: item.to_json()[f] for f in fields}
+                        for item in model.query]
+            db.session.expire_all()
+            self.assertEqual(
+                to_json_many(planned(model, fields=fields), fields),
+                expected)
+
+    def test_unknown_fields(self):
+        expected = [p.to_json() for p in m.Project.query]
+        db.session.expire_all()
+        fields = ['no_such_key']
+        self.assertEqual(
+            to_json_many(planned(m.Project, fields=fields), fields),
+            expected)
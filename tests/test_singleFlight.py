@@ -0,0 +1,45 @@
+import time
+import unittest
+from threading import Event, Thread
+from app.api.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_coalesce(self):
+        flight = SingleFlight()
+        release = Event()
+        calls = []
+        results = []
+
+        def query():
+            calls.append(1)
+            release.wait()
+            return 'result'
+
+        def request():
+            results.append(flight.do('key', query))
+
+        threads = [Thread(target=request) for _ in range(5)]
+        for t in threads:
+            t.start()
+        while not calls:
+            time.sleep(0.01)
+        time.sleep(0.05)  # let the others join the call.
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results),
+                         [('result', False)] + [('result', True)] * 4)
+        self.assertEqual(len(flight), 0)
+
+    def test_error_shared(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('bad')
+        with self.assertRaises(ValueError):
+            flight.do('key', fail)
+        # nothing left behind.
+        self.assertEqual(flight.do('key', lambda: 1), (1, False))
@@ -0,0 +1,29 @@
+import json
+import unittest
+from app.api.streaming import json_array_lines, ndjson_lines
+
+
+class TestNdjson(unittest.TestCase):
+    def test_lines(self):
+        rows = [{'i': i} for i in range(10)]
+        chunks = list(ndjson_lines(iter(rows), chunk_bytes=30))
+        self.assertGreater(len(chunks), 1)
+        lines = ''.join(chunks).splitlines()
+        self.assertEqual([json.loads(l) for l in lines], rows)
+
+    def test_empty(self):
+        self.assertEqual(list(ndjson_lines(iter([]))), [])
+
+
+class TestJsonArray(unittest.TestCase):
+    def test_envelope(self):
+        envelope = {'status': 0, 'message': 'm [] ,'}
+        rows = [{'i': i} for i in range(10)]
+        chunks = list(json_array_lines(envelope, iter(rows), chunk_bytes=30))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(''.join(chunks)),
+                         dict(envelope, data=rows))
+
+    def test_empty(self):
+        doc = ''.join(json_array_lines({'status': 0}, iter([])))
+        self.assertEqual(json.loads(doc), {'status': 0, 'data': []})
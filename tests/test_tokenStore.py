@@ -0,0 +1,44 @@
+import os
+import tempfile
+import time
+import unittest
+from app.dataGetter.dataGen.tokenStore import TokenStore
+
+
+class TestTokenStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'xiaomi.token')
+        self.token = {
+            'access_token': 'access',
+            'refresh_token': 'refresh',
+            'openId': 'open',
+            'state': 'state',
+            'token_type': 'bearer',
+            'expires_in': 7200
+        }
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_save_load(self):
+        store = TokenStore(self.path, 'secret')
+        self.assertIsNone(store.load())
+        store.save(self.token)
+        loaded = store.load()
+        self.assertEqual(loaded['access_token'], 'access')
+        self.assertEqual(loaded['refresh_token'], 'refresh')
+        self.assertTrue(7100 < TokenStore.remaining(loaded) <= 7200)
+
+    def test_encrypted(self):
+        store = TokenStore(self.path, 'secret')
+        store.save(self.token)
+        with open(self.path, 'rb') as f:
+            self.assertNotIn(b'refresh', f.read())
+        # wrong secret can't read the token.
+        self.assertIsNone(TokenStore(self.path, 'other').load())
+
+    def test_remaining(self):
+        expired = dict(**self.token, obtained_at=time.time() - 8000)
+        self.assertEqual(TokenStore.remaining(expired), 0)
+        self.assertEqual(TokenStore.remaining(None), 0)